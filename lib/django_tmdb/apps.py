@@ -1,7 +1,22 @@
 from __future__ import unicode_literals
 
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.signals import request_finished
+
+import tmdb3
 
 
 class TmdbConfig(AppConfig):
-    name = 'tmdb'
+    name = 'django_tmdb'
+
+    def ready(self):
+        # importing the engine registers it with tmdb3
+        from . import cache
+
+        # share tmdb3's cache through the Django cache named by TMDB_CACHE,
+        # or keep tmdb3's own cache file if it is not set
+        alias = getattr(settings, 'TMDB_CACHE', None)
+        if alias:
+            tmdb3.set_cache('django', alias)
+            request_finished.connect(cache.flush)
@@ -0,0 +1,182 @@
+from django.core.cache import caches
+
+from tmdb3.cache_engine import CacheEngine, CacheObject
+import tmdb3.request
+
+import contextlib
+import threading
+import hashlib
+import time
+import uuid
+
+
+class DjangoEngine(CacheEngine):
+    """
+    tmdb3 cache engine storing records through Django's cache framework,
+    so that every process using the same cache backend shares them.
+
+    Records are kept by the backend for their lifetime, plus the time
+    tmdb3 retains expired data to serve while TMDb is unavailable.
+    Writes are batched into a single set_many() call, which is made
+    when `batchsize` records are pending, when the lock on a key is
+    released, and at the end of each Django request.
+
+    Backends cannot find records by tag, so each tag is given a version,
+    which is stored with the records carrying it. Invalidating a tag
+    replaces its version, and records holding an older one are ignored.
+
+    Removals by other processes are only found by looking each record up
+    again, so records held in tmdb3's in-memory tier are checked against
+    the backend after `l1ttl` seconds, unless it is configured with a ttl
+    of its own.
+    """
+    name = 'django'
+
+    def __init__(self, parent):
+        super(DjangoEngine, self).__init__(parent)
+        self._lock = threading.RLock()
+        self.configure()
+
+    def configure(self, alias='default', prefix='tmdb3', batchsize=16,
+                  locktimeout=30, l1ttl=60):
+        self.alias = alias
+        self.prefix = prefix
+        self.batchsize = batchsize
+        self.locktimeout = locktimeout
+        self.l1ttl = l1ttl
+        self._pending = {}
+
+    @property
+    def backend(self):
+        return caches[self.alias]
+
+    def _key(self, key):
+        # backends such as memcached limit the length and characters of keys
+        return '{0}:{1}'.format(self.prefix,
+                                hashlib.sha1(key.encode('utf-8')).hexdigest())
+
+    def _tagkey(self, tag):
+        return self._key('tag:' + tag)
+
+    def _versions(self, tags):
+        if not tags:
+            return {}
+        found = self.backend.get_many([self._tagkey(tag) for tag in tags])
+        return dict((tag, found.get(self._tagkey(tag))) for tag in tags)
+
+    def _load_many(self, records):
+        # drop records written before one of their tags was invalidated,
+        # where records from before tags were stored carry none
+        records = [(record[:5], record[5] if len(record) > 5 else {})
+                   for record in records if record is not None]
+        versions = self._versions(set(tag for fields, tagged in records
+                                          for tag in tagged))
+        return [CacheObject(*fields) for fields, tagged in records
+                if all(versions[tag] == version
+                       for tag, version in tagged.items())]
+
+    def get(self, date):
+        # records cannot be listed, and are instead read by lookup()
+        return []
+
+    def changed(self):
+        return False
+
+    def lookup(self, key):
+        with self._lock:
+            if key in self._pending:
+                return self._pending[key]
+        objs = self._load_many([self.backend.get(self._key(key))])
+        return objs[0] if objs else None
+
+    def lookup_many(self, keys):
+        with self._lock:
+            objs = [self._pending[key] for key in keys
+                                       if key in self._pending]
+        found = self.backend.get_many([self._key(key) for key in keys
+                                       if key not in self._pending])
+        objs.extend(self._load_many(found.values()))
+        return objs
+
+    def put(self, key, value, lifetime, meta=None):
+        obj = CacheObject(key, value, lifetime, meta=meta)
+        with self._lock:
+            self._stats.incr('puts')
+            self._pending[key] = obj
+            if len(self._pending) >= self.batchsize:
+                self.flush()
+        return [obj]
+
+    def _retain(self):
+        # retention of the parent cache, or none once it has been dropped
+        parent = self.parent()
+        if parent is None:
+            return 0
+        return parent.retain
+
+    def flush(self):
+        """Write all pending records to the backend."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        retain = self._retain()
+        versions = self._versions(set(tag for obj in pending.values()
+                                          for tag in obj.tags))
+        # set_many() takes a single timeout, so group records sharing one
+        batches = {}
+        for obj in pending.values():
+            timeout = int(obj.lifetime + retain)
+            batches.setdefault(timeout, {})[self._key(obj.key)] = \
+                    (obj.key, obj.data, obj.lifetime, obj.creation, obj.meta,
+                     dict((tag, versions[tag]) for tag in obj.tags))
+        for timeout, records in batches.items():
+            self.backend.set_many(records, timeout)
+
+    @contextlib.contextmanager
+    def lock(self, key):
+        """
+        Hold a lock for the given key, shared with every process using the
+        same backend, through an atomic add(). If the lock cannot be taken
+        within `locktimeout` seconds, the holder is assumed to have died,
+        and the caller proceeds without it.
+        """
+        lockkey = self._key(key) + ':lock'
+        token = uuid.uuid4().hex
+        start = time.time()
+        deadline = start + self.locktimeout
+        locked = False
+        while time.time() < deadline:
+            locked = self.backend.add(lockkey, token, self.locktimeout)
+            if locked:
+                break
+            time.sleep(0.05)
+        self._stats.incr('lockwait', time.time() - start)
+        try:
+            yield
+        finally:
+            if key in self._pending:
+                # make the result visible before releasing any waiters
+                self.flush()
+            if locked and (self.backend.get(lockkey) == token):
+                self.backend.delete(lockkey)
+
+    def expire(self, key):
+        with self._lock:
+            self._pending.pop(key, None)
+        self.backend.delete(self._key(key))
+
+    def invalidate(self, tag):
+        with self._lock:
+            for key, obj in list(self._pending.items()):
+                if tag in obj.tags:
+                    del self._pending[key]
+        self.backend.set(self._tagkey(tag), uuid.uuid4().hex, None)
+
+
+def flush(**_signal):
+    """
+    Write out pending records, at the end of a Django request. Receives
+    the arguments of the signal, which are not needed.
+    """
+    engine = tmdb3.request.cache.engine
+    if isinstance(engine, DjangoEngine):
+        engine.flush()
@@ -0,0 +1,95 @@
+"""Base test case running tmdb3 requests through the replay transport."""
+from django.test import SimpleTestCase
+from tmdb3 import request
+import tmdb3
+import struct
+import time
+import json
+
+
+def write_old_cache(filename, records):
+    """
+    Write a cache file as the first releases did, in version 2 of the file
+    format, holding (key, data, lifetime) records as plain JSON text.
+    """
+    now = time.time()
+    slot = struct.Struct('dII')
+    position = 4 + slot.size*len(records)
+    slots = []
+    blocks = []
+    for i, (key, data, lifetime) in enumerate(records):
+        block = json.dumps([key, data]).encode('utf-8')
+        slots.append(slot.pack(now - len(records) + i, lifetime, position))
+        blocks.append(block)
+        position += len(block)
+    with open(filename, 'wb') as fd:
+        fd.write(struct.pack('HH', 2, len(records)))
+        fd.write(b''.join(slots + blocks))
+
+
+class ReplayTestCase(SimpleTestCase):
+    """
+    Runs tmdb3 requests against responses given with tape(), with a fresh
+    memory cache and statistics, and without rate limiting, retries, or
+    serving stale data.
+    The module state of tmdb3 is restored afterwards.
+    """
+    _globals = ('transport', 'limiter', 'retry', 'breaker', 'ttls')
+
+    def setUp(self):
+        self._saved = dict((name, getattr(request, name))
+                           for name in self._globals)
+        self._saved_key = request.Request._api_key
+        self._saved_timeout = request.Request.timeout
+        self._saved_engine = request.cache._engine
+        self._saved_migrate = request.cache.migrate
+        tmdb3.set_key('0123456789abcdef0123456789abcdef')
+        tmdb3.set_transport('replay', None)
+        tmdb3.set_cache('memory')
+        tmdb3.set_cache_l1()
+        tmdb3.set_cache_grace()
+        tmdb3.set_ratelimit(capacity=1000, period=1, filename=None)
+        tmdb3.set_retry(retries=0)
+        tmdb3.set_circuit_breaker()
+        tmdb3.reset_stats()
+        self.clear_cache()
+
+    def tearDown(self):
+        for name, value in self._saved.items():
+            setattr(request, name, value)
+        request.Request._api_key = self._saved_key
+        request.Request.timeout = self._saved_timeout
+        request.cache._engine = self._saved_engine
+        request.cache.migrate = self._saved_migrate
+        self.clear_cache()
+
+    def clear_cache(self):
+        # drop everything held in memory by the module cache
+        cache = request.cache
+        with cache._lock:
+            cache._data.clear()
+            cache._promoted.clear()
+            cache._heap = []
+            cache._age = 0
+
+    def tape(self, path, data, status=200, headers={}, method='GET',
+             body=None, **kwargs):
+        """
+        Record a response for a request of the API path, with the given
+        arguments. Responses recorded several times for one request are
+        played back in turn.
+        """
+        url = request.Request(path, **kwargs).get_full_url()
+        match = request.transport._match(method, url, body)
+        request.transport._tapes.setdefault(match, []).append(
+                {'request': match,
+                 'status': status,
+                 'reason': 'OK' if status < 400 else 'Error',
+                 'headers': [['Content-Type', 'application/json']] +
+                            [[k, v] for k, v in headers.items()],
+                 'body': json.dumps(data)})
+        return match
+
+    def played(self, match):
+        """Return the number of times a recorded response was played."""
+        return request.transport._played.get(match, 0)
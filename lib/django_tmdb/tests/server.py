@@ -0,0 +1,64 @@
+"""Local HTTP server for exercising tmdb3's transports without network."""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import json
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        self.server.log.append((self.command, self.path, body))
+        response = self.server.responses.get(
+                self.path.split('?')[0], (200, {}, {'path': self.path}))
+        if response is None:
+            # hang up once the request is taken, without replying
+            self.close_connection = True
+            return
+        status, headers, data = response
+        data = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+        if self.server.drop:
+            # close the connection without announcing it, as a server
+            # timing out an idle keep-alive connection would
+            self.close_connection = True
+
+    do_GET = do_POST = do_DELETE = _reply
+
+
+class Server(ThreadingHTTPServer):
+    """
+    Server answering every request with JSON, from `responses` by path,
+    as (status, headers, data), or echoing the path. A response of None
+    closes the connection without replying. Requests are logged as
+    (method, path, body).
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super(Server, self).__init__(('127.0.0.1', 0), Handler)
+        self.log = []
+        self.responses = {}
+        self.drop = False
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:{0}/'.format(self.server_address[1])
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -10,6 +10,7 @@ def get_env_setting(setting, default):
 
 TMDB_API_KEY=get_env_setting('TMDB_API_KEY', '626b3a716f2469415c3d5b26433d445c')
 TMDB_SESSION_ID=get_env_setting('TMDB_SESSION_ID', '')
+TMDB_CACHE='default'
 
 DEBUG = True
 SITE_ID = 1
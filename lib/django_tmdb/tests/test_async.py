@@ -0,0 +1,70 @@
+from tmdb3 import async_http
+from tmdb3.pager import PagedRequest
+from tmdb3.request import AsyncRequest, Request
+from django.test import SimpleTestCase
+from .base import ReplayTestCase
+from .server import Server
+import asyncio
+import json
+
+
+class AsyncHTTPTests(SimpleTestCase):
+
+    def setUp(self):
+        self.server = Server()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_get(self):
+        resp = asyncio.run(async_http.urlopen('GET',
+                                              self.server.url + 'movie/1'))
+        self.assertEqual(resp.status, 200)
+        self.assertEqual(json.loads(resp.read().decode('utf-8')),
+                         {'path': '/movie/1'})
+
+    def test_post_body_sent(self):
+        self.server.responses['/movie/1/rating'] = (201, {}, {'ok': True})
+        resp = asyncio.run(async_http.urlopen('POST',
+                                self.server.url + 'movie/1/rating',
+                                b'value=8.5',
+                                {'Content-Type':
+                                    'application/x-www-form-urlencoded'}))
+        self.assertEqual(resp.status, 201)
+        self.assertEqual(self.server.log,
+                         [('POST', '/movie/1/rating', b'value=8.5')])
+
+
+class AsyncRequestTests(ReplayTestCase):
+
+    def test_readJSON_cached(self):
+        match = self.tape('movie/550', {'id': 550, 'title': 'Fight Club'})
+
+        async def read():
+            first = await AsyncRequest('movie/550').readJSON()
+            second = await AsyncRequest('movie/550').readJSON()
+            return first, second
+
+        first, second = asyncio.run(read())
+        self.assertEqual(first['title'], 'Fight Club')
+        self.assertEqual(second, first)
+        self.assertEqual(self.played(match), 1)
+        # shared with synchronous requests
+        self.assertEqual(Request('movie/550').readJSON(), first)
+        self.assertEqual(self.played(match), 1)
+
+    def test_async_iteration(self):
+        for page in (1, 2):
+            self.tape('search/movie', {'total_results': 3,
+                                       'results': [{'id': page*10 + i}
+                                           for i in range(2 if page == 1
+                                                          else 1)]},
+                      query='club', page=page)
+        results = PagedRequest(Request('search/movie', query='club'),
+                               handler=lambda item: item['id'])
+        results._pagesize = 2
+
+        async def collect():
+            return [item async for item in results]
+
+        self.assertEqual(asyncio.run(collect()), [10, 11, 20])
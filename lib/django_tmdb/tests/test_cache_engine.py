@@ -0,0 +1,172 @@
+from django.test import TestCase
+from django.core.cache import caches
+from django.apps import apps
+from django.conf import settings
+from django.core.signals import request_finished
+from tmdb3.cache import Cache
+from .. import cache
+import threading
+import tmdb3
+import time
+
+
+class DjangoCacheEngineTests(TestCase):
+
+    def setUp(self):
+        caches['default'].clear()
+        self.cache = Cache('django', 'default')
+
+    def test_engine_registered(self):
+        self.assertIsInstance(tmdb3.request.cache._engine, cache.DjangoEngine)
+
+    def test_engine_opt_in(self):
+        engine = tmdb3.request.cache._engine
+        try:
+            tmdb3.set_cache('memory')
+            with self.settings():
+                del settings.TMDB_CACHE
+                apps.get_app_config('django_tmdb').ready()
+            self.assertNotIsInstance(tmdb3.request.cache._engine,
+                                     cache.DjangoEngine)
+        finally:
+            tmdb3.request.cache._engine = engine
+
+    def test_flushed_at_request_end(self):
+        engine = tmdb3.request.cache.engine
+        engine.put('movie/1', {'id': 1}, 60)
+        request_finished.send(sender=self.__class__)
+        self.assertEqual(len(engine._pending), 0)
+        self.assertEqual(caches['default'].get(engine._key('movie/1'))[1],
+                         {'id': 1})
+
+    def test_flush_without_parent(self):
+        engine = Cache('django', 'default').engine
+        engine.put('movie/1', {'id': 1}, 60)
+        # the cache is gone, and with it the time records are retained
+        engine.flush()
+        self.assertEqual(caches['default'].get(engine._key('movie/1'))[1],
+                         {'id': 1})
+
+    def test_put_and_get(self):
+        self.cache.put('movie/1', {'title': 'Gremlins'}, 60)
+        self.assertEqual(self.cache.get('movie/1'), {'title': 'Gremlins'})
+
+    def test_shared_between_caches(self):
+        self.cache.put('movie/1', {'title': 'Gremlins'}, 60)
+        self.cache._engine.flush()
+
+        other = Cache('django', 'default')
+        self.assertEqual(other.get('movie/1'), {'title': 'Gremlins'})
+        self.assertEqual(other.get('movie/2'), None)
+
+    def test_writes_batched(self):
+        engine = self.cache._engine
+        engine.batchsize = 3
+        self.cache.put('movie/1', {'id': 1}, 60)
+        self.cache.put('movie/2', {'id': 2}, 60)
+        self.assertEqual(len(engine._pending), 2)
+        self.assertEqual(caches['default'].get(engine._key('movie/1')), None)
+
+        self.cache.put('movie/3', {'id': 3}, 60)
+        self.assertEqual(len(engine._pending), 0)
+        self.assertEqual(caches['default'].get(engine._key('movie/1'))[1],
+                         {'id': 1})
+
+    def test_prefetch(self):
+        for i in range(3):
+            self.cache.put('movie/{0}'.format(i), {'id': i}, 60)
+        self.cache._engine.flush()
+
+        other = Cache('django', 'default')
+        self.assertEqual(other.prefetch(['movie/0', 'movie/2', 'movie/5']),
+                         set(['movie/0', 'movie/2']))
+
+    def test_fetch_flushes_on_unlock(self):
+        data = self.cache.fetch('movie/1', lambda: {'id': 1}, 60)
+        self.assertEqual(data, {'id': 1})
+        self.assertEqual(len(self.cache._engine._pending), 0)
+
+    def test_expire(self):
+        self.cache.put('movie/1', {'id': 1}, 60)
+        self.cache._engine.flush()
+        self.cache._engine.expire('movie/1')
+
+        other = Cache('django', 'default')
+        self.assertEqual(other.get('movie/1'), None)
+
+    def test_promoted_from_engine(self):
+        self.cache.configure_l1(maxentries=2)
+        for i in range(3):
+            self.cache.put('movie/{0}'.format(i), {'id': i}, 60)
+        self.cache._engine.flush()
+        self.assertEqual(list(self.cache._data), ['movie/1', 'movie/2'])
+
+        self.assertEqual(self.cache.get('movie/0'), {'id': 0})
+        self.assertEqual(list(self.cache._data), ['movie/2', 'movie/0'])
+        self.assertEqual(self.cache.stats()['promotions'], 1)
+
+    def test_stale_while_revalidate(self):
+        self.cache.configure_grace(60)
+        self.cache.put('movie/1', {'id': 1}, 0)
+        refreshed = threading.Event()
+
+        def refresh():
+            self.cache.put('movie/1', {'id': 2}, 60)
+            refreshed.set()
+
+        self.assertEqual(self.cache.get('movie/1', refresh=refresh), {'id': 1})
+        self.assertTrue(refreshed.wait(5))
+        self.assertEqual(self.cache.get('movie/1', refresh=refresh), {'id': 2})
+        stats = self.cache.stats()
+        self.assertEqual((stats['stale'], stats['refreshes']), (1, 1))
+
+    def test_stats(self):
+        self.cache.put('movie/1', {'id': 1}, 60)
+        self.cache.get('movie/1')
+        self.cache.get('movie/2')
+        with self.cache._engine.lock('movie/1'):
+            pass
+
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['puts']),
+                         (1, 1, 1))
+        self.assertEqual(stats['get']['count'], 2)
+        self.assertEqual(stats['engine']['puts'], 1)
+
+        self.cache.reset_stats()
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['get']['count'],
+                          stats['engine']['puts']), (0, 0, 0))
+
+    def test_invalidate(self):
+        for key, tag in (('movie/1', 'movie:1'), ('movie/1/images', 'movie:1'),
+                         ('movie/2', 'movie:2')):
+            self.cache.put(key, {'key': key}, 60, {'tags': [tag]})
+        self.cache._engine.flush()
+
+        self.cache.invalidate('movie:1')
+        other = Cache('django', 'default')
+        self.assertEqual(self.cache.get('movie/1'), None)
+        self.assertEqual(other.get('movie/1/images'), None)
+        self.assertEqual(other.get('movie/2'), {'key': 'movie/2'})
+
+        self.cache.put('movie/1', {'key': 'movie/1'}, 60, {'tags': ['movie:1']})
+        self.cache._engine.flush()
+        self.assertEqual(Cache('django', 'default').get('movie/1'),
+                         {'key': 'movie/1'})
+
+    def test_removal_reaches_other_caches(self):
+        other = Cache('django', 'default', l1ttl=0.1)
+        self.cache.put('movie/1', {'id': 1}, 60, {'tags': ['movie:1']})
+        self.cache.put('movie/2', {'id': 2}, 60)
+        self.cache._engine.flush()
+        self.assertEqual(other.get('movie/1'), {'id': 1})
+        self.assertEqual(other.get('movie/2'), {'id': 2})
+
+        self.cache.invalidate('movie:1')
+        self.cache.expire('movie/2')
+        # held in the other cache's L1 until checked against the backend
+        time.sleep(0.15)
+        self.assertEqual(other.get('movie/1'), None)
+        self.assertEqual(other.get('movie/2'), None)
+        self.assertEqual(Cache('django', 'default').engine.l1ttl, 60)
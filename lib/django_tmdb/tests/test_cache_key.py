@@ -0,0 +1,69 @@
+from tmdb3.request import Request, cache_key, migrate_key
+from tmdb3.cache import Cache
+from tmdb3 import request
+from .base import ReplayTestCase, write_old_cache
+import tempfile
+import shutil
+import os
+
+
+class CacheKeyTests(ReplayTestCase):
+
+    def test_canonical(self):
+        self.assertEqual(cache_key('/movie/550/', {'language': 'en',
+                                                   'api_key': 'secret',
+                                                   'append_to_response':
+                                                        'casts'}),
+                         'tmdb3:v1:movie/550?append_to_response=casts'
+                         '&language=en')
+
+    def test_argument_order(self):
+        self.assertEqual(cache_key('search/movie', {'query': 'a', 'page': 2}),
+                         cache_key('search/movie', {'page': 2, 'query': 'a'}))
+
+    def test_session_hashed(self):
+        key = cache_key('account', {'session_id': 'secret'})
+        self.assertNotIn('secret', key)
+        self.assertNotEqual(key, cache_key('account', {'session_id': 'other'}))
+
+    def test_independent_of_api_key(self):
+        key = Request('movie/550').cachekey()
+        request.Request._api_key = 'fedcba9876543210fedcba9876543210'
+        self.assertEqual(Request('movie/550').cachekey(), key)
+
+    def test_migrate(self):
+        old = Request('movie/550', language='en').get_full_url()
+        self.assertEqual(migrate_key(old),
+                         Request('movie/550', language='en').cachekey())
+        self.assertEqual(migrate_key('tmdb3:v1:movie/550'),
+                         'tmdb3:v1:movie/550')
+
+
+class MigratedRecordTests(ReplayTestCase):
+
+    def setUp(self):
+        super(MigratedRecordTests, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        super(MigratedRecordTests, self).tearDown()
+
+    def test_old_records_found(self):
+        write_old_cache(self.filename,
+                        [(Request('movie/550').get_full_url(), {'id': 550},
+                          60),
+                         (Request('movie/551').get_full_url(), {'id': 551},
+                          60)])
+        cache = Cache('file', self.filename)
+        cache.migrate = migrate_key
+        self.assertEqual(cache.get(Request('movie/550').cachekey()),
+                         {'id': 550})
+
+        # and still found once the file is rewritten
+        cache.put(Request('movie/552').cachekey(), {'id': 552}, 60)
+        cache = Cache('file', self.filename)
+        cache.migrate = migrate_key
+        self.assertEqual(cache.get(Request('movie/551').cachekey()),
+                         {'id': 551})
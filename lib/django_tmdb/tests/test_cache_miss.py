@@ -0,0 +1,56 @@
+from django.test import SimpleTestCase
+from tmdb3.cache import Cache
+from mock import patch
+import tempfile
+import shutil
+import os
+
+
+class CacheMissTests(SimpleTestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _misses(self, cache, other):
+        # count the engine reads made by misses, before and after another
+        # cache writes to the same storage
+        cache.put('a', 'a', 60)
+        self.assertEqual(cache.get('a'), 'a')
+        with patch.object(cache._engine, 'get',
+                          wraps=cache._engine.get) as get:
+            for i in range(3):
+                self.assertIsNone(cache.get('b'))
+            self.assertEqual(get.call_count, 0)
+            other.put('b', 'b', 60)
+            self.assertEqual(cache.get('b'), 'b')
+            self.assertEqual(get.call_count, 1)
+        self.assertEqual(cache.stats()['misses'], 3)
+
+    def test_file_engine(self):
+        self._misses(Cache('file', self.filename),
+                     Cache('file', self.filename))
+
+    def test_sqlite_engine(self):
+        filename = self.filename + '.db'
+        self._misses(Cache('sqlite', filename, batchsize=1),
+                     Cache('sqlite', filename, batchsize=1))
+
+    def test_missing_file(self):
+        cache = Cache('file', self.filename)
+        self.assertIsNone(cache.get('a'))
+        Cache('file', self.filename).put('a', 'a', 60)
+        self.assertEqual(cache.get('a'), 'a')
+
+    def test_own_writes_not_reread(self):
+        cache = Cache('memory')
+        self.assertIsNone(cache.get('a'))
+        cache.put('a', 'a', 60)
+        self.assertFalse(cache._engine.changed())
+        with patch.object(cache._engine, 'get',
+                          wraps=cache._engine.get) as get:
+            self.assertIsNone(cache.get('b'))
+        self.assertEqual(get.call_count, 0)
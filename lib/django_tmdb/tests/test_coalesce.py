@@ -0,0 +1,51 @@
+from tmdb3.request import Request
+from .base import ReplayTestCase
+import tmdb3
+import asyncio
+
+MERGED = 'alternative_titles,casts,images,keywords,releases,trailers,' \
+         'translations'
+
+
+class CoalesceTests(ReplayTestCase):
+
+    movie = {'id': 550, 'title': 'Fight Club',
+             'casts': {'cast': [{'id': 819, 'name': 'Edward Norton',
+                                 'order': 0}],
+                       'crew': []},
+             'keywords': {'keywords': [{'id': 825, 'name': 'support group'}]}}
+
+    def test_pollers_merged(self):
+        match = self.tape('movie/550', self.movie, append_to_response=MERGED)
+        movie = tmdb3.Movie(550)
+        self.assertEqual(movie.title, 'Fight Club')
+        self.assertEqual([c.name for c in movie.cast], ['Edward Norton'])
+        self.assertEqual([k.name for k in movie.keywords], ['support group'])
+        self.assertEqual(movie.translations, [])
+        self.assertEqual(self.played(match), 1)
+
+    def test_cached_resource_left_out(self):
+        self.tape('movie/550/keywords', self.movie['keywords'])
+        Request('movie/550/keywords').readJSON()
+        match = self.tape('movie/550', self.movie,
+                          append_to_response=MERGED.replace('keywords,', ''))
+        movie = tmdb3.Movie(550)
+        self.assertEqual(movie.title, 'Fight Club')
+        self.assertEqual([k.name for k in movie.keywords], ['support group'])
+        self.assertEqual(self.played(match), 1)
+
+    def test_populate_merged(self):
+        match = self.tape('movie/550', self.movie, append_to_response=MERGED)
+        movie = asyncio.run(tmdb3.Movie(550).populate())
+        self.assertEqual(movie.title, 'Fight Club')
+        self.assertEqual([c.name for c in movie.cast], ['Edward Norton'])
+        self.assertEqual(self.played(match), 1)
+
+    def test_disabled(self):
+        main = self.tape('movie/550', {'id': 550, 'title': 'Fight Club'})
+        casts = self.tape('movie/550/casts', self.movie['casts'])
+        movie = tmdb3.Movie(550)
+        movie._coalesce = False
+        self.assertEqual(movie.title, 'Fight Club')
+        self.assertEqual([c.name for c in movie.cast], ['Edward Norton'])
+        self.assertEqual((self.played(main), self.played(casts)), (1, 1))
@@ -0,0 +1,119 @@
+from django.test import SimpleTestCase
+from tmdb3.cache_codec import Codec, decode, compressors
+from tmdb3 import cache_codec
+from tmdb3.tmdb_exceptions import TMDBCacheError
+from tmdb3.cache import Cache
+from .base import write_old_cache
+from mock import patch
+from unittest import skipIf
+import tempfile
+import marshal
+import sqlite3
+import shutil
+import os
+
+
+RECORD = ['movie/550', {'title': 'Fight Club', 'cast': ['x'*20]*50},
+          {'tags': ['movie:550']}]
+
+
+class CodecTests(SimpleTestCase):
+
+    def test_round_trip(self):
+        for compressor in compressors:
+            encoded = Codec('json', compressor).dumps(RECORD)
+            self.assertEqual(decode(encoded), RECORD)
+
+    def test_compressed(self):
+        plain = Codec('json').dumps(RECORD)
+        self.assertLess(len(Codec('json', 'zlib').dumps(RECORD)), len(plain))
+        # small records are left as they are
+        self.assertEqual(Codec('json', 'zlib').dumps([1]),
+                         Codec('json').dumps([1]))
+
+    def test_plain_json(self):
+        self.assertEqual(decode(b'["movie/550", {"id": 550}]'),
+                         ['movie/550', {'id': 550}])
+        self.assertEqual(decode('["movie/550", {"id": 550}]'),
+                         ['movie/550', {'id': 550}])
+
+    def test_marshal_not_read(self):
+        with self.assertRaises(TMDBCacheError):
+            Codec('marshal')
+        with self.assertRaises(TMDBCacheError):
+            decode(bytes([0xA0]) + marshal.dumps(RECORD))
+
+    @skipIf(cache_codec.msgpack is None, 'msgpack is not installed')
+    def test_msgpack(self):
+        for compressor in compressors:
+            encoded = Codec('msgpack', compressor).dumps(RECORD)
+            self.assertEqual(encoded[0] & 0x70, 0x30)
+            self.assertEqual(decode(encoded), RECORD)
+        self.assertLess(len(Codec('msgpack').dumps(RECORD)),
+                        len(Codec('json').dumps(RECORD)))
+
+    @skipIf(cache_codec.msgpack is not None, 'msgpack is installed')
+    def test_msgpack_missing(self):
+        with self.assertRaises(TMDBCacheError):
+            Codec('msgpack')
+        with self.assertRaises(TMDBCacheError):
+            decode(bytes([0xB0, 0x90]))
+
+    def test_invalid(self):
+        with self.assertRaises(TMDBCacheError):
+            Codec('json', 'bz2')
+
+
+class StoredCodecTests(SimpleTestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_file_engine(self):
+        for compression in compressors:
+            cache = Cache('file', self.filename, compression=compression)
+            cache.put(RECORD[0], RECORD[1], 60)
+            self.assertEqual(Cache('file', self.filename).get(RECORD[0]),
+                             RECORD[1])
+            os.unlink(self.filename)
+
+    def test_old_records(self):
+        write_old_cache(self.filename, [('movie/550', {'id': 550}, 60),
+                                        ('movie/551', {'id': 551}, 60)])
+        cache = Cache('file', self.filename, compression='zlib')
+        self.assertEqual(cache.get('movie/550'), {'id': 550})
+        # rewritten in the current format on the first write
+        cache.put('movie/552', RECORD[1], 60)
+        cache = Cache('file', self.filename)
+        self.assertEqual([cache.get('movie/55{0}'.format(i))
+                          for i in range(3)],
+                         [{'id': 550}, {'id': 551}, RECORD[1]])
+
+    def test_marshal_records_ignored(self):
+        for engine in ('file', 'log'):
+            filename = '{0}.{1}'.format(self.filename, engine)
+            with patch.dict(cache_codec.serializers,
+                            {'marshal': (2, marshal.dumps, marshal.loads)}):
+                Cache(engine, filename, codec='marshal').put('a', 'a', 60)
+            cache = Cache(engine, filename)
+            self.assertIsNone(cache.get('a'))
+            cache.put('b', 'b', 60)
+            self.assertEqual(Cache(engine, filename).get('b'), 'b')
+
+    def test_sqlite_engine(self):
+        filename = self.filename + '.db'
+        cache = Cache('sqlite', filename, batchsize=1, compression='zlib')
+        cache.put(RECORD[0], RECORD[1], 60)
+        cache.put('marshal', 'x', 60)
+        conn = sqlite3.connect(filename)
+        conn.execute("UPDATE cache SET data = ? WHERE key = 'marshal'",
+                     (bytes([0xA0]) + marshal.dumps('x'),))
+        conn.commit()
+        conn.close()
+        cache = Cache('sqlite', filename)
+        self.assertEqual(cache.get(RECORD[0]), RECORD[1])
+        self.assertIsNone(cache.get('marshal'))
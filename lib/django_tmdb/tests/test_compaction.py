@@ -0,0 +1,80 @@
+from django.test import SimpleTestCase
+from tmdb3.cache import Cache
+from tmdb3.cache_file import _Compactor
+import threading
+import tempfile
+import shutil
+import os
+
+
+class CompactionTests(SimpleTestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _overwrite(self, cache, puts, keys=300):
+        # steady overwrites of the same keys, noting the largest file seen
+        peak = 0
+        for i in range(puts):
+            cache.put('k{0}'.format(i % keys), 'x'*200 + str(i), 3600)
+            peak = max(peak, os.path.getsize(self.filename))
+        return peak
+
+    def test_bounded_under_overwrites(self):
+        for step in (1, 4, 64):
+            cache = Cache('file', self.filename, compactratio=0.1,
+                          compactstep=step)
+            peak = self._overwrite(cache, 3000)
+            engine = cache._engine
+            stats = cache.stats()['engine']
+            self.assertGreater(stats['reclaimed'], 0, step)
+            self.assertLess(peak, 4*engine.live, step)
+            self.assertLess(engine._garbage(), 2*engine.live, step)
+            self.assertEqual([cache.get('k{0}'.format(i))
+                              for i in range(300)],
+                             ['x'*200 + str(2700+i) for i in range(300)])
+            os.remove(self.filename)
+
+    def test_pass_resumed(self):
+        cache = Cache('file', self.filename, compactratio=None)
+        self._overwrite(cache, 600)
+        engine = cache._engine
+        engine.compactstep = 4
+        self.assertEqual(engine.compact(1), 0)
+        cursor = engine.cursor
+        self.assertIsNotNone(cursor)
+        engine.compact(1)
+        self.assertGreater(engine.cursor, cursor)
+
+    def test_compact_whole_file(self):
+        cache = Cache('file', self.filename, compactratio=None,
+                      compactstep=4)
+        self._overwrite(cache, 600)
+        engine = cache._engine
+        engine.compact(2)
+        # records replaced behind the cursor of a pass taken up part way
+        self._overwrite(cache, 100)
+        self.assertGreater(engine.compact(), 0)
+        self.assertEqual(engine._garbage(), 0)
+        self.assertIsNone(engine.cursor)
+
+    def test_sharded(self):
+        cache = Cache('sharded', self.filename, shards=3, compactratio=None,
+                      compactinterval=3600)
+        engine = cache._engine
+        # one thread for every shard
+        self.assertEqual([thread.engine() for thread in threading.enumerate()
+                          if isinstance(thread, _Compactor)
+                             and thread.engine() in [engine] + engine.shards],
+                         [engine])
+        for i in range(600):
+            cache.put('k{0}'.format(i % 100), 'x'*200 + str(i), 3600)
+        self.assertGreater(engine.compact(), 0)
+        self.assertEqual([shard._garbage() for shard in engine.shards],
+                         [0]*3)
+        self.assertEqual(cache.get('k0'), 'x'*200 + '500')
+        engine.configure(None)
@@ -0,0 +1,113 @@
+from django.test import SimpleTestCase
+from tmdb3.cache import Cache
+import multiprocessing
+import tempfile
+import random
+import shutil
+import os
+
+
+def _mixed(args):
+    # gets, with a put for each miss, from another process
+    filename, seed = args
+    cache = Cache('file', filename, maxcount=100)
+    cache.configure_l1(maxentries=10)
+    rand = random.Random(seed)
+    for i in range(1000):
+        key = 'k{0}'.format(rand.randrange(300))
+        value = cache.get(key)
+        if value is None:
+            cache.put(key, key*200, 3600)
+        elif value != key*200:
+            return False
+    return True
+
+
+class EvictionTests(SimpleTestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _held(self, keys):
+        cache = Cache('file', self.filename)
+        return [i for i in keys if cache.get('k{0}'.format(i)) == i]
+
+    def _table(self, cache):
+        # creation times in the slot table, as read from the file
+        engine = cache._engine
+        engine._read(0)
+        return [row[0] for row in engine.table if row[0]]
+
+    def _hot(self, eviction):
+        # ten records read often, before more are written than fit
+        cache = Cache('file', self.filename, maxcount=100,
+                      eviction=eviction)
+        cache.configure_l1(maxentries=1000)
+        for i in range(100):
+            cache.put('k{0}'.format(i), i, 3600)
+        for j in range(3):
+            for i in range(10):
+                cache.get('k{0}'.format(i))
+        return cache
+
+    def test_lru(self):
+        cache = self._hot('lru')
+        for i in range(100, 200):
+            cache.put('k{0}'.format(i), i, 3600)
+            if not i % 5:
+                for j in range(10):
+                    cache.get('k{0}'.format(j))
+        self.assertEqual(self._held(range(10)), list(range(10)))
+        self.assertLessEqual(len(self._held(range(200))), 100)
+        self.assertIn(199, self._held(range(100, 200)))
+
+    def test_lfu(self):
+        cache = self._hot('lfu')
+        for i in range(100, 200):
+            cache.put('k{0}'.format(i), i, 3600)
+        self.assertEqual(self._held(range(10)), list(range(10)))
+        self.assertEqual(self._held(range(10, 100)), [])
+
+    def test_maxsize(self):
+        cache = Cache('file', self.filename, maxsize=200*1024)
+        for i in range(1000):
+            cache.put('k{0}'.format(i), {'s': 'x'*1500}, 3600)
+            self.assertLessEqual(os.path.getsize(self.filename),
+                                 200*1024 + 2000)
+        self.assertGreater(cache.stats()['engine']['evictions'], 0)
+        self.assertIsNotNone(Cache('file', self.filename).get('k999'))
+
+    def test_mixed_gets_and_puts(self):
+        for kwargs in ({'maxcount': 100}, {'maxsize': 150000},
+                       {'maxcount': 100, 'eviction': 'lfu'}):
+            cache = Cache('file', self.filename, **kwargs)
+            cache.configure_l1(maxentries=10)
+            rand = random.Random(1)
+            for i in range(4000):
+                key = 'k{0}'.format(rand.randrange(300))
+                value = cache.get(key)
+                if value is None:
+                    cache.put(key, key*200, 3600)
+                else:
+                    self.assertEqual(value, key*200)
+            self.assertGreater(cache.stats()['engine']['evictions'], 0)
+            creations = self._table(cache)
+            self.assertEqual(len(creations), len(set(creations)), kwargs)
+            os.remove(self.filename)
+
+    def test_concurrent_mixed(self):
+        with multiprocessing.get_context('fork').Pool(4) as pool:
+            self.assertTrue(all(pool.map(_mixed, [(self.filename, i)
+                                                  for i in range(4)])))
+        cache = Cache('file', self.filename)
+        creations = self._table(cache)
+        self.assertEqual(len(creations), len(set(creations)))
+        self.assertLessEqual(len(cache._engine.hashes), 100)
+
+    def test_due_before_read(self):
+        engine = Cache('file', self.filename, maxsize=1024)._engine
+        self.assertFalse(engine._due())
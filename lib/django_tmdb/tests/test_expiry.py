@@ -0,0 +1,43 @@
+from django.test import SimpleTestCase
+from tmdb3.cache_engine import CacheObject
+from tmdb3.cache import Cache
+from mock import patch, PropertyMock
+import time
+
+
+class ExpiryTests(SimpleTestCase):
+
+    def setUp(self):
+        self.cache = Cache('memory', maxentries=10000)
+        self.cache.retain = 0.05
+
+    def test_dropped_once_past_retention(self):
+        self.cache.put('old', 'old', 0)
+        self.cache.put('new', 'new', 60)
+        self.assertEqual(self.cache.get('old', stale=True), 'old')
+        time.sleep(0.1)
+        self.assertIsNone(self.cache.get('old', stale=True))
+        self.assertNotIn('old', self.cache._data)
+        self.assertEqual(self.cache.stats()['expirations'], 1)
+
+    def test_replaced_records_skipped(self):
+        self.cache.put('a', 'old', 0)
+        self.cache.put('a', 'new', 60)
+        time.sleep(0.1)
+        self.assertEqual(self.cache.get('a'), 'new')
+        self.assertEqual(self.cache.stats()['expirations'], 0)
+
+    def test_heap_bounded(self):
+        for i in range(1000):
+            self.cache.put('a', i, 60)
+        self.assertLessEqual(len(self.cache._heap),
+                             2*len(self.cache._data) + 65)
+        self.assertEqual(self.cache.get('a'), 999)
+
+    def test_hit_checks_only_due_records(self):
+        for i in range(1000):
+            self.cache.put('k{0}'.format(i), i, 60)
+        with patch.object(CacheObject, 'expired', new_callable=PropertyMock,
+                          return_value=False) as expired:
+            self.assertEqual(self.cache.get('k500'), 500)
+        self.assertLessEqual(expired.call_count, 2)
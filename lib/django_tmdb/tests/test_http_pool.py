@@ -0,0 +1,102 @@
+from django.test import SimpleTestCase
+from tmdb3.http_pool import ConnectionPool
+from tmdb3.request import Request
+from .base import ReplayTestCase
+from .server import Server
+import http.client
+import tmdb3
+import json
+
+
+class ConnectionPoolTests(SimpleTestCase):
+
+    def setUp(self):
+        self.server = Server()
+        self.pool = ConnectionPool(maxsize=2)
+
+    def tearDown(self):
+        self.pool.clear()
+        self.server.stop()
+
+    def test_connection_reused(self):
+        for i in range(3):
+            resp = self.pool.urlopen('GET', self.server.url + 'movie/1')
+            self.assertEqual(resp.status, 200)
+            self.assertEqual(json.loads(resp.read().decode('utf-8')),
+                             {'path': '/movie/1'})
+        stats = self.pool.stats()
+        self.assertEqual((stats['created'], stats['reused'], stats['idle']),
+                         (1, 2, 1))
+
+    def test_error_status_returned(self):
+        self.server.responses['/movie/0'] = (404, {}, {'status_code': 34})
+        resp = self.pool.urlopen('GET', self.server.url + 'movie/0')
+        self.assertEqual(resp.status, 404)
+
+    def test_idle_timeout(self):
+        self.pool.idle_timeout = -1
+        self.pool.urlopen('GET', self.server.url + 'movie/1')
+        self.pool.urlopen('GET', self.server.url + 'movie/1')
+        stats = self.pool.stats()
+        self.assertEqual((stats['created'], stats['expired']), (2, 1))
+
+    def test_stale_connection_retried(self):
+        self.server.drop = True
+        self.pool.urlopen('GET', self.server.url + 'movie/1')
+        resp = self.pool.urlopen('GET', self.server.url + 'movie/2')
+        self.assertEqual(resp.status, 200)
+        self.assertEqual(self.pool.stats()['retried'], 1)
+        self.assertEqual(len(self.server.log), 2)
+
+    def test_stale_post_not_resent(self):
+        self.pool.urlopen('GET', self.server.url + 'movie/1')
+        # the server takes the request on the pooled connection, and then
+        # drops it, so may have acted on it
+        self.server.responses['/movie/1/rating'] = None
+        with self.assertRaises((http.client.HTTPException, OSError)):
+            self.pool.urlopen('POST', self.server.url + 'movie/1/rating',
+                              b'value=8.5')
+        self.assertEqual(self.pool.stats()['retried'], 0)
+        self.assertEqual([entry[0] for entry in self.server.log],
+                         ['GET', 'POST'])
+
+
+class RedirectTests(ReplayTestCase):
+
+    def _post(self, path):
+        req = Request(path)
+        req.add_data({'value': 8.5})
+        return req
+
+    def _location(self, path):
+        return {'Location': Request(path).get_full_url()}
+
+    def test_followed(self):
+        self.tape('movie/1', {}, status=301, headers=self._location('movie/2'))
+        match = self.tape('movie/2', {'id': 2})
+        self.assertEqual(Request('movie/1').readJSON(), {'id': 2})
+        self.assertEqual(self.played(match), 1)
+
+    def test_see_other_as_get(self):
+        for status in (301, 302, 303):
+            self.tape('movie/1/rating', {}, status=status, method='POST',
+                      body=b'value=8.5',
+                      headers=self._location('movie/{0}'.format(status)))
+            match = self.tape('movie/{0}'.format(status), {'id': status})
+            self.assertEqual(self._post('movie/1/rating').read(),
+                             '{{"id": {0}}}'.format(status))
+            self.assertEqual(self.played(match), 1)
+
+    def test_temporary_keeps_post(self):
+        self.tape('movie/1/rating', {}, status=307, method='POST',
+                  body=b'value=8.5', headers=self._location('movie/2/rating'))
+        match = self.tape('movie/2/rating', {'status_code': 1},
+                          method='POST', body=b'value=8.5')
+        self._post('movie/1/rating').open()
+        self.assertEqual(self.played(match), 1)
+
+    def test_too_many(self):
+        self.tape('movie/1', {}, status=302, headers=self._location('movie/1'))
+        with self.assertRaises(tmdb3.TMDBHTTPError) as cm:
+            Request('movie/1').open()
+        self.assertEqual(cm.exception.httperrno, 302)
@@ -0,0 +1,143 @@
+from django.test import SimpleTestCase
+from tmdb3.request import Request, cache_tags
+from tmdb3.cache import Cache
+from tmdb3 import request
+from .base import ReplayTestCase
+from tmdb3 import cache_file
+from mock import patch
+import tempfile
+import shutil
+import tmdb3
+import os
+
+
+KEYS = ('movie/1', 'movie/1/images', 'movie/2', 'account/9/lists')
+
+
+class CacheTagsTests(SimpleTestCase):
+
+    def test_tags(self):
+        self.assertEqual(cache_tags('movie/550'), ['movie:550'])
+        self.assertEqual(cache_tags('/movie/550/images'), ['movie:550'])
+        self.assertEqual(cache_tags('tv/2153/season/1'), ['tv:2153'])
+        self.assertEqual(cache_tags('account/12/rated/movies'),
+                         ['account:12'])
+        self.assertEqual(cache_tags('list/509ec17b19c2950a0600050d'),
+                         ['list:509ec17b19c2950a0600050d'])
+        for path in ('movie/popular', 'search/movie', 'configuration'):
+            self.assertEqual(cache_tags(path), [])
+
+
+class InvalidateTests(SimpleTestCase):
+
+    engines = (('file', {}), ('sharded', {'shards': 3}), ('log', {}),
+               ('sqlite', {'batchsize': 1}))
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _caches(self, engine, kwargs):
+        filename = os.path.join(self.tmpdir, engine)
+        return lambda: Cache(engine, filename, **kwargs)
+
+    def _fill(self, cache):
+        for key in KEYS:
+            cache.put(key, key, 60, {'tags': cache_tags(key)})
+
+    def _get(self, cache):
+        return [cache.get(key) for key in KEYS]
+
+    def test_shared_engines(self):
+        for engine, kwargs in self.engines:
+            new = self._caches(engine, kwargs)
+            writer, reader = new(), new()
+            self._fill(writer)
+            self.assertEqual(self._get(reader), list(KEYS), engine)
+
+            writer.invalidate('movie:1')
+            writer.expire('account/9/lists')
+            expected = [None, None, 'movie/2', None]
+            self.assertEqual(self._get(writer), expected, engine)
+            self.assertEqual(self._get(new()), expected, engine)
+
+            # stored again after being removed
+            writer.put('movie/1', 'again', 60, {'tags': ['movie:1']})
+            self.assertEqual(new().get('movie/1'), 'again', engine)
+
+    def test_memory_engine(self):
+        cache = Cache('memory')
+        self._fill(cache)
+        cache.invalidate('movie:1')
+        self.assertEqual(self._get(cache), [None, None, 'movie/2',
+                                            'account/9/lists'])
+        self.assertEqual(cache._engine.stats()['entries'], 2)
+
+    def test_removal_kept_as_file_grows(self):
+        for engine, kwargs in (('file', {'preallocate': 16}),
+                               ('log', {'maxlog': 4096})):
+            new = self._caches(engine, kwargs)
+            cache = new()
+            for i in range(100):
+                cache.put('k{0}'.format(i), i, 60,
+                          {'tags': ['movie:{0}'.format(i % 10)]})
+            cache.invalidate('movie:3')
+            # enough writes to grow the slot table, or compact the log
+            for i in range(100, 300):
+                cache.put('k{0}'.format(i), i, 60)
+            cache = new()
+            self.assertEqual(
+                    [i for i in range(300)
+                       if cache.get('k{0}'.format(i)) is None],
+                    list(range(3, 100, 10)), engine)
+
+    def test_records_decoded_once(self):
+        for engine in ('file', 'log'):
+            new = self._caches(engine, {})
+            writer = new()
+            for i in range(50):
+                writer.put('k{0}'.format(i), i, 60,
+                           {'tags': ['movie:{0}'.format(i % 10)]})
+            cache = new()
+            with patch.object(cache_file, 'decode',
+                              wraps=cache_file.decode) as decode:
+                cache.invalidate('movie:1')
+                self.assertEqual(decode.call_count, 50, engine)
+                writer.put('k50', 50, 60, {'tags': ['movie:2']})
+                decode.reset_mock()
+                # only the record written since is decoded to find tags
+                cache.invalidate('movie:2')
+                self.assertEqual(decode.call_count, 1, engine)
+            self.assertEqual(
+                    [i for i in range(51)
+                       if new().get('k{0}'.format(i)) is None],
+                    [i for i in range(50) if i % 10 in (1, 2)] + [50],
+                    engine)
+
+    def test_tombstones_beyond_free_slots(self):
+        new = self._caches('file', {'preallocate': 4})
+        cache = new()
+        for i in range(40):
+            cache.put('k{0}'.format(i), i, 60, {'tags': ['movie:1']})
+        cache.put('k40', 40, 60)
+        cache.invalidate('movie:1')
+        cache = new()
+        self.assertEqual([cache.get('k{0}'.format(i)) for i in range(41)],
+                         [None]*40 + [40])
+
+
+class RequestInvalidateTests(ReplayTestCase):
+
+    def test_invalidate(self):
+        match = self.tape('movie/550', {'id': 550})
+        self.tape('movie/550', {'id': 550})
+        self.tape('movie/551', {'id': 551})
+        Request('movie/550').readJSON()
+        Request('movie/551').readJSON()
+        tmdb3.invalidate('movie:550')
+        self.assertNotIn(Request('movie/550').cachekey(), request.cache._data)
+        Request('movie/550').readJSON()
+        Request('movie/551').readJSON()
+        self.assertEqual(self.played(match), 2)
@@ -0,0 +1,63 @@
+from django.test import SimpleTestCase
+from tmdb3.request import Request, migrate_key
+from tmdb3.cache import Cache
+from tmdb3 import cache_file
+from .base import write_old_cache
+from mock import patch
+import tempfile
+import shutil
+import os
+
+
+class KeyIndexTests(SimpleTestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _cache(self, engine='file'):
+        cache = Cache(engine, self.filename)
+        cache.migrate = migrate_key
+        return cache
+
+    def _decodes(self, func):
+        # count the records decoded while running func
+        with patch.object(cache_file, 'decode',
+                          wraps=cache_file.decode) as decode:
+            result = func()
+        return decode.call_count, result
+
+    def _key(self, i):
+        return Request('movie/{0}'.format(i)).cachekey()
+
+    def test_cold_lookup(self):
+        for engine in ('file', 'log'):
+            self.filename = os.path.join(self.tmpdir, engine)
+            cache = self._cache(engine)
+            for i in range(500):
+                cache.put(self._key(i), {'id': i}, 60)
+            cache = self._cache(engine)
+            key = self._key(250)
+            self.assertEqual(self._decodes(lambda: cache.get(key)),
+                             (1, {'id': 250}), engine)
+            self.assertEqual(self._decodes(lambda: cache.get('missing')),
+                             (0, None), engine)
+
+    def test_old_records_migrated_once(self):
+        write_old_cache(self.filename,
+                        [(Request('movie/{0}'.format(i)).get_full_url(),
+                          {'id': i}, 3600) for i in range(100)])
+        cache = self._cache()
+        # decoded to find the keys they are stored under, and rewritten
+        # with those keys on the first write
+        self.assertEqual(cache.get(self._key(50)), {'id': 50})
+        cache.put(self._key(100), {'id': 100}, 60)
+
+        cache = self._cache()
+        self.assertEqual(self._decodes(lambda: cache.get(self._key(20))),
+                         (1, {'id': 20}))
+        self.assertEqual(self._decodes(lambda: cache.get(self._key(100))),
+                         (1, {'id': 100}))
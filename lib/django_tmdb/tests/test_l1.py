@@ -0,0 +1,69 @@
+from django.test import SimpleTestCase
+from tmdb3.cache import Cache
+import tempfile
+import shutil
+import time
+import os
+
+
+class L1Tests(SimpleTestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'cache')
+        self.cache = Cache('file', self.filename)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_bounded(self):
+        self.cache.configure_l1(maxentries=3)
+        for i in range(10):
+            self.cache.put('k{0}'.format(i), i, 60)
+        self.assertEqual(list(self.cache._data), ['k7', 'k8', 'k9'])
+        self.assertEqual(self.cache.stats()['evictions'], 7)
+
+    def test_promoted_from_engine(self):
+        self.cache.configure_l1(maxentries=3)
+        for i in range(5):
+            self.cache.put('k{0}'.format(i), i, 60)
+        self.assertEqual(self.cache.get('k0'), 0)
+        self.assertEqual(self.cache.get('k0'), 0)
+        stats = self.cache.stats()
+        self.assertEqual((stats['promotions'], stats['hits']), (1, 1))
+        self.assertEqual(list(self.cache._data), ['k3', 'k4', 'k0'])
+
+    def test_hot_keys_kept(self):
+        self.cache.configure_l1(maxentries=2)
+        self.cache.put('hot', 'hot', 60)
+        for i in range(5):
+            self.cache.get('hot')
+            self.cache.put('k{0}'.format(i), i, 60)
+        self.assertIn('hot', self.cache._data)
+
+    def test_written_through(self):
+        self.cache.put('a', 'a', 60)
+        self.assertEqual(Cache('file', self.filename).get('a'), 'a')
+
+    def test_updates_seen_after_ttl(self):
+        self.cache.configure_l1(ttl=0.1)
+        self.cache.put('a', 'old', 60)
+        other = Cache('file', self.filename)
+        other.put('a', 'new', 60)
+        self.assertEqual(self.cache.get('a'), 'old')
+        time.sleep(0.1)
+        self.assertEqual(self.cache.get('a'), 'new')
+
+    def test_held_until_expired_without_ttl(self):
+        self.cache.put('a', 'old', 1)
+        Cache('file', self.filename).put('a', 'new', 60)
+        self.assertEqual(self.cache.get('a'), 'old')
+        time.sleep(1)
+        self.assertEqual(self.cache.get('a'), 'new')
+
+    def test_removal_seen_after_ttl(self):
+        self.cache.configure_l1(ttl=0.1)
+        self.cache.put('a', 'a', 60)
+        Cache('file', self.filename).expire('a')
+        time.sleep(0.1)
+        self.assertIsNone(self.cache.get('a'))
@@ -0,0 +1,103 @@
+from django.test import SimpleTestCase
+from tmdb3.tmdb_exceptions import TMDBCacheReadError
+from tmdb3.cache import Cache
+import multiprocessing
+import tempfile
+import shutil
+import time
+import os
+
+
+def _write(args):
+    # put records from another process
+    filename, start = args
+    cache = Cache('log', filename, maxlog=8192)
+    for i in range(start, start+50):
+        cache.put('k{0}'.format(i), i, 60)
+
+
+class LogEngineTests(SimpleTestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _logname(self, cache):
+        return cache._engine._logname(cache._engine.generation)
+
+    def test_shared(self):
+        writer = Cache('log', self.filename)
+        reader = Cache('log', self.filename)
+        writer.put('a', 'a', 60)
+        self.assertEqual(reader.get('a'), 'a')
+        self.assertFalse(reader._engine.changed())
+        writer.put('b', 'b', 60)
+        self.assertTrue(reader._engine.changed())
+        self.assertEqual(reader.get('b'), 'b')
+
+    def test_compacted(self):
+        cache = Cache('log', self.filename, maxlog=2048)
+        reader = Cache('log', self.filename)
+        self.assertIsNone(reader.get('k0'))
+        for i in range(100):
+            cache.put('k{0}'.format(i % 10), i, 60)
+        engine = cache._engine
+        self.assertGreater(engine.generation, 1)
+        self.assertLessEqual(engine.logpos, 2048 + 200)
+        # only the log of the current snapshot is kept
+        self.assertEqual(sorted(name for name in os.listdir(self.tmpdir)
+                                     if name.endswith('.log')),
+                         [os.path.basename(self._logname(cache))])
+        self.assertEqual([reader.get('k{0}'.format(i)) for i in range(10)],
+                         list(range(90, 100)))
+
+    def test_expired_dropped_on_compaction(self):
+        cache = Cache('log', self.filename, maxlog=1024)
+        cache.retain = 0
+        cache.put('old', 'old', 0)
+        time.sleep(0.01)
+        for i in range(50):
+            cache.put('k{0}'.format(i), i, 60)
+        self.assertEqual(cache.stats()['engine']['expirations'], 1)
+        self.assertIsNone(Cache('log', self.filename).get('old', stale=True))
+
+    def test_torn_record(self):
+        cache = Cache('log', self.filename)
+        cache.put('a', 'a', 60)
+        with open(self._logname(cache), 'ab') as fd:
+            fd.write(b'\x10\x00\x00\x00torn')
+        reader = Cache('log', self.filename)
+        self.assertEqual(reader.get('a'), 'a')
+        # the next writer replaces the incomplete record
+        cache.put('b', 'b', 60)
+        self.assertEqual(reader.get('b'), 'b')
+        self.assertEqual(os.path.getsize(self._logname(cache)),
+                         cache._engine.logpos)
+
+    def test_corrupt_record(self):
+        cache = Cache('log', self.filename)
+        cache.put('a', 'a', 60)
+        cache.put('b', 'b', 60)
+        # damage the payload of the last record
+        with open(self._logname(cache), 'r+b') as fd:
+            fd.seek(-2, 2)
+            fd.write(b'XX')
+        reader = Cache('log', self.filename)
+        self.assertEqual(reader.get('a'), 'a')
+        self.assertIsNone(reader.get('b'))
+
+    def test_invalid_snapshot(self):
+        with open(self.filename, 'wb') as fd:
+            fd.write(b'not a snapshot')
+        with self.assertRaises(TMDBCacheReadError):
+            Cache('log', self.filename).get('a')
+
+    def test_concurrent_writers(self):
+        with multiprocessing.get_context('fork').Pool(4) as pool:
+            pool.map(_write, [(self.filename, i*50) for i in range(4)])
+        cache = Cache('log', self.filename)
+        self.assertEqual([cache.get('k{0}'.format(i)) for i in range(200)],
+                         list(range(200)))
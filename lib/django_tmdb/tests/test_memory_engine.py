@@ -0,0 +1,73 @@
+from django.test import SimpleTestCase
+from tmdb3.cache_memory import MemoryEngine
+from tmdb3.cache import Cache
+import time
+
+
+class MemoryEngineTests(SimpleTestCase):
+
+    def test_evicts_least_recently_used(self):
+        cache = Cache('memory', maxentries=3)
+        for i in range(3):
+            cache.put('k{0}'.format(i), i, 60)
+        self.assertEqual(cache.get('k0'), 0)
+        cache.put('k3', 3, 60)
+        self.assertIsNone(cache.get('k1'))
+        self.assertEqual([cache.get('k{0}'.format(i)) for i in (0, 2, 3)],
+                         [0, 2, 3])
+        self.assertEqual(cache.stats()['engine']['evictions'], 1)
+
+    def test_l1_reads_count_as_use(self):
+        cache = Cache('memory', maxentries=2)
+        cache.put('a', 'a', 60)
+        cache.put('b', 'b', 60)
+        # served from L1, without the engine being asked
+        cache.get('a')
+        cache.put('c', 'c', 60)
+        self.assertEqual(cache.get('a'), 'a')
+        self.assertIsNone(cache.get('b'))
+
+    def test_bounded_by_size(self):
+        cache = Cache('memory', maxbytes=100)
+        for i in range(10):
+            cache.put('k{0}'.format(i), 'x'*30, 60)
+        stats = cache.stats()['engine']
+        self.assertLessEqual(stats['bytes'], 100)
+        self.assertEqual(stats['entries'], 3)
+        # too large to be held at all
+        cache.put('big', 'x'*200, 60)
+        self.assertIsNone(cache.get('big'))
+
+    def test_replaced_record(self):
+        cache = Cache('memory')
+        cache.put('a', 'old', 60)
+        cache.put('a', 'new', 60)
+        self.assertEqual(cache.get('a'), 'new')
+        self.assertEqual(cache.stats()['engine']['entries'], 1)
+
+    def test_purges_past_retention(self):
+        cache = Cache('memory')
+        cache.retain = 0
+        cache.put('old', 'old', 0.05)
+        time.sleep(0.1)
+        cache.put('new', 'new', 60)
+        stats = cache.stats()['engine']
+        self.assertEqual(stats['entries'], 1)
+        self.assertEqual(stats['expirations'], 1)
+        self.assertIsNone(cache.get('old', stale=True))
+
+    def test_retained_until_due(self):
+        cache = Cache('memory')
+        cache.retain = 60
+        cache.put('old', 'old', 0.05)
+        time.sleep(0.1)
+        cache.put('new', 'new', 60)
+        self.assertEqual(cache.get('old', stale=True), 'old')
+
+    def test_parent_dropped(self):
+        engine = Cache('memory', maxentries=1)._engine
+        self.assertIsNone(engine.parent())
+        self.assertIsInstance(engine, MemoryEngine)
+        engine.put('a', 'a', 60)
+        engine.put('b', 'b', 60)
+        self.assertEqual([obj.key for obj in engine.get(0)], ['b'])
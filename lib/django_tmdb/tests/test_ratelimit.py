@@ -0,0 +1,89 @@
+from django.test import SimpleTestCase
+from tmdb3.ratelimit import get_limiter, TokenBucket, FileTokenBucket
+import tempfile
+import shutil
+import time
+import os
+
+
+class TokenBucketTests(SimpleTestCase):
+
+    def test_burst_then_wait(self):
+        bucket = TokenBucket(3, 6)
+        self.assertEqual([bucket.reserve() for i in range(3)], [0, 0, 0])
+        self.assertAlmostEqual(bucket.reserve(), 2, delta=0.1)
+        # later callers queue up behind the first to wait
+        self.assertAlmostEqual(bucket.reserve(), 4, delta=0.1)
+
+    def test_refill(self):
+        bucket = TokenBucket(2, 0.2)
+        bucket.reserve()
+        bucket.reserve()
+        time.sleep(0.15)
+        self.assertEqual(bucket.reserve(), 0)
+
+    def test_retry_after_holds_off(self):
+        bucket = TokenBucket(30, 10)
+        bucket.update(429, {'Retry-After': '5'})
+        self.assertAlmostEqual(bucket.reserve(), 5.33, delta=0.1)
+        self.assertEqual(bucket.stats()['throttled'], 1)
+
+    def test_remaining_headers(self):
+        bucket = TokenBucket(30, 10)
+        bucket.update(200, {'X-RateLimit-Limit': '40',
+                            'X-RateLimit-Remaining': '1'})
+        self.assertEqual(bucket.reserve(), 0)
+        self.assertAlmostEqual(bucket.reserve(), 0.25, delta=0.05)
+
+    def test_stats(self):
+        bucket = TokenBucket(1, 0.05)
+        bucket.acquire()
+        bucket.acquire()
+        stats = bucket.stats()
+        self.assertEqual((stats['requests'], stats['waits']), (2, 1))
+        self.assertGreater(stats['waited'], 0)
+        self.assertEqual(stats['wait']['count'], 1)
+
+
+class FileTokenBucketTests(SimpleTestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'ratelimit')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_get_limiter(self):
+        self.assertIsInstance(get_limiter(filename=None), TokenBucket)
+        self.assertIsInstance(get_limiter(filename=self.filename),
+                              FileTokenBucket)
+
+    def test_budget_shared(self):
+        first = get_limiter(2, 10, self.filename)
+        second = get_limiter(2, 10, self.filename)
+        self.assertEqual(first.reserve(), 0)
+        self.assertEqual(second.reserve(), 0)
+        self.assertAlmostEqual(first.reserve(), 5, delta=0.1)
+        self.assertAlmostEqual(second.reserve(), 10, delta=0.1)
+
+    def test_unwritable_falls_back(self):
+        bucket = get_limiter(2, 10, os.path.join(self.tmpdir, 'no', 'file'))
+        with self.assertWarns(UserWarning):
+            self.assertEqual(bucket.reserve(), 0)
+        self.assertIsNone(bucket.filename)
+
+    def test_reconfigured_over_file(self):
+        first = get_limiter(2, 10, self.filename)
+        for i in range(3):
+            first.reserve()
+        # the rate given is used, rather than the one the file was made with
+        bucket = get_limiter(1000, 1, self.filename)
+        self.assertLess(max(bucket.reserve() for i in range(5)), 0.01)
+
+    def test_limit_header_shared_file(self):
+        bucket = get_limiter(2, 10, self.filename)
+        bucket.update(200, {'X-RateLimit-Limit': '40'})
+        self.assertEqual(bucket.capacity, 2)
+        self.assertEqual([bucket.reserve() for i in range(2)], [0, 0])
+        self.assertAlmostEqual(bucket.reserve(), 0.25, delta=0.05)
@@ -0,0 +1,162 @@
+from django.test import SimpleTestCase
+from tmdb3.retry import RetryPolicy, CircuitBreaker
+from tmdb3.request import AsyncRequest, Request
+from tmdb3 import request
+from .base import ReplayTestCase
+from mock import patch
+import tmdb3
+import asyncio
+import socket
+import time
+
+
+class RetryPolicyTests(SimpleTestCase):
+
+    def test_delay_bounded(self):
+        policy = RetryPolicy(backoff=1, maxbackoff=3)
+        for attempt in range(6):
+            self.assertLessEqual(policy.delay(attempt), min(2**attempt, 3))
+
+    def test_retry_after(self):
+        policy = RetryPolicy(backoff=0.01, maxbackoff=30)
+        self.assertGreaterEqual(policy.delay(0, '5'), 5)
+        self.assertEqual(policy.delay(0, '60'), 30)
+        self.assertLess(policy.delay(0, 'soon'), 0.01)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+
+    def test_opens_after_threshold(self):
+        breaker = CircuitBreaker(threshold=2, reset=30)
+        breaker.failure()
+        self.assertEqual(breaker.state, breaker.CLOSED)
+        breaker.failure()
+        self.assertEqual(breaker.state, breaker.OPEN)
+        self.assertFalse(breaker.allow())
+        self.assertEqual(breaker.stats()['trips'], 1)
+
+    def test_trial_success_closes(self):
+        breaker = CircuitBreaker(threshold=1, reset=30)
+        breaker.failure()
+        breaker.opened -= 30
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, breaker.HALFOPEN)
+        # a single trial at a time
+        self.assertFalse(breaker.allow())
+        breaker.success()
+        self.assertEqual(breaker.state, breaker.CLOSED)
+        self.assertTrue(breaker.allow())
+
+    def test_trial_failure_reopens(self):
+        breaker = CircuitBreaker(threshold=1, reset=0.1)
+        breaker.failure()
+        time.sleep(0.1)
+        self.assertTrue(breaker.allow())
+        breaker.failure()
+        self.assertEqual(breaker.state, breaker.OPEN)
+        self.assertFalse(breaker.allow())
+        self.assertEqual(breaker.stats()['trips'], 2)
+
+    def test_trial_released(self):
+        breaker = CircuitBreaker(threshold=1, reset=30)
+        breaker.failure()
+        breaker.opened -= 30
+        self.assertTrue(breaker.allow())
+        breaker.release()
+        self.assertEqual(breaker.state, breaker.OPEN)
+        self.assertTrue(breaker.allow())
+
+    def test_unresolved_trial_replaced(self):
+        breaker = CircuitBreaker(threshold=1, reset=0.1)
+        breaker.failure()
+        time.sleep(0.1)
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+        time.sleep(0.1)
+        self.assertTrue(breaker.allow())
+
+
+class RequestRetryTests(ReplayTestCase):
+
+    def test_retried_until_success(self):
+        tmdb3.set_retry(retries=2, backoff=0.01)
+        match = self.tape('movie/550', {}, status=503)
+        self.tape('movie/550', {'id': 550})
+        self.assertEqual(Request('movie/550').open().status, 200)
+        self.assertEqual(self.played(match), 2)
+        self.assertEqual(request.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_throttled_trial_closes(self):
+        tmdb3.set_circuit_breaker(threshold=2, reset=0.5)
+        for status in (503, 503, 429):
+            self.tape('movie/550', {}, status=status)
+        for i in range(2):
+            with self.assertRaises(tmdb3.TMDBHTTPError):
+                Request('movie/550').open()
+        with self.assertRaisesRegex(tmdb3.TMDBOffline, 'for 1 seconds'):
+            Request('movie/550').open()
+
+        time.sleep(0.5)
+        with self.assertRaises(tmdb3.TMDBHTTPError):
+            Request('movie/550').open()
+        self.assertEqual(request.breaker.state, CircuitBreaker.CLOSED)
+
+    def test_cancelled_trial_released(self):
+        tmdb3.set_circuit_breaker(threshold=1, reset=30)
+        self.tape('movie/550', {'id': 550})
+        request.breaker.failure()
+        request.breaker.opened -= 30
+        request.transport.latency = 5
+
+        async def cancelled():
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(AsyncRequest('movie/550').open(), 0.1)
+
+        asyncio.run(cancelled())
+        request.transport.latency = 0
+        self.assertEqual(Request('movie/550').open().status, 200)
+        self.assertEqual(request.breaker.state, CircuitBreaker.CLOSED)
+
+    def _post(self):
+        req = Request('movie/550/rating')
+        req.add_data({'value': 8.5})
+        return req
+
+    def test_post_not_resent(self):
+        tmdb3.set_retry(retries=2, backoff=0.01)
+        match = self.tape('movie/550/rating', {}, status=503, method='POST',
+                          body=b'value=8.5')
+        self.tape('movie/550/rating', {'status_code': 1}, method='POST',
+                  body=b'value=8.5')
+        with self.assertRaises(tmdb3.TMDBHTTPError):
+            self._post().open()
+        self.assertEqual(self.played(match), 1)
+
+        with patch.object(request.transport, 'urlopen',
+                          side_effect=socket.timeout) as urlopen:
+            with self.assertRaises(tmdb3.TMDBOffline):
+                self._post().open()
+        self.assertEqual(urlopen.call_count, 1)
+
+    def test_post_resent_unsent(self):
+        tmdb3.set_retry(retries=2, backoff=0.01)
+        match = self.tape('movie/550/rating', {}, status=429, method='POST',
+                          body=b'value=8.5', headers={'Retry-After': '0'})
+        self.tape('movie/550/rating', {'status_code': 1}, method='POST',
+                  body=b'value=8.5')
+        self.assertEqual(self._post().open().status, 200)
+        self.assertEqual(self.played(match), 2)
+
+        with patch.object(request.transport, 'urlopen',
+                          side_effect=ConnectionRefusedError) as urlopen:
+            with self.assertRaises(tmdb3.TMDBOffline):
+                self._post().open()
+        self.assertEqual(urlopen.call_count, 3)
+
+    def test_get_resent_after_timeout(self):
+        tmdb3.set_retry(retries=2, backoff=0.01)
+        with patch.object(request.transport, 'urlopen',
+                          side_effect=socket.timeout) as urlopen:
+            with self.assertRaises(tmdb3.TMDBOffline):
+                Request('movie/550').open()
+        self.assertEqual(urlopen.call_count, 3)
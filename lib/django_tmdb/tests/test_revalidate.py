@@ -0,0 +1,83 @@
+from tmdb3.request import Request
+from tmdb3 import request
+from .base import ReplayTestCase
+from mock import patch
+
+
+VALIDATORS = {'ETag': '"v1"',
+              'Last-Modified': 'Wed, 21 Oct 2015 07:28:00 GMT'}
+
+
+class RevalidateTests(ReplayTestCase):
+
+    def _expired(self):
+        # a response cached already expired, by a max-age of zero
+        headers = dict(VALIDATORS, **{'Cache-Control': 'max-age=0'})
+        self.tape('movie/550', {'id': 550}, headers=headers)
+        self.assertEqual(Request('movie/550').readJSON(), {'id': 550})
+        return request.cache._data[Request('movie/550').cachekey()]
+
+    def _read(self):
+        # read the request again, returning the headers it was sent with
+        with patch.object(request.transport, 'urlopen',
+                          wraps=request.transport.urlopen) as urlopen:
+            data = Request('movie/550').readJSON()
+        headers = dict((k.lower(), v)
+                       for k, v in urlopen.call_args[0][3].items())
+        return data, headers
+
+    def _stored(self):
+        return request.cache._data[Request('movie/550').cachekey()]
+
+    def test_validators_sent(self):
+        self.assertTrue(self._expired().expired)
+        self.tape('movie/550', {'id': 550})
+        data, headers = self._read()
+        self.assertEqual(headers['if-none-match'], '"v1"')
+        self.assertEqual(headers['if-modified-since'],
+                         VALIDATORS['Last-Modified'])
+
+    def test_fresh_not_revalidated(self):
+        self.tape('movie/550', {'id': 550}, headers=VALIDATORS)
+        Request('movie/550').readJSON()
+        self.clear_cache()
+        self.tape('movie/550', {'id': 550})
+        with patch.object(request.transport, 'urlopen') as urlopen:
+            self.assertEqual(Request('movie/550').readJSON(), {'id': 550})
+        self.assertFalse(urlopen.called)
+
+    def test_not_modified_renews(self):
+        self._expired()
+        self.tape('movie/550', 'not parsed', status=304,
+                  headers={'Cache-Control': 'max-age=60'})
+        with patch.object(request.json, 'loads') as loads:
+            data, headers = self._read()
+        self.assertFalse(loads.called)
+        self.assertEqual(data, {'id': 550})
+        obj = self._stored()
+        self.assertEqual(obj.lifetime, 60)
+        self.assertFalse(obj.expired)
+        # the validators of the retained copy are kept
+        self.assertEqual(obj.meta['etag'], '"v1"')
+
+    def test_changed_replaces(self):
+        self._expired()
+        self.tape('movie/550', {'id': 550, 'title': 'new'},
+                  headers={'ETag': '"v2"', 'Cache-Control': 'max-age=60'})
+        data, headers = self._read()
+        self.assertEqual(data, {'id': 550, 'title': 'new'})
+        obj = self._stored()
+        self.assertEqual((obj.data, obj.meta['etag'], obj.lifetime),
+                         (data, '"v2"', 60))
+        self.assertNotIn('modified', obj.meta)
+
+    def test_no_store(self):
+        self._expired()
+        self.tape('movie/550', {'id': 550, 'title': 'new'},
+                  headers={'ETag': '"v2"', 'Cache-Control': 'no-store'})
+        data, headers = self._read()
+        self.assertEqual(data, {'id': 550, 'title': 'new'})
+        # the response is not kept, leaving the expired copy as it was
+        obj = self._stored()
+        self.assertEqual((obj.data, obj.meta['etag']), ({'id': 550}, '"v1"'))
+        self.assertTrue(obj.expired)
@@ -0,0 +1,87 @@
+from django.test import SimpleTestCase
+from tmdb3.tmdb_exceptions import TMDBCacheError
+from tmdb3.cache import Cache
+import multiprocessing
+import tempfile
+import shutil
+import os
+
+
+def _write(args):
+    # put records from another process
+    filename, start = args
+    cache = Cache('sharded', filename, shards=4)
+    for i in range(start, start+50):
+        cache.put('k{0}'.format(i), i, 60)
+
+
+class ShardedEngineTests(SimpleTestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_spread_over_shards(self):
+        cache = Cache('sharded', self.filename, shards=4)
+        for i in range(100):
+            cache.put('k{0}'.format(i), i, 60)
+        self.assertEqual(sorted(os.listdir(self.tmpdir)),
+                         ['cache.{0}of4'.format(i) for i in range(1, 5)])
+        counts = [len(shard.hashes) for shard in cache._engine.shards]
+        self.assertEqual(sum(counts), 100)
+        self.assertTrue(all(counts))
+
+        other = Cache('sharded', self.filename, shards=4)
+        self.assertEqual([other.get('k{0}'.format(i)) for i in range(100)],
+                         list(range(100)))
+
+    def test_new_records_read(self):
+        cache = Cache('sharded', self.filename, shards=4)
+        other = Cache('sharded', self.filename, shards=4)
+        for i in range(10):
+            cache.put('k{0}'.format(i), i, 60)
+            self.assertEqual(other.get('k{0}'.format(i)), i)
+        cache.put('k0', 'new', 60)
+        other.configure_l1(ttl=0)
+        self.assertEqual(other.get('k0'), 'new')
+
+    def test_shard_count_changed(self):
+        Cache('sharded', self.filename, shards=4).put('a', 'a', 60)
+        self.assertIsNone(Cache('sharded', self.filename, shards=2).get('a'))
+
+    def test_invalid_shard_count(self):
+        with self.assertRaises(TMDBCacheError):
+            Cache('sharded', self.filename, shards=0)
+
+    def test_budget_shared(self):
+        cache = Cache('sharded', self.filename, shards=4, maxcount=40,
+                      maxsize=40000)
+        self.assertEqual([(shard.maxcount, shard.maxsize)
+                          for shard in cache._engine.shards],
+                         [(10, 10000)]*4)
+        for i in range(200):
+            cache.put('k{0}'.format(i), i, 60)
+        self.assertLessEqual(sum(len(shard.hashes)
+                                 for shard in cache._engine.shards), 40)
+
+    def test_stats(self):
+        cache = Cache('sharded', self.filename, shards=4)
+        for i in range(20):
+            cache.put('k{0}'.format(i), i, 60)
+        stats = cache.stats()['engine']
+        self.assertEqual((stats['shards'], stats['puts']), (4, 20))
+        self.assertEqual(stats['bytes'],
+                         sum(os.path.getsize(os.path.join(self.tmpdir, name))
+                             for name in os.listdir(self.tmpdir)))
+        cache.reset_stats()
+        self.assertEqual(cache.stats()['engine']['puts'], 0)
+
+    def test_concurrent_writers(self):
+        with multiprocessing.get_context('fork').Pool(4) as pool:
+            pool.map(_write, [(self.filename, i*50) for i in range(4)])
+        cache = Cache('sharded', self.filename, shards=4)
+        self.assertEqual([cache.get('k{0}'.format(i)) for i in range(200)],
+                         list(range(200)))
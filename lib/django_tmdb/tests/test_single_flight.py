@@ -0,0 +1,105 @@
+from tmdb3.cache import Cache
+from tmdb3.request import AsyncRequest, Request
+from tmdb3 import request
+from .base import ReplayTestCase
+import multiprocessing
+import threading
+import tempfile
+import asyncio
+import shutil
+import time
+import os
+
+
+def _fetch(tmpdir):
+    # query from another process, counting queries as files in tmpdir
+    def query():
+        marker = os.path.join(tmpdir, 'query.{0}'.format(os.getpid()))
+        open(marker, 'w').close()
+        time.sleep(0.2)
+        return {'id': 550}
+    cache = Cache('file', os.path.join(tmpdir, 'cache'))
+    return cache.fetch('movie/550', query, 60)
+
+
+class SingleFlightTests(ReplayTestCase):
+
+    def setUp(self):
+        super(SingleFlightTests, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+        super(SingleFlightTests, self).tearDown()
+
+    def _concurrently(self, func, count=8):
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(func()))
+                   for i in range(count)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_engine_lock_excludes_threads(self):
+        for engine in ('file', 'log', 'sqlite'):
+            cache = Cache(engine, os.path.join(self.tmpdir, engine))
+            inside = []
+            overlaps = []
+
+            def hold():
+                with cache._engine.lock('movie/550'):
+                    overlaps.append(len(inside))
+                    inside.append(1)
+                    time.sleep(0.05)
+                    inside.pop()
+            self._concurrently(hold, 4)
+            self.assertEqual(overlaps, [0]*4, engine)
+
+    def test_concurrent_requests_share_query(self):
+        match = self.tape('movie/550', {'id': 550})
+        request.transport.latency = 0.2
+        results = self._concurrently(lambda: Request('movie/550').readJSON())
+        self.assertEqual(results, [{'id': 550}]*8)
+        self.assertEqual(self.played(match), 1)
+
+    def test_error_shared(self):
+        cache = Cache('memory')
+        calls = []
+        errors = []
+
+        def query():
+            calls.append(1)
+            time.sleep(0.2)
+            raise ValueError('failed')
+
+        def fetch():
+            try:
+                cache.fetch('movie/550', query, 60)
+            except ValueError as e:
+                errors.append(e)
+
+        self._concurrently(fetch, 4)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(errors), 4)
+        # the failure is not remembered
+        self.assertEqual(cache.fetch('movie/550', lambda: 'ok', 60), 'ok')
+
+    def test_shared_between_processes(self):
+        with multiprocessing.get_context('fork').Pool(4) as pool:
+            results = pool.map(_fetch, [self.tmpdir]*4)
+        self.assertEqual(results, [{'id': 550}]*4)
+        self.assertEqual(len([name for name in os.listdir(self.tmpdir)
+                              if name.startswith('query.')]), 1)
+
+    def test_async_requests_share_query(self):
+        match = self.tape('movie/550', {'id': 550})
+        request.transport.latency = 0.2
+
+        async def read():
+            return await asyncio.gather(*[AsyncRequest('movie/550').readJSON()
+                                          for i in range(5)])
+
+        self.assertEqual(asyncio.run(read()), [{'id': 550}]*5)
+        self.assertEqual(self.played(match), 1)
@@ -0,0 +1,117 @@
+from django.test import SimpleTestCase
+from tmdb3 import cache_sqlite
+from tmdb3.cache import Cache
+from mock import patch
+import multiprocessing
+import tempfile
+import sqlite3
+import shutil
+import time
+import os
+
+
+def _write(args):
+    # put records from another process
+    filename, start = args
+    cache = Cache('sqlite', filename, batchsize=8)
+    for i in range(start, start+50):
+        cache.put('k{0}'.format(i), i, 60)
+    cache._engine.flush()
+
+
+class SqliteEngineTests(SimpleTestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'cache.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _count(self):
+        conn = sqlite3.connect(self.filename)
+        try:
+            return conn.execute('SELECT count(*) FROM cache').fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_cold_lookup_decodes_one_record(self):
+        cache = Cache('sqlite', self.filename, batchsize=500)
+        for i in range(500):
+            cache.put('k{0}'.format(i), {'id': i}, 60)
+        cache._engine.flush()
+
+        cache = Cache('sqlite', self.filename)
+        with patch.object(cache_sqlite, 'decode',
+                          wraps=cache_sqlite.decode) as decode:
+            self.assertEqual(cache.get('k250'), {'id': 250})
+            self.assertIsNone(cache.get('missing'))
+            cache.put('new', {'id': 'new'}, 60)
+        self.assertEqual(decode.call_count, 1)
+
+    def test_new_records_read_after_cold_start(self):
+        writer = Cache('sqlite', self.filename, batchsize=1)
+        writer.put('a', 'a', 60)
+        reader = Cache('sqlite', self.filename)
+        self.assertEqual(reader.get('a'), 'a')
+        writer.put('a', 'b', 60)
+        reader.configure_l1(ttl=0)
+        self.assertEqual(reader.get('a'), 'b')
+
+    def test_batched_commits(self):
+        cache = Cache('sqlite', self.filename, batchsize=4, batchtime=60)
+        for i in range(3):
+            cache.put('k{0}'.format(i), i, 60)
+        self.assertEqual(self._count(), 0)
+        # pending writes are still served by the engine
+        self.assertEqual(cache._engine.lookup('k1').data, 1)
+        cache.put('k3', 3, 60)
+        self.assertEqual(self._count(), 4)
+        self.assertEqual(cache.stats()['engine']['puts'], 4)
+
+    def test_batch_committed_after_time(self):
+        cache = Cache('sqlite', self.filename, batchsize=100, batchtime=0.1)
+        cache.put('a', 'a', 60)
+        time.sleep(0.1)
+        cache.put('b', 'b', 60)
+        self.assertEqual(self._count(), 2)
+
+    def test_committed_on_lock_release(self):
+        cache = Cache('sqlite', self.filename, batchsize=100, batchtime=60)
+        with cache._engine.lock('a'):
+            cache.put('a', 'a', 60)
+            self.assertEqual(self._count(), 0)
+        self.assertEqual(self._count(), 1)
+
+    def test_reads_not_blocked_by_writer(self):
+        cache = Cache('sqlite', self.filename, batchsize=1)
+        cache.put('a', 'a', 60)
+        conn = sqlite3.connect(self.filename, timeout=0.1,
+                               isolation_level=None)
+        self.assertEqual(conn.execute('PRAGMA journal_mode').fetchone()[0],
+                         'wal')
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute("UPDATE cache SET lifetime = 0 WHERE key = 'a'")
+        try:
+            reader = Cache('sqlite', self.filename, timeout=0.1)
+            self.assertEqual(reader.get('a'), 'a')
+        finally:
+            conn.execute('ROLLBACK')
+            conn.close()
+
+    def test_concurrent_writers(self):
+        with multiprocessing.get_context('fork').Pool(4) as pool:
+            pool.map(_write, [(self.filename, i*50) for i in range(4)])
+        self.assertEqual(self._count(), 200)
+        cache = Cache('sqlite', self.filename)
+        self.assertEqual([cache.get('k{0}'.format(i)) for i in (0, 99, 199)],
+                         [0, 99, 199])
+
+    def test_invalidate(self):
+        cache = Cache('sqlite', self.filename, batchsize=1)
+        cache.put('a', 'a', 60, meta={'tags': ['movie:550']})
+        cache.put('b', 'b', 60)
+        cache.invalidate('movie:550')
+        cache = Cache('sqlite', self.filename)
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.get('b'), 'b')
@@ -0,0 +1,119 @@
+from django.test import SimpleTestCase
+from tmdb3.request import AsyncRequest, Request
+from tmdb3.cache import Cache
+from tmdb3 import request
+from .base import ReplayTestCase
+import threading
+import asyncio
+import tmdb3
+import time
+
+
+class StaleWhileRevalidateTests(SimpleTestCase):
+
+    def setUp(self):
+        self.cache = Cache('memory')
+        self.cache.configure_grace(60)
+        self.cache.put('a', 'old', 0)
+        self.refreshed = threading.Event()
+        self.calls = []
+
+    def refresh(self):
+        self.calls.append(1)
+        self.cache.put('a', 'new', 60)
+        self.refreshed.set()
+
+    def test_served_while_refreshed(self):
+        self.assertEqual(self.cache.get('a', refresh=self.refresh), 'old')
+        self.assertTrue(self.refreshed.wait(5))
+        self.assertEqual(self.cache.get('a', refresh=self.refresh), 'new')
+        stats = self.cache.stats()
+        self.assertEqual((stats['stale'], stats['refreshes'], stats['hits']),
+                         (1, 1, 1))
+
+    def test_single_refresh(self):
+        release = threading.Event()
+
+        def refresh():
+            release.wait(5)
+            self.refresh()
+
+        for i in range(5):
+            self.assertEqual(self.cache.get('a', refresh=refresh), 'old')
+        release.set()
+        self.assertTrue(self.refreshed.wait(5))
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(self.cache.stats()['refreshes'], 1)
+
+    def test_failed_refresh(self):
+        def refresh():
+            self.refreshed.set()
+            raise ValueError('failed')
+
+        self.assertEqual(self.cache.get('a', refresh=refresh), 'old')
+        self.assertTrue(self.refreshed.wait(5))
+        # retried on the next read
+        while self.cache._refreshing:
+            time.sleep(0.01)
+        self.refreshed.clear()
+        self.assertEqual(self.cache.get('a', refresh=refresh), 'old')
+        self.assertTrue(self.refreshed.wait(5))
+        self.assertEqual(self.cache.stats()['refreshes'], 2)
+
+    def test_beyond_grace(self):
+        self.cache.configure_grace(0.05)
+        time.sleep(0.1)
+        self.assertIsNone(self.cache.get('a', refresh=self.refresh))
+        self.assertEqual(self.calls, [])
+
+    def test_beyond_maxage(self):
+        self.cache.configure_grace(60, maxage=0.05)
+        time.sleep(0.1)
+        self.assertIsNone(self.cache.get('a', refresh=self.refresh))
+
+    def test_without_refresh(self):
+        self.assertIsNone(self.cache.get('a'))
+        self.assertEqual(self.cache.get('a', stale=True), 'old')
+
+    def test_coroutine_refresh(self):
+        async def refresh():
+            self.refresh()
+
+        async def read():
+            data = self.cache.get('a', refresh=refresh)
+            await asyncio.sleep(0)
+            return data
+
+        self.assertEqual(asyncio.run(read()), 'old')
+        self.assertTrue(self.refreshed.is_set())
+
+
+class RequestStaleTests(ReplayTestCase):
+
+    def setUp(self):
+        super(RequestStaleTests, self).setUp()
+        tmdb3.set_cache_grace(60)
+        self.key = Request('movie/550').cachekey()
+        request.cache.put(self.key, {'id': 'old'}, 0)
+        self.match = self.tape('movie/550', {'id': 'new'})
+
+    def _refreshed(self):
+        deadline = time.time() + 5
+        while request.cache._refreshing and (time.time() < deadline):
+            time.sleep(0.01)
+        return self.played(self.match) == 1
+
+    def test_request(self):
+        self.assertEqual(Request('movie/550').readJSON(), {'id': 'old'})
+        self.assertTrue(self._refreshed())
+        self.assertEqual(Request('movie/550').readJSON(), {'id': 'new'})
+
+    def test_async_request(self):
+        async def read():
+            data = await AsyncRequest('movie/550').readJSON()
+            while request.cache._refreshing:
+                await asyncio.sleep(0.01)
+            return data, await AsyncRequest('movie/550').readJSON()
+
+        self.assertEqual(asyncio.run(read()), ({'id': 'old'}, {'id': 'new'}))
+        self.assertEqual(self.played(self.match), 1)
@@ -0,0 +1,114 @@
+from django.test import SimpleTestCase
+from tmdb3.stats import Histogram, Stats
+from tmdb3.request import Request
+from tmdb3.cache import Cache
+from .base import ReplayTestCase
+import tempfile
+import shutil
+import tmdb3
+import json
+import os
+
+
+class HistogramTests(SimpleTestCase):
+
+    def test_snapshot(self):
+        histogram = Histogram()
+        for value in (0.00001, 0.0003, 0.0003, 0.002, 20):
+            histogram.observe(value)
+        snapshot = histogram.snapshot()
+        self.assertEqual((snapshot['count'], snapshot['max']), (5, 20))
+        self.assertAlmostEqual(snapshot['sum'], 20.00261)
+        buckets = dict(snapshot['buckets'])
+        self.assertEqual((buckets[0.00001], buckets[0.0005], buckets[0.0025],
+                          buckets[10.0], buckets[float('inf')]),
+                         (1, 3, 4, 4, 5))
+        self.assertEqual((snapshot['p50'], snapshot['p90']), (0.0005, 20))
+
+    def test_empty(self):
+        snapshot = Histogram().snapshot()
+        self.assertEqual((snapshot['count'], snapshot['p99']), (0, 0.0))
+
+
+class StatsTests(SimpleTestCase):
+
+    def test_counters(self):
+        stats = Stats(('hits', 'wait'), ('get',))
+        stats.incr('hits')
+        stats.incr('wait', 0.5)
+        stats.observe('get', 0.001)
+        snapshot = stats.snapshot()
+        self.assertEqual((snapshot['hits'], snapshot['wait'],
+                          snapshot['get']['count']), (1, 0.5, 1))
+        stats.reset()
+        snapshot = stats.snapshot()
+        self.assertEqual((snapshot['hits'], snapshot['get']['count']), (0, 0))
+
+
+class CacheStatsTests(SimpleTestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, 'cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _use(self, cache):
+        for i in range(10):
+            cache.put('k{0}'.format(i), {'id': i}, 60)
+        with cache._engine.lock('k0'):
+            pass
+        for i in range(15):
+            cache.get('k{0}'.format(i))
+        return cache.stats()
+
+    def test_counted(self):
+        for engine, args in (('memory', ()), ('file', (self.filename,)),
+                             ('sqlite', (self.filename + '.db',)),
+                             ('log', (self.filename + '.log',))):
+            stats = self._use(Cache(engine, *args))
+            self.assertEqual((stats['hits'], stats['misses'], stats['puts'],
+                              stats['entries']), (10, 5, 10, 10), engine)
+            self.assertEqual((stats['get']['count'], stats['put']['count']),
+                             (15, 10), engine)
+            self.assertGreater(stats['engine']['bytes'], 0, engine)
+            self.assertGreaterEqual(stats['engine']['lockwait'], 0, engine)
+
+    def test_promotions(self):
+        self._use(Cache('file', self.filename))
+        cache = Cache('file', self.filename)
+        cache.get('k1')
+        cache.get('k1')
+        stats = cache.stats()
+        self.assertEqual((stats['promotions'], stats['hits']), (1, 1))
+
+    def test_reset(self):
+        cache = Cache('file', self.filename)
+        self._use(cache)
+        cache.reset_stats()
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['puts'],
+                          stats['get']['count'], stats['engine']['puts']),
+                         (0, 0, 0, 0, 0))
+        # storage is still measured
+        self.assertGreater(stats['engine']['bytes'], 0)
+
+
+class ModuleStatsTests(ReplayTestCase):
+
+    def test_get_stats(self):
+        self.tape('movie/550', {'id': 550})
+        Request('movie/550').readJSON()
+        Request('movie/550').readJSON()
+        stats = tmdb3.get_stats()
+        self.assertEqual(sorted(stats),
+                         ['breaker', 'cache', 'limiter', 'pool'])
+        self.assertEqual((stats['cache']['hits'], stats['cache']['misses'],
+                          stats['limiter']['requests']), (1, 1, 1))
+        json.dumps(stats)
+
+        tmdb3.reset_stats()
+        stats = tmdb3.get_stats()
+        self.assertEqual((stats['cache']['hits'],
+                          stats['limiter']['requests']), (0, 0))
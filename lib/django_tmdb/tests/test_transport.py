@@ -0,0 +1,126 @@
+from django.test import SimpleTestCase
+from tmdb3.transport import Transports, ReplayTransport, UrllibTransport
+from tmdb3.tmdb_exceptions import TMDBTransportError
+from .server import Server
+import tmdb3
+import tempfile
+import shutil
+import json
+import time
+import os
+
+
+class ReplayTransportTests(SimpleTestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cassette = os.path.join(self.tmpdir, 'cassette.json')
+        self.server = Server()
+
+    def tearDown(self):
+        self.server.stop()
+        shutil.rmtree(self.tmpdir)
+
+    def _record(self, *paths):
+        recorder = Transports['replay']()
+        recorder.configure(self.cassette, record=True,
+                           transport=UrllibTransport())
+        for path in paths:
+            recorder.urlopen('GET', self.server.url + path)
+
+    def test_registered(self):
+        self.assertIs(Transports['replay'], ReplayTransport)
+        with self.assertRaises(TMDBTransportError):
+            tmdb3.set_transport('missing')
+
+    def test_record_and_replay(self):
+        self._record('movie/550?api_key=secret')
+        player = ReplayTransport()
+        player.configure(self.cassette)
+        resp = player.urlopen('GET', 'http://api.themoviedb.org/movie/550' +
+                                     '?api_key=other')
+        self.assertEqual(resp.status, 200)
+        self.assertEqual(json.loads(resp.read().decode('utf-8')),
+                         {'path': '/movie/550?api_key=secret'})
+        with open(self.cassette) as fd:
+            self.assertNotIn('secret', json.load(fd)[0]['request'])
+
+    def test_credentials_scrubbed(self):
+        self.server.responses['/authentication/session/new'] = \
+                (200, {}, {'success': True, 'session_id': 'secret-session'})
+        # rather than echoing the path
+        for path in ('/authentication/token/validate_with_login',
+                     '/movie/550/rating'):
+            self.server.responses[path] = (200, {}, {'success': True})
+        recorder = Transports['replay']()
+        recorder.configure(self.cassette, record=True,
+                           transport=UrllibTransport())
+        recorder.urlopen('GET', self.server.url + 'authentication/session/' +
+                         'new?api_key=secret-key&request_token=secret-token')
+        recorder.urlopen('POST', self.server.url + 'authentication/token/' +
+                         'validate_with_login?api_key=secret-key',
+                         b'username=secret-user&password=secret-pass&' +
+                         b'request_token=secret-token')
+        recorder.urlopen('POST', self.server.url + 'movie/550/rating' +
+                         '?session_id=secret-session', b'value=8.5')
+        with open(self.cassette) as fd:
+            self.assertNotIn('secret', fd.read())
+
+        player = ReplayTransport()
+        player.configure(self.cassette)
+        resp = player.urlopen('GET', self.server.url + 'authentication/' +
+                              'session/new?request_token=other')
+        self.assertEqual(json.loads(resp.read().decode('utf-8')),
+                         {'success': True, 'session_id': 'scrubbed'})
+        resp = player.urlopen('POST', self.server.url + 'movie/550/rating' +
+                              '?session_id=other', b'value=8.5')
+        self.assertEqual(resp.status, 200)
+        resp = player.urlopen('POST', self.server.url + 'authentication/' +
+                              'token/validate_with_login',
+                              b'username=u&password=p&request_token=t')
+        self.assertEqual(resp.status, 200)
+
+    def test_old_cassette_scrubbed(self):
+        with open(self.cassette, 'w') as fd:
+            json.dump([{'request': 'POST /movie/550/rating?' +
+                                   'session_id=secret value=8.5',
+                        'status': 201, 'reason': 'Created',
+                        'headers': [], 'body': '{}'}], fd)
+        player = ReplayTransport()
+        player.configure(self.cassette)
+        resp = player.urlopen('POST', self.server.url + 'movie/550/rating' +
+                              '?session_id=other', b'value=8.5')
+        self.assertEqual(resp.status, 201)
+
+    def test_recordings_played_in_turn(self):
+        self.server.responses['/movie/550'] = (503, {}, {})
+        self._record('movie/550')
+        self.server.responses['/movie/550'] = (200, {}, {'id': 550})
+        self._record('movie/550')
+        player = ReplayTransport()
+        player.configure(self.cassette)
+        statuses = [player.urlopen('GET', self.server.url + 'movie/550').status
+                    for i in range(3)]
+        self.assertEqual(statuses, [503, 200, 200])
+
+    def test_argument_order_ignored(self):
+        self._record('search/movie?query=club&page=1')
+        player = ReplayTransport()
+        player.configure(self.cassette)
+        resp = player.urlopen('GET', self.server.url +
+                                     'search/movie?page=1&query=club')
+        self.assertEqual(resp.status, 200)
+
+    def test_missing(self):
+        player = ReplayTransport()
+        player.configure(None)
+        with self.assertRaises(TMDBTransportError):
+            player.urlopen('GET', self.server.url + 'movie/550')
+
+    def test_latency(self):
+        self._record('movie/550')
+        player = ReplayTransport()
+        player.configure(self.cassette, latency=(0.1, 0.2))
+        start = time.time()
+        player.urlopen('GET', self.server.url + 'movie/550')
+        self.assertGreaterEqual(time.time() - start, 0.1)
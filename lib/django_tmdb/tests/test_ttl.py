@@ -0,0 +1,95 @@
+from django.test import SimpleTestCase
+from tmdb3.request import Request, TTLPolicy, DEFAULT_TTLS
+from tmdb3 import request
+from .base import ReplayTestCase
+import tmdb3
+
+
+class TTLPolicyTests(SimpleTestCase):
+
+    def test_first_match(self):
+        policy = TTLPolicy([('movie/*/images', 60), ('movie/*', 600)], 5)
+        self.assertEqual(policy.lifetime('movie/550/images'), 60)
+        self.assertEqual(policy.lifetime('/movie/550/'), 600)
+        self.assertEqual(policy.lifetime('tv/1'), 5)
+
+    def test_whole_path(self):
+        policy = TTLPolicy({'account': 300}, 5)
+        self.assertEqual(policy.lifetime('account'), 300)
+        self.assertEqual(policy.lifetime('account/1/lists'), 5)
+
+    def test_defaults(self):
+        policy = TTLPolicy(DEFAULT_TTLS)
+        self.assertEqual(policy.lifetime('configuration'), 7*24*60*60)
+        self.assertEqual(policy.lifetime('account/1/rated/movies'), 5*60)
+        self.assertEqual(policy.lifetime('movie/popular'), 60*60)
+        self.assertEqual(policy.lifetime('movie/550'), 24*60*60)
+        self.assertEqual(policy.lifetime('unknown'), 3600)
+
+
+class RequestTTLTests(ReplayTestCase):
+
+    def _stored(self, req):
+        # lifetime of the record stored for the request
+        return request.cache._data[req.cachekey()].lifetime
+
+    def test_rules_take_precedence(self):
+        tmdb3.set_ttls({'movie/*': 120, 'configuration': 60}, default=30)
+        self.assertEqual(Request('movie/550').lifetime, 120)
+        self.assertEqual(Request('configuration').lifetime, 60)
+        # paths matching no given rule fall back to DEFAULT_TTLS
+        self.assertEqual(Request('tv/1').lifetime, 24*60*60)
+        self.assertEqual(Request('unknown').lifetime, 30)
+
+    def test_set_cache_keeps_engine(self):
+        engine = request.cache._engine
+        tmdb3.set_cache(ttls={'movie/*': 120})
+        self.assertIs(request.cache._engine, engine)
+        self.assertEqual(Request('movie/550').lifetime, 120)
+
+    def test_stored_with_policy_lifetime(self):
+        self.tape('configuration', {})
+        req = Request('configuration')
+        req.readJSON()
+        self.assertEqual(self._stored(req), 7*24*60*60)
+
+    def test_per_call_override(self):
+        self.tape('movie/550', {'id': 550})
+        req = Request('movie/550')
+        req.lifetime = 42
+        req.readJSON()
+        self.assertEqual(self._stored(req), 42)
+
+    def test_not_cached(self):
+        match = self.tape('movie/550', {'id': 550})
+        self.tape('movie/550', {'id': 550})
+        for i in range(2):
+            req = Request('movie/550')
+            req.lifetime = 0
+            req.readJSON()
+        self.assertEqual(self.played(match), 2)
+
+    def test_max_age_shortens(self):
+        self.tape('movie/550', {'id': 550},
+                  headers={'Cache-Control': 'public, max-age=60'})
+        req = Request('movie/550')
+        req.readJSON()
+        self.assertEqual(self._stored(req), 60)
+
+    def test_max_age_does_not_extend(self):
+        self.tape('movie/550', {'id': 550},
+                  headers={'Cache-Control': 'max-age=31536000'})
+        req = Request('movie/550')
+        req.readJSON()
+        self.assertEqual(self._stored(req), 24*60*60)
+
+    def test_no_store(self):
+        for i, directive in enumerate(('no-store', 'Private')):
+            for j in range(2):
+                match = self.tape('account', {'id': 1},
+                                  headers={'Cache-Control': directive})
+            self.assertEqual(Request('account').readJSON(), {'id': 1})
+            self.assertEqual(Request('account').readJSON(), {'id': 1})
+            self.assertEqual(self.played(match), 2*(i+1))
+            self.assertNotIn(Request('account').cachekey(),
+                             request.cache._data)
@@ -4,7 +4,11 @@ from .tmdb_api import Configuration, searchMovie, searchMovieWithYear, \
                      searchPerson, searchStudio, searchList, searchCollection, \
                      searchSeries, Person, Movie, Collection, Genre, List, \
                      Series, Studio, Network, Episode, Season, __version__
-from .request import set_key, set_cache
+from .request import set_key, set_cache, set_ttls, set_cache_l1, \
+                     set_cache_grace, get_cache_stats, invalidate, \
+                     set_transport, set_pool, get_pool_stats, \
+                     set_ratelimit, get_ratelimit_stats, get_stats, \
+                     reset_stats, set_retry, set_circuit_breaker, AsyncRequest
 from .locales import get_locale, set_locale
 from .tmdb_auth import get_session, set_session
 from .cache_engine import CacheEngine
@@ -0,0 +1,94 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#-----------------------
+# Name: async_http.py
+# Python Library
+# Author: Raymond Wagner
+# Purpose: Minimal HTTP/1.1 client built on asyncio streams, for issuing
+#          API calls from within an event loop without blocking it
+#-----------------------
+
+from io import BytesIO
+from urllib.parse import urlsplit
+import http.client
+import asyncio
+
+from .http_pool import BufferedResponse
+
+
+async def _readchunked(reader):
+    body = BytesIO()
+    while True:
+        line = await reader.readline()
+        size = int(line.split(b';', 1)[0].strip(), 16)
+        if size == 0:
+            break
+        body.write(await reader.readexactly(size))
+        await reader.readline()
+    # discard any trailing headers
+    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+        pass
+    return body.getvalue()
+
+
+async def _exchange(method, url, body, headers):
+    parts = urlsplit(url)
+    secure = parts.scheme.lower() == 'https'
+    port = parts.port or (443 if secure else 80)
+    selector = parts.path or '/'
+    if parts.query:
+        selector += '?' + parts.query
+
+    reader, writer = await asyncio.open_connection(parts.hostname, port,
+                                                   ssl=secure or None)
+    try:
+        lines = ['{0} {1} HTTP/1.1'.format(method, selector),
+                 'Host: {0}'.format(parts.netloc),
+                 'Connection: close',
+                 'Accept-Encoding: identity']
+        for k, v in headers.items():
+            lines.append('{0}: {1}'.format(k, v))
+        if body is not None:
+            lines.append('Content-Length: {0}'.format(len(body)))
+        writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+        if body is not None:
+            writer.write(body)
+        await writer.drain()
+
+        statusline = (await reader.readline()).decode('latin-1')
+        version, status, reason = \
+                (statusline.rstrip('\r\n').split(' ', 2) + [''])[:3]
+        status = int(status)
+
+        head = BytesIO()
+        while True:
+            line = await reader.readline()
+            head.write(line)
+            if line in (b'\r\n', b'\n', b''):
+                break
+        head.seek(0)
+        msg = http.client.parse_headers(head)
+
+        if (method == 'HEAD') or (status in (204, 304)) or (status < 200):
+            data = b''
+        elif 'chunked' in msg.get('Transfer-Encoding', '').lower():
+            data = await _readchunked(reader)
+        elif msg.get('Content-Length') is not None:
+            data = await reader.readexactly(int(msg['Content-Length']))
+        else:
+            data = await reader.read()
+    finally:
+        writer.close()
+
+    return BufferedResponse(url, status, reason.strip(), msg, data)
+
+
+async def urlopen(method, url, body=None, headers=None, timeout=None):
+    """
+    Perform a request against the given URL, returning a fully read
+    BufferedResponse regardless of its HTTP status.
+    """
+    if headers is None:
+        headers = {}
+    return await asyncio.wait_for(_exchange(method, url, body, headers),
+                                  timeout)
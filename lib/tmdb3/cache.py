@@ -7,17 +7,48 @@
 # Purpose: Caching framework to store TMDb API results
 #-----------------------
 
+from collections import OrderedDict
+import threading
+import asyncio
+import heapq
 import time
 import os
 
 from .tmdb_exceptions import *
 from .cache_engine import Engines
+from .stats import Stats
 
 from . import cache_null
 from . import cache_file
+from . import cache_sharded
+from . import cache_log
+from . import cache_memory
+from . import cache_sqlite
 
 DEBUG = False
 
+# returned by a query function when the server reports that data held in
+# the cache is still current, in response to a conditional request
+NOT_MODIFIED = object()
+
+
+class Flight(object):
+    """
+    A query in progress, for concurrent callers to wait on the result of
+    rather than repeating it.
+    """
+    def __init__(self):
+        self.event = threading.Event()
+        self.data = None
+        self.error = None
+
+    def wait(self):
+        self.event.wait()
+        if self.error is not None:
+            raise self.error
+        return self.data
+
+
 class Cache(object):
     """
     This class implements a cache framework, allowing selecting of a
@@ -29,29 +60,184 @@ class Cache(object):
     wrapper will automatically cache the inputs and outputs of the
     wrapped function, pulling the output from local storage for
     subsequent calls with those inputs.
+
+    Expired data is retained for a further `retain` seconds, in order to
+    be served in place of fresh data while TMDb is unavailable.
+
+    Concurrent misses on the same key are coalesced, so that only the
+    first caller performs the query, and the rest share its result.
+
+    HTTP validators are stored alongside each record. When expired data
+    is still retained, the query is made conditional on it, and a
+    response of 304 Not Modified renews the existing record in place.
+    Records are held no longer than the max-age of the response, and
+    responses marked no-store or private are not stored.
+
+    Records are dropped once past retention through a heap ordered by
+    that deadline, so that only records actually due are visited.
+
+    Records are held in memory in a bounded L1 tier, in front of the
+    engine, which serves as a shared L2 tier. Writes go through to the
+    engine, and records read back from it are promoted into L1, where
+    the least recently used are dropped once more than `l1size` are
+    held. If `l1ttl` is set, records held longer than that are checked
+    against the engine again, to pick up changes by other processes. If
+    not, the engine may give its own, where it has no other way to learn
+    of them.
+
+    Records are stored with the `tags` of the request that produced them,
+    and may be removed individually with expire(), or together by tag
+    with invalidate().
+
+    Data expired within the last `grace` seconds may be served in place
+    of a fresh query, while it is refreshed once in the background, up
+    until the data is `maxage` seconds old, after which the query is
+    made directly.
+
+    If set, `migrate` is called with the key of each record read from
+    the engine, and returns the key it should now be stored under, or
+    None to discard it, allowing keys from older releases to be reused.
     """
+    retain = 60*60*24
+    migrate = None
+    l1size = 1024
+    l1ttl = None
+    grace = 0
+    maxage = None
+
     def __init__(self, engine=None, *args, **kwargs):
         self._engine = None
-        self._data = {}
+        self._data = OrderedDict()  # key -> object, by last use
+        self._promoted = {}         # key -> time read from the engine
+        self._heap = []
         self._age = 0
-        self._rate_limiter = []
+        self._lock = threading.RLock()
+        self._inflight = {}
+        self._ainflight = {}
+        self._refreshing = set()
+        self._stats = Stats(('hits', 'promotions', 'misses', 'stale',
+                             'refreshes', 'puts', 'evictions',
+                             'expirations'), ('get', 'put'))
         self.configure(engine, *args, **kwargs)
 
-    def _import(self, data=None):
+    def _import(self, data=None, promote=()):
+        # records already held in L1 are replaced with newer copies, while
+        # the rest are left in the engine, unless they are being promoted
         if data is None:
             data = self._engine.get(self._age)
         for obj in sorted(data, key=lambda x: x.creation):
-            self._rate_limiter.append(obj.creation)
-            if len(self._rate_limiter) > 30:
-                self._rate_limiter.pop(0)
-            if not obj.expired:
-                self._data[obj.key] = obj
-                self._age = max(self._age, obj.creation)
+            self._age = max(self._age, obj.creation)
+            if obj.overdue > self.retain:
+                continue
+            if self.migrate is not None:
+                key = self.migrate(obj.key)
+                if key is None:
+                    continue
+                if key != obj.key:
+                    obj.key = key
+            held = self._data.get(obj.key)
+            if obj.deleted:
+                # removed from the engine, by this or another process
+                if (held is not None) and (held.creation <= obj.creation):
+                    self._discard(obj.key)
+                continue
+            if (held is None) and (obj.key not in promote):
+                continue
+            if (held is not None) and (held.creation >= obj.creation):
+                # a copy of a record already held, such as one the engine
+                # returns again after it was written, is not another use
+                continue
+            self._data[obj.key] = obj
+            self._data.move_to_end(obj.key)
+            self._promoted[obj.key] = time.time()
+            heapq.heappush(self._heap,
+                    (obj.creation + obj.lifetime + self.retain, id(obj), obj))
+        self._trim()
+        if len(self._heap) > 2*len(self._data) + 64:
+            # too many entries for replaced records, so rebuild the heap
+            self._heap = [e for e in self._heap if self._data.get(e[2].key)
+                                                        is e[2]]
+            heapq.heapify(self._heap)
+
+    def _trim(self):
+        # drop the least recently used records, which remain in the engine
+        while len(self._data) > self.l1size:
+            key, obj = self._data.popitem(last=False)
+            del self._promoted[key]
+            self._stats.incr('evictions')
+
+    def _discard(self, key, obj=None):
+        # drop a record from L1, if it is still the one given
+        if (obj is None) or (self._data.get(key) is obj):
+            self._promoted.pop(key, None)
+            return self._data.pop(key, None) is not None
+        return False
+
+    def _aged(self, key):
+        # held in L1 for longer than it may go unchecked against the engine
+        ttl = self.l1ttl
+        if ttl is None:
+            ttl = self._engine.l1ttl
+        return (ttl is not None) and \
+               (time.time() - self._promoted.get(key, 0) > ttl)
+
+    def _held(self):
+        # keys held in L1, the only ones for which get() on the engine
+        # need return newer records
+        return list(self._data)
+
+    def _missing(self, key):
+        obj = self._data.get(key)
+        return (obj is None) or obj.expired or self._aged(key)
+
+    def _sync(self, keys=()):
+        # read new records from the engine, unless it reports that nothing
+        # has been written since it was last read, so a miss costs nothing
+        if self._engine.changed():
+            self._import(promote=set(keys))
 
     def _expire(self):
-        for k, v in self._data.items():
-            if v.expired:
-                del self._data[k]
+        # drop records past retention, skipping entries for records that
+        # have since been replaced or removed
+        now = time.time()
+        while self._heap and (self._heap[0][0] < now):
+            obj = heapq.heappop(self._heap)[2]
+            if self._discard(obj.key, obj):
+                self._stats.incr('expirations')
+
+    def _lookup(self, keys):
+        # promote records the engine holds for the given keys, where it
+        # has a newer copy than held locally
+        objs = []
+        found = set()
+        for obj in self._engine.lookup_many(keys):
+            found.add(obj.key)
+            if (obj.key not in self._data) or \
+                    (obj.creation > self._data[obj.key].creation):
+                objs.append(obj)
+            else:
+                # still current, so recheck only after another l1ttl
+                self._promoted[obj.key] = time.time()
+        for key in keys:
+            if (key not in found) and self._aged(key):
+                # removed from the engine since it was promoted
+                self._discard(key)
+        if objs:
+            self._import(objs, found)
+
+    def _load(self, keys):
+        # bring missing, expired, or aged records in from the engine
+        missing = [key for key in keys if self._missing(key)]
+        if missing:
+            self._sync(missing)
+            missing = [key for key in missing if self._missing(key)]
+        if missing:
+            self._lookup(missing)
+
+    @property
+    def engine(self):
+        """The engine storing records beyond this process."""
+        return self._engine
 
     def configure(self, engine, *args, **kwargs):
         if engine is None:
@@ -61,31 +247,313 @@ class Cache(object):
         self._engine = Engines[engine](self)
         self._engine.configure(*args, **kwargs)
 
-    def put(self, key, data, lifetime=60*60*12):
+    def configure_l1(self, maxentries=1024, ttl=None):
+        """
+        Set the limits of the in-memory tier, to at most `maxentries`
+        records, each checked against the engine again after `ttl`
+        seconds, or if None, after the engine's own l1ttl, if any, and
+        otherwise only once expired.
+        """
+        with self._lock:
+            self.l1size = maxentries
+            self.l1ttl = ttl
+            self._trim()
+
+    def configure_grace(self, grace=0, maxage=None):
+        """
+        Allow data expired within the last `grace` seconds to be served
+        while it is refreshed in the background, so long as it is no more
+        than `maxage` seconds old, or regardless of age if None.
+        """
+        with self._lock:
+            self.grace = grace
+            self.maxage = maxage
+
+    def stats(self):
+        """
+        Return a snapshot of the cache statistics:
+            hits        -- reads served from L1
+            promotions  -- reads served from the engine
+            misses      -- reads finding no current data
+            stale       -- reads served expired data while it is refreshed
+            refreshes   -- background refreshes started
+            puts        -- records written
+            evictions   -- records dropped from L1 to make space
+            expirations -- records dropped from L1 once past retention
+            entries     -- records held in L1
+            get, put    -- histograms of the time taken by each call
+            engine      -- statistics of the engine
+        """
+        with self._lock:
+            stats = self._stats.snapshot()
+            stats['entries'] = len(self._data)
+        stats['engine'] = self._engine.stats()
+        return stats
+
+    def reset_stats(self):
+        """Reset all counters of the cache, and of its engine."""
+        self._stats.reset()
+        self._engine.reset_stats()
+
+    def put(self, key, data, lifetime=60*60*12, meta=None):
         # pull existing data, so cache will be fresh when written back out
         if self._engine is None:
             raise TMDBCacheError("No cache engine configured")
-        self._expire()
-        self._import(self._engine.put(key, data, lifetime))
+        start = time.perf_counter()
+        with self._lock:
+            self._expire()
+            self._import(self._engine.put(key, data, lifetime, meta), (key,))
+        self._stats.incr('puts')
+        self._stats.observe('put', time.perf_counter() - start)
 
-    def get(self, key):
+    def get(self, key, stale=False, refresh=None):
+        """
+        Return data stored against the key, or None if there is none.
+        If `stale` is set, data that has expired but is still retained
+        will also be returned.
+
+        If `refresh` is given, data within the grace window is returned
+        as well, and refresh() is run in the background to replace it.
+        It is called once per key at a time, from a new thread, or as a
+        task on the running event loop if it is a coroutine function.
+        """
         if self._engine is None:
             raise TMDBCacheError("No cache engine configured")
-        self._expire()
-        if key not in self._data:
-            self._import()
+        start = time.perf_counter()
         try:
-            return self._data[key].data
-        except:
-            # no cache data, so we're going to query
-            # wait to ensure proper rate limiting
-            if len(self._rate_limiter) == 30:
-                w = 10 - (time.time() - self._rate_limiter.pop(0))
-                if (w > 0):
+            return self._get(key, stale, refresh)
+        finally:
+            self._stats.observe('get', time.perf_counter() - start)
+
+    def _get(self, key, stale, refresh):
+        with self._lock:
+            self._expire()
+            held = self._data.get(key)
+            if self._missing(key):
+                self._load([key])
+            obj = self._data.get(key)
+            if (obj is not None) and obj.expired and not stale:
+                if (refresh is not None) and \
+                        obj.graceful(self.grace, self.maxage):
+                    # serve expired data, while it is replaced
+                    self._stats.incr('stale')
+                    self._refresh(key, refresh)
+                    return obj.data
+                obj = None
+            if obj is None:
+                # no cache data, so we're going to query
+                self._stats.incr('misses')
+                return None
+            self._data.move_to_end(key)
+            self._engine.touch(obj)
+            if obj is held:
+                self._stats.incr('hits')
+            else:
+                self._stats.incr('promotions')
+        return obj.data
+
+    def expire(self, key):
+        """
+        Remove the record stored against the key, from the engine and so
+        from every process sharing it, once each next checks the copy it
+        holds in L1 against the engine.
+        """
+        if self._engine is None:
+            raise TMDBCacheError("No cache engine configured")
+        with self._lock:
+            self._import(self._engine.expire(key) or [])
+            self._discard(key)
+
+    def invalidate(self, tag):
+        """
+        Remove every record carrying the given tag, from the engine and so
+        from every process sharing it, once each next checks the copies it
+        holds in L1 against the engine.
+        """
+        if self._engine is None:
+            raise TMDBCacheError("No cache engine configured")
+        with self._lock:
+            self._import(self._engine.invalidate(tag) or [])
+            for key in [key for key, obj in self._data.items()
+                                         if tag in obj.tags]:
+                self._discard(key)
+
+    def _current(self, key):
+        # as get(), but not counted as another read
+        with self._lock:
+            self._expire()
+            self._load([key])
+            obj = self._data.get(key)
+            if (obj is None) or obj.expired:
+                return None
+            return obj.data
+
+    def _refresh(self, key, refresh):
+        # start a refresh of the key, unless one is already running
+        if key in self._refreshing:
+            return
+        self._refreshing.add(key)
+        self._stats.incr('refreshes')
+        if DEBUG:
+            print("refreshing {0} in the background".format(key))
+
+        def done():
+            with self._lock:
+                self._refreshing.discard(key)
+
+        if asyncio.iscoroutinefunction(refresh):
+            async def run():
+                try:
+                    await refresh()
+                except Exception as e:
+                    # expired data continues to be served until replaced
+                    if DEBUG:
+                        print("refresh of {0} failed: {1}".format(key, e))
+                finally:
+                    done()
+            asyncio.get_running_loop().create_task(run())
+        else:
+            def run():
+                try:
+                    refresh()
+                except Exception as e:
                     if DEBUG:
-                        print("rate limiting - waiting {0} seconds".format(w))
-                    time.sleep(w)
+                        print("refresh of {0} failed: {1}".format(key, e))
+                finally:
+                    done()
+            threading.Thread(target=run, daemon=True).start()
+
+    def prefetch(self, keys):
+        """
+        Load any missing or expired records for the given keys from the
+        engine in one batch, ahead of them being read individually.
+        Returns the set of keys holding current data.
+        """
+        if self._engine is None:
+            raise TMDBCacheError("No cache engine configured")
+        with self._lock:
+            self._expire()
+            self._load(keys)
+            return set(key for key in keys if (key in self._data)
+                                              and not self._data[key].expired)
+
+    def _revalidate(self, key, inst):
+        # make the query conditional on any retained copy of the data
+        with self._lock:
+            obj = self._data.get(key)
+        if (obj is None) or (inst is None) or not obj.meta:
             return None
+        inst.revalidate(obj.meta)
+        return obj
+
+    def _store(self, key, data, lifetime, inst, obj):
+        meta = dict(getattr(inst, 'meta', None) or {})
+        if getattr(inst, 'tags', None):
+            meta['tags'] = list(inst.tags)
+        if data is NOT_MODIFIED:
+            if DEBUG:
+                print("revalidated {0}".format(key))
+            data = obj.data
+            meta = dict(obj.meta, **meta)
+        if meta.get('nostore'):
+            # the server asked that the response not be kept
+            return data
+        if lifetime is None:
+            lifetime = 60*60*12
+        # the lifetime given is an upper bound, so never hold data for
+        # longer than the server considers it fresh
+        if 'maxage' in meta:
+            lifetime = min(lifetime, meta['maxage'])
+        self.put(key, data, lifetime, meta)
+        return data
+
+    def fetch(self, key, func, lifetime=None, inst=None):
+        """
+        Populate a missing key from the given function, and return the
+        result. Only one caller per key performs the query at a time,
+        within this process through a map of queries in flight, and
+        across processes through the engine's lock. Other callers wait
+        for that result, or error, instead of repeating the query.
+
+        If given, `inst` is the request behind the query. It is passed
+        the validators of any retained data through its revalidate()
+        method, and its `meta` attribute is stored with the result.
+        """
+        with self._lock:
+            flight = self._inflight.get(key)
+            if flight is not None:
+                leader = False
+            else:
+                leader = True
+                flight = self._inflight[key] = Flight()
+        if not leader:
+            if DEBUG:
+                print("waiting on query in flight for {0}".format(key))
+            return flight.wait()
+
+        try:
+            with self._engine.lock(key):
+                # another process may have completed the query while
+                # this one waited for the lock
+                data = self._current(key)
+                if data is None:
+                    obj = self._revalidate(key, inst)
+                    data = self._store(key, func(), lifetime, inst, obj)
+            flight.data = data
+            return data
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            flight.event.set()
+
+    async def afetch(self, key, func, lifetime=None, inst=None):
+        """
+        Awaitable counterpart to fetch(), for a coroutine function.
+        Coroutines on the same event loop share a single query. The
+        engine's lock is not taken, as waiting on it would block the loop.
+        """
+        flightkey = (asyncio.get_running_loop(), key)
+        with self._lock:
+            future = self._ainflight.get(flightkey)
+            if future is not None:
+                leader = False
+            else:
+                leader = True
+                future = self._ainflight[flightkey] = \
+                                flightkey[0].create_future()
+        if not leader:
+            return await asyncio.shield(future)
+
+        try:
+            obj = self._revalidate(key, inst)
+            data = self._store(key, await func(), lifetime, inst, obj)
+            future.set_result(data)
+            return data
+        except Exception as e:
+            future.set_exception(e)
+            # mark as retrieved, in case there were no other callers
+            future.exception()
+            raise
+        finally:
+            with self._lock:
+                del self._ainflight[flightkey]
+
+    def fallback(self, key, error):
+        """
+        Return expired data to stand in for a query that failed because
+        TMDb is unavailable, or re-raise the error if there is none.
+        """
+        if isinstance(error, TMDBOffline) or \
+                (isinstance(error, TMDBHTTPError) and error.httperrno >= 500):
+            data = self.get(key, stale=True)
+            if data is not None:
+                if DEBUG:
+                    print("serving expired data for {0}".format(key))
+                return data
+        raise error
 
     def cached(self, callback):
         """
@@ -126,13 +594,16 @@ class Cache(object):
                 return self.func(*args, **kwargs)
             else:
                 key = self.callback()
-                data = self.cache.get(key)
+                query = lambda: self.cache.fetch(key,
+                                    lambda: self.func(*args, **kwargs),
+                                    getattr(self.inst, 'lifetime', None),
+                                    self.inst)
+                data = self.cache.get(key, refresh=query)
                 if data is None:
-                    data = self.func(*args, **kwargs)
-                    if hasattr(self.inst, 'lifetime'):
-                        self.cache.put(key, data, self.inst.lifetime)
-                    else:
-                        self.cache.put(key, data)
+                    try:
+                        data = query()
+                    except (TMDBOffline, TMDBHTTPError) as e:
+                        return self.cache.fallback(key, e)
                 return data
 
         def __get__(self, inst, owner):
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#-----------------------
+# Name: cache_codec.py
+# Python Library
+# Author: Raymond Wagner
+# Purpose: Serialization and compression of records stored by persistent
+#          cache engines
+#-----------------------
+
+import zlib
+import json
+
+try:
+    import lzma
+except ImportError:
+    # not included in every Python build
+    lzma = None
+
+try:
+    import msgpack
+except ImportError:
+    # optional, for a smaller and faster binary encoding
+    msgpack = None
+
+from .tmdb_exceptions import *
+
+####################
+# Record Encoding
+#------------------
+# codec tag             (1) unsigned char
+# payload               (?) serialized, then optionally compressed
+#
+# The tag has its high bit set, followed by three bits identifying the
+# serializer, and four the compressor. Records written before codecs were
+# introduced are plain JSON text, and so start with an ASCII character.
+# Serializers are numbered 1 for JSON, and 3 for msgpack.
+####################
+
+
+def _json_dumps(value):
+    return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+
+def _json_loads(data):
+    return json.loads(data.decode('utf-8'))
+
+
+def _msgpack_dumps(value):
+    return msgpack.packb(value, use_bin_type=True)
+
+
+def _msgpack_loads(data):
+    return msgpack.unpackb(data, raw=False)
+
+
+# serializer 2 was marshal, whose records are no longer read, as cache
+# files may be shared with other users, and loading marshal data from an
+# untrusted source is unsafe. msgpack, like JSON, only builds plain data
+serializers = {'json': (1, _json_dumps, _json_loads)}
+if msgpack is not None:
+    serializers['msgpack'] = (3, _msgpack_dumps, _msgpack_loads)
+
+compressors = {None:   (0, None, None),
+               'zlib': (1, zlib.compress, zlib.decompress)}
+if lzma is not None:
+    compressors['lzma'] = (2, lzma.compress, lzma.decompress)
+
+
+class Codec(object):
+    """
+    Encodes records with the named serializer, compressing those at least
+    `threshold` bytes long with the named compressor, if any. Small records
+    gain little from compression, and are stored as they are.
+
+    Records are serialized as JSON, or with msgpack, where it is installed.
+    Records written with msgpack cannot be read by processes without it.
+    """
+    threshold = 512
+
+    def __init__(self, serializer='json', compressor=None):
+        if serializer not in serializers:
+            raise TMDBCacheError("Invalid cache serializer specified: " +
+                                 str(serializer))
+        if compressor not in compressors:
+            raise TMDBCacheError("Invalid cache compressor specified: " +
+                                 str(compressor))
+        self.serializer = serializer
+        self.compressor = compressor
+        self._serializer = serializers[serializer]
+        self._compressor = compressors[compressor]
+
+    def dumps(self, value):
+        sid, dumps, _ = self._serializer
+        cid, compress, _ = self._compressor
+        payload = dumps(value)
+        if (compress is None) or (len(payload) < self.threshold):
+            cid = 0
+        else:
+            payload = compress(payload)
+        return bytes([0x80 | (sid << 4) | cid]) + payload
+
+
+_decoders = dict((sid, loads) for sid, _, loads in serializers.values())
+_decompressors = dict((cid, decompress)
+                      for cid, _, decompress in compressors.values())
+
+
+def decode(data):
+    """
+    Return the value held in an encoded record, from any codec, or from
+    plain JSON text as written by older releases.
+    """
+    if isinstance(data, str):
+        return json.loads(data)
+    tag = data[0] if len(data) else 0
+    if not tag & 0x80:
+        return json.loads(data.decode('utf-8'))
+    try:
+        loads = _decoders[(tag >> 4) & 0x7]
+        decompress = _decompressors[tag & 0xF]
+    except KeyError:
+        raise TMDBCacheError("Unsupported cache record encoding: " +
+                             hex(tag))
+    payload = data[1:]
+    if decompress is not None:
+        payload = decompress(payload)
+    return loads(payload)
@@ -7,9 +7,12 @@
 # Purpose: Base cache engine class for collecting registered engines
 #-----------------------
 
+import contextlib
 import time
 from weakref import ref
 
+from .stats import Stats
+
 
 class Engines(object):
     """
@@ -45,39 +48,148 @@ class CacheEngineType(type):
 
 class CacheEngine(object, metaclass=CacheEngineType):
     name = 'unspecified'
+    # seconds the parent holds a record read from the engine before checking
+    # it again, where it has no l1ttl of its own. engines that only find
+    # records removed by other processes by looking each up again give one,
+    # so that the removal reaches every process within that time
+    l1ttl = None
 
     def __init__(self, parent):
         self.parent = ref(parent)
+        self._stats = Stats(('puts', 'evictions', 'expirations', 'lockwait'))
 
     def configure(self):
         raise RuntimeError
     def get(self, date):
         raise RuntimeError
-    def put(self, key, value, lifetime):
+    def put(self, key, value, lifetime, meta=None):
         raise RuntimeError
     def expire(self, key):
         raise RuntimeError
 
+    def invalidate(self, tag):
+        """
+        Remove every record carrying the given tag. Engines with storage
+        shared between processes must make the removal visible to other
+        users of it, such as by writing tombstones in place of records.
+        Like expire(), may return records newly read from storage, as
+        put() does.
+        """
+        raise RuntimeError
+
+    def stats(self):
+        """
+        Return a snapshot of the engine statistics:
+            puts        -- records written
+            evictions   -- records dropped to make space
+            expirations -- records dropped once past retention
+            lockwait    -- total seconds spent waiting on locks
+        Engines able to measure their storage add it as 'bytes'.
+        """
+        return self._stats.snapshot()
+
+    def reset_stats(self):
+        self._stats.reset()
+
+    def changed(self):
+        """
+        Return whether records may have been added by another user of the
+        engine's storage since it was last read, to allow a miss to skip
+        reading it again. Engines unable to tell always return True.
+        """
+        return True
+
+    def lookup(self, key):
+        """
+        Return the record stored against a single key, or None. Engines
+        backed by a key/value store, which cannot list the records added
+        since a date, return nothing from get() and implement this instead.
+        """
+        return None
+
+    def lookup_many(self, keys):
+        """Return the records stored against any of the given keys."""
+        return [obj for obj in map(self.lookup, keys) if obj is not None]
+
+    def touch(self, obj):
+        """
+        Note a read of the given record, including one served from the
+        parent's L1, for engines evicting records by use.
+        """
+        pass
+
+    @contextlib.contextmanager
+    def _waiting(self, lock):
+        # hold the given lock, counting the time spent waiting to take it
+        start = time.perf_counter()
+        with lock:
+            self._stats.incr('lockwait', time.perf_counter() - start)
+            yield
+
+    @contextlib.contextmanager
+    def lock(self, key):
+        """
+        Hold a lock on the given key across all processes sharing this
+        engine's storage. Engines with no shared storage need not lock.
+        """
+        yield
+
 
 class CacheObject(object):
     """
-    Cache object class, containing one stored record.
+    Cache object class, containing one stored record, along with a
+    dictionary of metadata, such as the HTTP validators returned with it,
+    and the tags used to invalidate related records together. An object
+    marked 'deleted' in its metadata is a tombstone, recording that the
+    key was removed.
     """
 
-    def __init__(self, key, data, lifetime=0, creation=None):
+    def __init__(self, key, data, lifetime=0, creation=None, meta=None):
         self.key = key
         self.data = data
         self.lifetime = lifetime
         self.creation = creation if creation is not None else time.time()
+        self.meta = meta if meta is not None else {}
 
     def __len__(self):
         return len(self.data)
 
+    @classmethod
+    def tombstone(cls, key, lifetime=0, **kwargs):
+        return cls(key, None, lifetime, meta={'deleted': True}, **kwargs)
+
+    @property
+    def tags(self):
+        return self.meta.get('tags', ())
+
+    @property
+    def deleted(self):
+        return bool(self.meta.get('deleted'))
+
     @property
     def expired(self):
-        return self.remaining == 0
+        return time.time() >= self.creation + self.lifetime
 
     @property
     def remaining(self):
         return max((self.creation + self.lifetime) - time.time(), 0)
 
+    @property
+    def overdue(self):
+        """Time in seconds since the object expired."""
+        return max(time.time() - (self.creation + self.lifetime), 0)
+
+    @property
+    def age(self):
+        """Time in seconds since the object was created."""
+        return max(time.time() - self.creation, 0)
+
+    def graceful(self, grace, maxage=None):
+        """
+        Return whether the object has expired within the last `grace`
+        seconds, and is no more than `maxage` seconds old, so that it may
+        still be served while it is refreshed.
+        """
+        return self.expired and (self.overdue <= grace) and \
+               ((maxage is None) or (self.age <= maxage))
+
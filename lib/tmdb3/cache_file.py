@@ -9,17 +9,25 @@
 #          access.
 #-----------------------
 
+import contextlib
+import functools
+import threading
 import struct
 import errno
-import json
+import zlib
 import time
 import os
 import io
 
-from io import StringIO
+from io import BytesIO
+from weakref import ref
 
 from .tmdb_exceptions import *
 from .cache_engine import CacheEngine, CacheObject
+from .cache_codec import Codec, decode
+from .stats import Stats
+
+DEBUG = False
 
 ####################
 # Cache File Format
@@ -29,21 +37,35 @@ from .cache_engine import CacheEngine, CacheObject
 # slot 0: timestamp     (8) double
 # slot 0: lifetime      (4) unsigned int
 # slot 0: seek point    (4) unsigned int
+# slot 0: length        (4) unsigned int
+# slot 0: key hash      (4) unsigned int
+# slot 0: last use      (4) unsigned int
+# slot 0: use count     (4) unsigned int
 # slot 1: timestamp
 # slot 1: lifetime          index slots are IDd by their query date and
-# slot 1: seek point        are filled incrementally forwards. lifetime
+#   ....                    are filled incrementally forwards. lifetime
 #   ....                    is how long after query date before the item
-#   ....                    expires, and seek point is the location of the
-# slot N-2: timestamp       start of data for that entry. 256 empty slots
-# slot N-2: lifetime        are pre-allocated, allowing fast updates.
-# slot N-2: seek point      when all slots are filled, the cache file is
-# slot N-1: timestamp       rewritten from scrach to add more slots.
-# slot N-1: lifetime
-# slot N-1: seek point
-# block 1               (?) ASCII
+#   ....                    expires, seek point and length locate the
+# slot N-1: timestamp       data for that entry, and key hash is the CRC32
+# slot N-1: lifetime        of its key, so that a single record can be
+# slot N-1: seek point      found and read without decoding any other.
+# slot N-1: length          last use and use count are updated in place,
+# slot N-1: key hash        to choose which records to evict. 256 empty
+# slot N-1: last use        slots are pre-allocated, allowing fast
+# slot N-1: use count       updates. when all slots are filled, those of
+#                           records no longer current are reclaimed, or
+#                           more are added, by moving the records in the
+#                           way to the end of the file.
+# block 1               (?) binary
 # block 2
-#    ....                   blocks are just simple ASCII text, generated
-#    ....                   as independent objects by the JSON encoder
+#    ....                   blocks are independent records, each encoded
+#    ....                   by the engine's codec. version 2 and 3 files
+#    ....                   have slots holding only the first three
+#    ....                   fields, and are indexed by decoding every
+#    ....                   record. version 2 files hold plain JSON text,
+#    ....                   and version 4 slots lack the last two fields.
+#    ....                   all are still read, but are rewritten as
+#    ....                   version 5 before being added to.
 # block N-2
 # block N-1
 #
@@ -53,6 +75,38 @@ from .cache_engine import CacheEngine, CacheObject
 def _donothing(*args, **kwargs):
     pass
 
+
+_ranges = {}  # (device, inode, offset) -> [lock, count of users]
+_ranges_lock = threading.Lock()
+
+
+class _ThreadRange(object):
+    """
+    Context manager excluding other threads from a single byte of a file.
+    Record locks are held by the process rather than the thread, so two
+    threads of a process would otherwise both hold the same byte, and
+    the first to unlock it would free it for the other as well.
+    """
+    def __init__(self, fileobj, offset):
+        self.fileobj = fileobj
+        self.offset = offset
+
+    def __enter__(self):
+        st = os.fstat(self.fileobj.fileno())
+        self.key = (st.st_dev, st.st_ino, self.offset)
+        with _ranges_lock:
+            entry = _ranges.setdefault(self.key, [threading.Lock(), 0])
+            entry[1] += 1
+        entry[0].acquire()
+
+    def __exit__(self, exc_type, exc_value, exc_tb):
+        with _ranges_lock:
+            entry = _ranges[self.key]
+            entry[0].release()
+            entry[1] -= 1
+            if not entry[1]:
+                del _ranges[self.key]
+
 try:
     import fcntl
     class Flock(object):
@@ -81,6 +135,27 @@ try:
             fcntl.flock(self.fileobj, fcntl.LOCK_UN)
             return suppress
 
+    class RangeLock(_ThreadRange):
+        """
+        Context manager to lock a single byte of a file, allowing many
+        independent locks to be taken against one lock file. These are
+        fcntl record locks, which do not interact with flock, taken once
+        other threads of the process are excluded.
+        """
+        def __enter__(self):
+            super(RangeLock, self).__enter__()
+            try:
+                fcntl.lockf(self.fileobj, fcntl.LOCK_EX, 1, self.offset)
+            except:
+                super(RangeLock, self).__exit__(None, None, None)
+                raise
+
+        def __exit__(self, exc_type, exc_value, exc_tb):
+            try:
+                fcntl.lockf(self.fileobj, fcntl.LOCK_UN, 1, self.offset)
+            finally:
+                super(RangeLock, self).__exit__(exc_type, exc_value, exc_tb)
+
     def parse_filename(filename):
         if '$' in filename:
             # replace any environmental variables
@@ -116,6 +191,25 @@ except ImportError:
             msvcrt.locking(self.fileobj.fileno(), msvcrt.LK_UNLCK, self.size)
             return suppress
 
+    class RangeLock(_ThreadRange):
+        def __enter__(self):
+            super(RangeLock, self).__enter__()
+            self.fileobj.seek(self.offset)
+            while True:
+                try:
+                    msvcrt.locking(self.fileobj.fileno(), msvcrt.LK_LOCK, 1)
+                    return
+                except IOError:
+                    # LK_LOCK gives up after 10 seconds, keep waiting
+                    continue
+
+        def __exit__(self, exc_type, exc_value, exc_tb):
+            try:
+                self.fileobj.seek(self.offset)
+                msvcrt.locking(self.fileobj.fileno(), msvcrt.LK_UNLCK, 1)
+            finally:
+                super(RangeLock, self).__exit__(exc_type, exc_value, exc_tb)
+
     def parse_filename(filename):
         if '%' in filename:
             # replace any environmental variables
@@ -134,22 +228,90 @@ except ImportError:
         return os.path.expandvars(os.path.join('%TEMP%', filename))
 
 
+class _TagIndex(object):
+    """
+    Keys and tags of the records an engine has decoded, by creation time,
+    so that those carrying a tag can be found without decoding every
+    record again. Records are never changed once written, so an entry
+    holds for as long as its record is kept.
+    """
+    def __init__(self):
+        self.keys = {}  # creation time -> key and tags
+        self.tags = {}  # tag -> creation times of records carrying it
+
+    def __contains__(self, creation):
+        return creation in self.keys
+
+    def add(self, creation, key, tags=()):
+        if creation in self.keys:
+            return
+        self.keys[creation] = (key, tuple(tags))
+        for tag in tags:
+            self.tags.setdefault(tag, set()).add(creation)
+
+    def key(self, creation):
+        return self.keys[creation][0]
+
+    def tagged(self, tag):
+        return self.tags.get(tag, ())
+
+    def prune(self, held):
+        # drop the entries of records no longer held
+        for creation in [c for c in self.keys if c not in held]:
+            for tag in self.keys.pop(creation)[1]:
+                creations = self.tags[tag]
+                creations.discard(creation)
+                if not creations:
+                    del self.tags[tag]
+
+
+@functools.lru_cache(maxsize=4096)
+def _keyhash(key):
+    return zlib.crc32(key.encode('utf-8'))
+
+
 class FileCacheObject(CacheObject):
-    _struct = struct.Struct('dII')  # double and two ints
-                                    # timestamp, lifetime, position
+    _struct = struct.Struct('dIIIIII')  # double and six ints
+                                        # timestamp, lifetime, position,
+                                        # length, key hash, last use,
+                                        # use count
+    _structs = {2: struct.Struct('dII'),
+                3: struct.Struct('dII'),
+                4: struct.Struct('dIIII'),
+                5: _struct}
+    _empty = _struct.pack(0, 0, 0, 0, 0, 0, 0)
+
+    @classmethod
+    def readSlots(cls, fd, count, version=5):
+        # the whole slot table, as tuples of the version 5 fields, where
+        # older versions lack the use of each record, and before version
+        # 4, the length and key hash
+        slot = cls._structs[version]
+        slots = slot.iter_unpack(fd.read(slot.size*count))
+        if version >= 5:
+            return list(slots)
+        if version == 4:
+            return [dat + (0, 0) for dat in slots]
+        return [dat + (None, None, 0, 0) for dat in slots]
 
     @classmethod
-    def fromFile(cls, fd):
-        dat = cls._struct.unpack(fd.read(cls._struct.size))
-        obj = cls(None, None, dat[1], dat[0])
-        obj.position = dat[2]
+    def fromSlot(cls, creation, slot, codec=None):
+        lifetime, position, size, keyhash = slot
+        obj = cls(None, None, lifetime, creation, codec=codec)
+        obj.position = position
+        obj.size = size
+        obj.keyhash = keyhash
+        obj._meta = None
         return obj
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, codec=None, **kwargs):
+        self.keyhash = None
         self._key = None
         self._data = None
+        self._meta = None
         self._size = None
-        self._buff = StringIO()
+        self._buff = BytesIO()
+        self._codec = codec if codec is not None else Codec()
         super(FileCacheObject, self).__init__(*args, **kwargs)
 
     @property
@@ -158,10 +320,11 @@ class FileCacheObject(CacheObject):
             self._buff.seek(0, 2)
             size = self._buff.tell()
             if size == 0:
-                if (self._key is None) or (self._data is None):
+                if self._key is None:
                     raise RuntimeError
-                json.dump([self.key, self.data], self._buff)
-                self._size = self._buff.tell()
+                self._buff.write(self._codec.dumps(
+                                    [self.key, self.data, self.meta]))
+                size = self._buff.tell()
             self._size = size
         return self._size
 
@@ -169,66 +332,157 @@ class FileCacheObject(CacheObject):
     def size(self, value):
         self._size = value
 
+    def _parse(self):
+        # records hold the key, data, and optionally, metadata
+        record = decode(self._buff.getvalue())
+        self._key, self._data = record[:2]
+        self._meta = record[2] if len(record) > 2 else {}
+
     @property
     def key(self):
         if self._key is None:
             try:
-                self._key, self._data = json.loads(self._buff.getvalue())
+                self._parse()
             except:
                 pass
         return self._key
 
     @key.setter
     def key(self, value):
+        if (self._key is not None) and (value != self._key):
+            # record was renamed, so must be serialized again when written
+            self._data = self.data
+            self._meta = self.meta
+            self._buff = BytesIO()
+            self._size = None
         self._key = value
 
     @property
     def data(self):
-        if self._data is None:
-            self._key, self._data = json.loads(self._buff.getvalue())
+        if (self._data is None) and (self._key is None):
+            self._parse()
         return self._data
 
     @data.setter
     def data(self, value):
         self._data = value
 
+    @property
+    def meta(self):
+        if self._meta is None:
+            self._parse()
+        return self._meta
+
+    @meta.setter
+    def meta(self, value):
+        self._meta = value
+
     def load(self, fd):
         fd.seek(self.position)
         self._buff.seek(0)
-        try:
-            self._buff.write(fd.read(self.size))
-        except TypeError:
-            self._buff.write(fd.read(self.size).decode('UTF-8'))
+        self._buff.write(fd.read(self.size))
 
     def dumpslot(self, fd):
-        pos = fd.tell()
-        fd.write(self._struct.pack(self.creation, self.lifetime, self.position))
+        # the hash is of the key as stored, where the record may be indexed
+        # under the key it has been migrated to
+        keyhash = _keyhash(self.key)
+        if self.keyhash is None:
+            self.keyhash = keyhash
+        fd.write(self._struct.pack(self.creation, self.lifetime,
+                                   self.position, self.size, keyhash,
+                                   int(self.creation), 0))
 
     def dumpdata(self, fd):
-        self.size
         fd.seek(self.position)
-        try:
-            fd.write(self._buff.getvalue())
-        except TypeError:
-            fd.write(self._buff.getvalue().encode('UTF-8'))
+        fd.write(self.payload)
+
+    @property
+    def payload(self):
+        # the record as encoded for storage
+        self.size
+        return self._buff.getvalue()
 
 
 class FileEngine( CacheEngine ):
-    """Simple file-backed engine."""
+    """
+    Simple file-backed engine. Records are encoded with the `codec`
+    serializer, and compressed with `compression`, if given.
+
+    Records are indexed by the hash of their key, read from the slot table
+    alone. Only new records for keys the parent already holds are decoded
+    when reading the file, and any other is read individually, by seeking
+    straight to it, once requested.
+
+    Space held by records past retention, or replaced by a newer record
+    for the same key, is reclaimed by compaction, run in steps that each
+    move at most `compactstep` records down over the space of others,
+    under a short exclusive lock, each taking up where the last left off.
+    Once all are moved, the file is cut off after the last, and the next
+    pass waits for as much garbage again as the last one left behind. A
+    step is run with a write, once the garbage makes up `compactratio` of
+    the file, or the file has grown past `compactsize` bytes, if given.
+    If `compactinterval` is given, compaction is also run from a
+    background thread every that many seconds.
+
+    The cache may be held to a budget of `maxsize` bytes, and `maxcount`
+    records, by evicting those least recently used, or least often with
+    an `eviction` policy of 'lfu'. Reads are noted in memory, and written
+    to the slot table with the next write, so the order of eviction is
+    only approximate, and reads never take the exclusive lock.
+    """
     name = 'file'
     _struct = struct.Struct('HH')  # two shorts for version and count
-    _version = 2
+    _version = 5
+    _readable = (2, 3, 4, 5)
+    _compactmin = 64*1024  # garbage too little to be worth compacting
+    _evictlow = 0.9        # share of the budget left in use by eviction
 
     def __init__(self, parent):
         super(FileEngine, self).__init__(parent)
+        self._stats = Stats(('puts', 'evictions', 'expirations', 'lockwait',
+                             'compactions', 'reclaimed'))
         self.configure(None)
 
-    def configure(self, filename, preallocate=256):
+    def configure(self, filename, preallocate=256, codec='json',
+                  compression=None, compactratio=0.5, compactsize=None,
+                  compactstep=64, compactinterval=None, maxsize=None,
+                  maxcount=None, eviction='lru'):
+        if eviction not in ('lru', 'lfu'):
+            raise TMDBCacheError("Invalid cache eviction policy specified: "
+                                 + str(eviction))
         self.preallocate = preallocate
+        self.compactratio = compactratio
+        self.compactsize = compactsize
+        self.compactstep = compactstep
+        self.compactinterval = compactinterval
+        self.maxsize = maxsize
+        self.maxcount = maxcount
+        self.eviction = eviction
+        self.codec = Codec(codec, compression)
+        self.fileversion = None
         self.cachefile = filename
+        self.lockfd = None
+        self.lockpid = None
+        self.pid = None
+        self.cachemode = None
         self.size = 0
         self.free = 0
         self.age = 0
+        self.stamp = None
+        self.slots = {}   # creation time -> lifetime, position, size,
+                          # and key hash
+        self.hashes = {}  # key hash -> creation times, oldest first
+        self.live = 0     # bytes held by the newest record for each hash
+        self.table = []   # slot table, as last read
+        self.touched = {}  # key hash -> reads not yet written
+        self.tagindex = _TagIndex()  # keys and tags of records decoded
+        self.cursor = None  # end of the records compacted in this pass
+        self.mark = None  # end of the file as the pass started
+        self.left = 0     # garbage left behind by the last pass
+        self._compactor = None
+        if compactinterval:
+            self._compactor = _Compactor(self, compactinterval)
+            self._compactor.start()
 
     def _init_cache(self):
         # only run this once
@@ -273,52 +527,166 @@ class FileEngine( CacheEngine ):
         self._init_cache()
         self._open('r+b')
         
-        with Flock(self.cachefd, Flock.LOCK_SH):
+        with self._waiting(Flock(self.cachefd, Flock.LOCK_SH)):
             # return any new objects in the cache
-            return self._read(date)
+            return self._read(date, self._wanted())
 
-    def put(self, key, value, lifetime):
+    def put(self, key, value, lifetime, meta=None):
         self._init_cache()
         self._open('r+b')
 
-        with Flock(self.cachefd, Flock.LOCK_EX):
-            newobjs = self._read(self.age)
-            newobjs.append(FileCacheObject(key, value, lifetime))
-
-            # this will cause a new file object to be opened with the proper
-            # access mode, however the Flock should keep the old object open
-            # and properly locked
-            self._open('r+b')
+        with self._waiting(Flock(self.cachefd, Flock.LOCK_EX)):
+            newobjs = self._read(self.age, self._wanted())
+            self._mark()
+            newobjs.append(FileCacheObject(key, value, lifetime, meta=meta,
+                                           codec=self.codec))
+            self._stats.incr('puts')
+            due = self._due()
             self._write(newobjs)
+            if self._over():
+                # free the slots of evicted records at once, leaving their
+                # space to be reclaimed by compaction
+                self._read(self.age, ())
+                self._evict()
+                self._compact(0)
+                due = due or self._due()
+            if due:
+                # a single step, so no write pays for a whole compaction
+                self._read(self.age, ())
+                self._compact(self.compactstep)
             return newobjs
 
+    def _migrate(self, key):
+        # index records from older releases under their current keys
+        parent = self.parent()
+        if (key is None) or (parent is None) or (parent.migrate is None):
+            return key
+        return parent.migrate(key)
+
+    def _wanted(self):
+        # hashes of the keys held by the parent, the only new records that
+        # need be decoded
+        parent = self.parent()
+        if parent is None:
+            return None
+        return set(map(_keyhash, parent._held()))
+
+    def _index(self, obj):
+        self._slot(obj.creation,
+                   (obj.lifetime, obj.position, obj.size, obj.keyhash))
+        self._note(obj)
+
+    def _note(self, obj):
+        # add a decoded record to the tag index, where tombstones, and
+        # records in an encoding no longer read, are held with no tags
+        if obj.key is None:
+            self.tagindex.add(obj.creation, None)
+        elif obj.deleted:
+            self.tagindex.add(obj.creation, self._migrate(obj.key))
+        else:
+            self.tagindex.add(obj.creation, self._migrate(obj.key), obj.tags)
+
+    def _slot(self, creation, slot):
+        # records are added in order of creation, so each replaces the
+        # last sharing its hash, counting only the newest as live
+        self.slots[creation] = slot
+        creations = self.hashes.setdefault(slot[3], [])
+        if creations:
+            self.live -= self.slots[creations[-1]][2]
+        creations.append(creation)
+        self.live += slot[2]
+
+    def _find(self, key):
+        # newest record for the key, from those sharing the hash of its key
+        for creation in reversed(self.hashes.get(_keyhash(key), ())):
+            obj = FileCacheObject.fromSlot(creation, self.slots[creation],
+                                           self.codec)
+            obj.load(self.cachefd)
+            self._note(obj)
+            if self._migrate(obj.key) == key:
+                obj.key = key
+                return obj
+            # a hash collision, or the file was rewritten since last read
+        return None
+
+    def lookup(self, key):
+        if _keyhash(key) not in self.hashes:
+            return None
+        self._init_cache()
+        self._open('r+b')
+
+        with self._waiting(Flock(self.cachefd, Flock.LOCK_SH)):
+            obj = self._find(key)
+        if (obj is None) or (obj.overdue > self.parent().retain):
+            return None
+        return obj
+
     def _open(self, mode='r+b'):
         # enforce binary operation
         try:
-            if self.cachefd.mode == mode:
-                # already opened in requested mode, nothing to do
+            # the mode of the file object is not spelled as given, so the
+            # one given is kept to compare against
+            if (self.cachemode == mode) and (self.pid == os.getpid()):
+                # already opened in requested mode, but as records may
+                # since have been moved by another process, a seek to the
+                # end first discards anything left in the read buffer
+                self.cachefd.seek(0, 2)
                 self.cachefd.seek(0)
                 return
         except:
             pass  # catch issue of no cachefile yet opened
+        # a file inherited across a fork shares its position and flock
+        # with the parent process, so each process opens its own
         self.cachefd = io.open(self.cachefile, mode)
+        self.cachemode = mode
+        self.pid = os.getpid()
+
+    def _stamp(self):
+        # changes whenever the file is written, or replaced
+        st = os.fstat(self.cachefd.fileno())
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def stats(self):
+        """
+        Return a snapshot of the engine statistics, adding:
+            compactions -- compaction steps run
+            reclaimed   -- bytes cut off the file by compaction
+            bytes       -- size of the cache file
+            garbage     -- bytes held by records no longer current, as of
+                           the last read
+        """
+        stats = super(FileEngine, self).stats()
+        try:
+            stats['bytes'] = os.path.getsize(self.cachefile)
+        except (OSError, TypeError):
+            stats['bytes'] = 0
+        stats['garbage'] = self._garbage()
+        return stats
+
+    def changed(self):
+        if self.stamp is None:
+            return True
+        try:
+            st = os.stat(self.cachefile)
+        except OSError:
+            return True
+        return (st.st_mtime_ns, st.st_size, st.st_ino) != self.stamp
 
-    def _read(self, date):
+    def _read(self, date, wanted=None):
         try:
             self.cachefd.seek(0)
             version, count = self._struct.unpack(\
                                     self.cachefd.read(self._struct.size))
-            if version != self._version:
+            if version not in self._readable:
                 # old version, break out and well rewrite when finished
                 raise Exception
+            self.fileversion = version
 
             self.size = count
-            cache = []
-            while count:
-                # loop through storage definitions
-                obj = FileCacheObject.fromFile(self.cachefd)
-                cache.append(obj)
-                count -= 1
+            # read all storage definitions at once
+            cache = FileCacheObject.readSlots(self.cachefd, count, version)
+            if len(cache) != count:
+                raise Exception
 
         except:
             # failed to read information, so just discard it and return empty
@@ -326,81 +694,505 @@ class FileEngine( CacheEngine ):
             self.free = 0
             return []
 
-        # get end of file
-        self.cachefd.seek(0, 2)
-        position = self.cachefd.tell()
+        if version < 4:
+            # older versions do not store the length of each record, so it
+            # must be found from the start of the next
+            self.cachefd.seek(0, 2)
+            end = self.cachefd.tell()
+            for i in reversed(range(len(cache))):
+                creation, lifetime, position = cache[i][:3]
+                if creation:
+                    cache[i] = cache[i][:3] + (end - position,) + cache[i][4:]
+                    end = position
+
+        # index each record by the hash of its key, so that records not
+        # held by the parent can later be read individually by lookup().
+        # where the slot table does not hold the hash, or the file is of an
+        # older version, whose keys may be from an older release, the
+        # record is decoded, once. files are rewritten in the current
+        # version, with keys migrated, on the first write
+        parent = self.parent()
+        cutoff = time.time() - parent.retain
+        migrate = (version != self._version) and (parent.migrate is not None)
+        slots, self.slots = self.slots, {}
+        self.hashes = {}
+        self.live = 0
+        for row in cache:
+            creation, lifetime, position, size, keyhash = row[:5]
+            if (creation == 0) or (creation + lifetime < cutoff):
+                continue
+            if (keyhash is None) or migrate:
+                slot = slots.get(creation)
+                if (slot is not None) and (slot[1] == position):
+                    keyhash = slot[3]
+                else:
+                    obj = FileCacheObject.fromSlot(creation,
+                                    (lifetime, position, size, None),
+                                    self.codec)
+                    obj.load(self.cachefd)
+                    self._note(obj)
+                    key = self._migrate(obj.key)
+                    if key is None:
+                        continue
+                    keyhash = _keyhash(key)
+            self._slot(creation, (lifetime, position, size, keyhash))
+        self.tagindex.prune(self.slots)
+
         newobjs = []
         emptycount = 0
+        newer = False
 
-        # walk backward through all, collecting new content and populating size
-        while len(cache):
-            obj = cache.pop()
-            if obj.creation == 0:
+        # walk backward through all, collecting new content
+        for row in reversed(cache):
+            creation = row[0]
+            if creation == 0:
                 # unused slot, skip
                 emptycount += 1
-            elif obj.expired:
-                # object has passed expiration date, no sense processing
+            elif creation not in self.slots:
+                # object has passed expiration date, and is no longer
+                # retained as a fallback, no sense processing
                 continue
-            elif obj.creation > date:
-                # used slot with new data, process
-                obj.size, position = position - obj.position, obj.position
-                newobjs.append(obj)
+            elif creation > date:
+                # used slot with new data, process if wanted
+                newer = True
+                slot = self.slots[creation]
+                if (wanted is None) or (slot[3] in wanted):
+                    newobjs.append(FileCacheObject.fromSlot(creation, slot,
+                                                            self.codec))
                 # update age
-                self.age = max(self.age, obj.creation)
-            elif len(newobjs):
+                self.age = max(self.age, creation)
+            elif newer:
                 # end of new data, break
                 break
 
-        # walk forward and load new content
+        # walk forward and load new content, leaving out records in an
+        # encoding that is no longer read
+        newobjs.reverse()
         for obj in newobjs:
             obj.load(self.cachefd)
+            self._note(obj)
+        newobjs = [obj for obj in newobjs if obj.key is not None]
 
+        self.table = cache
         self.free = emptycount
+        self.stamp = self._stamp()
         return newobjs
 
-    def _write(self, data):
-        if self.free and (self.size != self.free):
-            # we only care about the last data point, since the rest are
-            # already stored in the file
-            data = data[-1]
+    def _live(self):
+        # slots of records still current, being the newest for their key,
+        # and not past retention, in slot table order. keys sharing a hash
+        # are taken to be the same, where a rare collision costs a miss
+        newest = set(creations[-1] for creations in self.hashes.values())
+        return [row for row in self.table if row[0] in newest]
+
+    def _garbage(self):
+        # bytes held by records no longer current
+        if (self.fileversion != self._version) or (self.stamp is None):
+            return 0
+        start = 4 + FileCacheObject._struct.size*self.size
+        return max(self.stamp[1] - start - self.live, 0)
+
+    def _due(self):
+        if self.stamp is None:
+            return False
+        garbage = self._garbage()
+        if (self.cursor is None) and (garbage < 2*self.left):
+            # records replaced while the last pass was under way were left
+            # behind it, and another pass started before as much again is
+            # garbage would not bring the share any lower
+            return False
+        if (self.maxsize is not None) and (self.stamp[1] > self.maxsize) \
+                and garbage:
+            # over budget, however little there is to reclaim
+            return True
+        if garbage < self._compactmin:
+            return False
+        if (self.compactratio is not None) and \
+                (garbage >= self.compactratio*self.stamp[1]):
+            return True
+        return (self.compactsize is not None) and \
+               (self.stamp[1] >= self.compactsize)
+
+    def touch(self, obj):
+        # reads are only noted where there is a budget to evict records by
+        if (self.maxsize is None) and (self.maxcount is None):
+            return
+        keyhash = _keyhash(obj.key)
+        self.touched[keyhash] = self.touched.get(keyhash, 0) + 1
+
+    def _mark(self):
+        # write the reads noted since the last write into the slot table,
+        # under the exclusive lock, as the time of last use, and a count of
+        # uses, of the newest record for each key read
+        touched, self.touched = self.touched, {}
+        if (not touched) or (self.fileversion != self._version):
+            return
+        slot = FileCacheObject._struct
+        now = int(time.time())
+        rows = dict((row[0], i) for i, row in enumerate(self.table)
+                                if row[0])
+        for keyhash, uses in touched.items():
+            creations = self.hashes.get(keyhash)
+            if (not creations) or (creations[-1] not in rows):
+                continue
+            i = rows[creations[-1]]
+            row = self.table[i]
+            row = row[:5] + (max(row[5], now), min(row[6]+uses, 0xFFFFFFFF))
+            self.table[i] = row
+            self.cachefd.seek(4 + slot.size*i)
+            self.cachefd.write(slot.pack(*row))
+
+    def _used(self):
+        # bytes of the slot table, and of the newest record for each key
+        return 4 + FileCacheObject._struct.size*self.size + self.live
+
+    def _over(self):
+        # whether the records held are beyond the budget
+        if (self.maxcount is not None) and (len(self.hashes) > self.maxcount):
+            return True
+        return (self.maxsize is not None) and (self._used() > self.maxsize)
+
+    def _evict(self):
+        # drop records from the index, least recently or least often used
+        # first, until the cache is back within a share of the budget, so
+        # that not every write must evict. the record just written is kept
+        if self.fileversion != self._version:
+            return 0
+        if self.eviction == 'lfu':
+            order = lambda row: (row[6], row[5], row[0])
+        else:
+            # last use is kept to the second, so records used within the
+            # same one are ordered by their count of uses
+            order = lambda row: (row[5], row[6], row[0])
+        maxcount = self.maxcount
+        if maxcount is not None:
+            maxcount = int(maxcount*self._evictlow)
+        maxsize = self.maxsize
+        if maxsize is not None:
+            maxsize = int(maxsize*self._evictlow)
+        evicted = 0
+        for row in sorted(self._live(), key=order):
+            if ((maxcount is None) or (len(self.hashes) <= maxcount)) and \
+                    ((maxsize is None) or (self._used() <= maxsize)):
+                break
+            if row[0] >= self.age:
+                continue
+            if self.hashes.pop(row[4], None) is None:
+                # a second row for the same record
+                continue
+            self.live -= row[3]
+            evicted += 1
+        self._stats.incr('evictions', evicted)
+        if DEBUG:
+            print("evicted {0} records from {1}"\
+                        .format(evicted, self.cachefile))
+        return evicted
+
+    def _compact(self, limit):
+        # a single step of compaction, made under the exclusive lock. the
+        # slots of records no longer current are freed, and then at most
+        # `limit` records are moved down over space no longer used. each
+        # step carries on from the cursor the last one left, rather than
+        # from the first gap, as records replaced behind it would otherwise
+        # keep a pass from ever reaching the end. records written since the
+        # pass started are moved along with the last of those before them,
+        # so that it ends however fast records are added. once none are
+        # left to move, the file is cut off after the last record, and the
+        # next pass starts from the slot table again.
+        # returns the bytes cut off, or None while there is more to move
+        if self.fileversion != self._version:
+            return 0
+        slot = FileCacheObject._struct
+        live = self._live()
+        used = [row for row in self.table if row[0]]
+        if len(live) < len(used):
+            self._stats.incr('expirations', len([row for row in used
+                                                 if row[0] not in self.slots]))
+            self.cachefd.seek(4)
+            self.cachefd.write(b''.join(slot.pack(*row) for row in live) +
+                               FileCacheObject._empty*(self.size-len(live)))
+
+        self.cachefd.seek(0, 2)
+        end = self.cachefd.tell()
+        pos = 4 + slot.size*self.size
+        # the cursor is dropped should another process have cut the file
+        # short, while records below it, left in place, still keep any
+        # record from being moved over them
+        cursor, mark = self.cursor, self.mark
+        if (cursor is None) or (cursor > end):
+            cursor, mark = pos, end
+        moved = 0
+        reclaimed = None
+        for i in sorted(range(len(live)), key=lambda i: live[i][2]):
+            creation, lifetime, position, size = live[i][:4]
+            if (position > pos) and (position >= cursor):
+                if (moved >= limit) and (position < mark):
+                    self.cursor, self.mark = pos, mark
+                    break
+                # the record is read whole before being written, as it may
+                # overlap its new position
+                self.cachefd.seek(position)
+                data = self.cachefd.read(size)
+                self.cachefd.seek(pos)
+                self.cachefd.write(data)
+                self.cachefd.seek(4 + slot.size*i)
+                self.cachefd.write(slot.pack(creation, lifetime, pos,
+                                             *live[i][3:]))
+                position = pos
+                moved += 1
+            pos = max(pos, position + size)
+        else:
+            self.cursor = self.mark = None
+            reclaimed = end - pos
+            if reclaimed:
+                self.cachefd.truncate(pos)
+            self._stats.incr('reclaimed', reclaimed)
+            if DEBUG:
+                print("reclaimed {0} bytes from {1}"\
+                            .format(reclaimed, self.cachefile))
+        self._stats.incr('compactions')
+        self.cachefd.flush()
+        self._read(self.age, ())
+        if reclaimed is not None:
+            self.left = self._garbage()
+        return reclaimed
+
+    def _grow(self):
+        # add free slots, moving records in the way to the end of the file
+        slot = FileCacheObject._struct
+        size = min(self.size + self.preallocate, 0xFFFF)
+        start = 4 + slot.size*size
+        self.cachefd.seek(0, 2)
+        end = self.cachefd.tell()
+        for i, row in enumerate(self.table):
+            creation, lifetime, position, length = row[:4]
+            if creation and (position < start):
+                self.cachefd.seek(position)
+                data = self.cachefd.read(length)
+                self.cachefd.seek(end)
+                self.cachefd.write(data)
+                self.cachefd.seek(4 + slot.size*i)
+                self.cachefd.write(slot.pack(creation, lifetime, end,
+                                             *row[3:]))
+                end += length
+        self.cachefd.seek(4 + slot.size*self.size)
+        self.cachefd.write(FileCacheObject._empty*(size-self.size))
+        self.cachefd.seek(0)
+        self.cachefd.write(self._struct.pack(self._version, size))
+        self.cachefd.flush()
+        self._read(self.age, ())
 
-            # determine write position of data in cache
+    def compact(self, steps=None):
+        """
+        Reclaim the space held by records no longer current, in steps each
+        holding the exclusive lock only for itself, until no records are
+        left to move, or `steps` have been run. Returns the bytes reclaimed.
+        """
+        self._init_cache()
+        total = 0
+        whole = False  # whether the current pass started from the front
+        while (steps is None) or (steps > 0):
+            parent = self.parent()
+            if parent is None:
+                return 0
+            # the parent's lock keeps it from using the engine in between
+            with parent._lock:
+                self._open('r+b')
+                with self._waiting(Flock(self.cachefd, Flock.LOCK_EX)):
+                    self._read(self.age, ())
+                    self._mark()
+                    if not self._garbage():
+                        self.cachefd.flush()
+                        return total
+                    whole = whole or (self.cursor is None)
+                    reclaimed = self._compact(self.compactstep)
+            if reclaimed is not None:
+                # a pass taken up part way leaves any space freed behind
+                # it, so is followed by one more over the whole file
+                total += reclaimed
+                if whole:
+                    return total
+            if steps is not None:
+                steps -= 1
+        return total
+
+    def _write(self, data, count=1):
+        if (self.fileversion == self._version) and self.size and \
+                (self.free < count):
+            # out of free slots, so take those of records no longer current,
+            # or add more, rather than rewriting the whole file
+            self._compact(0)
+            while (self.free < count) and (self.size < 0xFFFF):
+                self._grow()
+
+        if (self.free >= count) and (self.size != self.free) and \
+                (self.fileversion == self._version):
+            # we only care about the last `count` data points, since the
+            # rest are already stored in the file
             self.cachefd.seek(0, 2)
             end = self.cachefd.tell()
-            data.position = end
-
-            # write incremental update to free slot
-            self.cachefd.seek(4 + 16*(self.size-self.free))
-            data.dumpslot(self.cachefd)
-            data.dumpdata(self.cachefd)
+            for d in data[len(data)-count:]:
+                # write incremental update to free slot, with its data at
+                # the end of the file
+                d.position = end
+                self.cachefd.seek(4 + FileCacheObject._struct.size *
+                                      (self.size-self.free))
+                d.dumpslot(self.cachefd)
+                d.dumpdata(self.cachefd)
+                self._index(d)
+                self.free -= 1
+                end += d.size
 
         else:
-            # rewrite cache file from scratch
-            # pull data from parent cache
-            data.extend(self.parent()._data.values())
-            data.sort(key=lambda x: x.creation)
+            # rewrite cache file from scratch, keeping only the newest
+            # record for each key, as the parent holds only some of them
+            records = {}
+            current = self._read(0)
+            # records past retention are left out of the new file
+            self._stats.incr('expirations',
+                             max(self.size - self.free - len(current), 0))
+            for d in current + data[len(data)-count:]:
+                key = self._migrate(d.key)
+                if key is None:
+                    continue
+                # stored under the current key, so that it need not be
+                # migrated again as the file is read
+                d.key = key
+                if (key not in records) or \
+                        (d.creation > records[key].creation):
+                    records[key] = d
+            data = sorted(records.values(), key=lambda x: x.creation)
             # write header
             size = len(data) + self.preallocate
             self.cachefd.seek(0)
             self.cachefd.truncate()
             self.cachefd.write(self._struct.pack(self._version, size))
+            self.fileversion = self._version
             # write storage slot definitions
             prev = None
             for d in data:
                 if prev == None:
-                    d.position = 4 + 16*size
+                    d.position = 4 + FileCacheObject._struct.size*size
                 else:
                     d.position = prev.position + prev.size
                 d.dumpslot(self.cachefd)
                 prev = d
             # fill in allocated slots
-            for i in range(2**8):
-                self.cachefd.write(FileCacheObject._struct.pack(0, 0, 0))
+            for i in range(self.preallocate):
+                self.cachefd.write(FileCacheObject._empty)
             # write stored data
+            self.slots = {}
+            self.hashes = {}
+            self.live = 0
             for d in data:
                 d.dumpdata(self.cachefd)
+                self._index(d)
+            self.tagindex.prune(self.slots)
 
         self.cachefd.flush()
+        self.stamp = self._stamp()
+
+    @contextlib.contextmanager
+    def lock(self, key):
+        """
+        Hold an exclusive lock for the given key, shared with all processes
+        using this cache file. Keys are hashed onto 64K byte ranges of a
+        separate lock file, so unrelated keys rarely contend.
+        """
+        self._init_cache()
+        if (self.lockfd is None) or (self.lockpid != os.getpid()):
+            try:
+                self.lockfd = io.open(self.cachefile+'.lock', 'a+b')
+            except IOError:
+                # cannot share locks, fall back to process-local locking
+                self.lockfd = False
+            self.lockpid = os.getpid()
+        if not self.lockfd:
+            yield
+            return
+        with self._waiting(RangeLock(self.lockfd,
+                                     zlib.crc32(key.encode('utf-8')) & 0xFFFF)):
+            yield
+
+    def _remove(self, select):
+        # records cannot be removed in place, so each selected key is given
+        # a tombstone, kept for as long as the record it replaces would be.
+        # `select` returns the keys, with the creation time of the newest
+        # record for each, and the tombstones are written together
+        self._init_cache()
+        self._open('r+b')
+
+        with self._waiting(Flock(self.cachefd, Flock.LOCK_EX)):
+            newobjs = self._read(self.age, self._wanted())
+            tombstones = []
+            stamp = self.age
+            for key, creation in select():
+                remaining = creation + self.slots[creation][0] - time.time()
+                # each is created after any record in the file, and the
+                # one before it
+                stamp = max(time.time(), stamp + 1e-6)
+                tombstones.append(FileCacheObject.tombstone(key,
+                                        int(max(remaining, 0))+1,
+                                        creation=stamp, codec=self.codec))
+            if tombstones:
+                self._write(tombstones, len(tombstones))
+                self.age = max(self.age, stamp)
+                # pick up the free slot count after the write
+                self._read(self.age, ())
+            return newobjs + tombstones
+
+    def _tagged(self, tag):
+        # tags are held only within records, so those not yet in the tag
+        # index are decoded, once. only the newest record for each key hash
+        # is current, where a rare collision costs a miss
+        selected = []
+        for creations in self.hashes.values():
+            creation = creations[-1]
+            if creation not in self.tagindex:
+                obj = FileCacheObject.fromSlot(creation, self.slots[creation],
+                                               self.codec)
+                obj.load(self.cachefd)
+                self._note(obj)
+        for creation in self.tagindex.tagged(tag):
+            slot = self.slots.get(creation)
+            if (slot is not None) and (self.hashes[slot[3]][-1] == creation):
+                selected.append((self.tagindex.key(creation), creation))
+        return selected
 
     def expire(self, key):
-        pass
+        def select():
+            found = self._find(key)
+            if (found is None) or found.deleted:
+                return []
+            return [(key, found.creation)]
+        return self._remove(select)
+
+    def invalidate(self, tag):
+        return self._remove(lambda: self._tagged(tag))
+
+
+class _Compactor(threading.Thread):
+    """
+    Background thread compacting the files of an engine periodically,
+    until the engine is released, or configured again.
+    """
+    def __init__(self, engine, interval):
+        super(_Compactor, self).__init__()
+        self.daemon = True
+        self.engine = ref(engine)
+        self.interval = interval
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            engine = self.engine()
+            if (engine is None) or (engine._compactor is not self):
+                return
+            try:
+                engine.compact()
+            except Exception as e:
+                # the next run will try again
+                if DEBUG:
+                    print("compaction of {0} failed: {1}"\
+                                .format(engine.cachefile, e))
+            del engine
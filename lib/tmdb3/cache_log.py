@@ -0,0 +1,474 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#-----------------------
+# Name: cache_log.py
+# Python Library
+# Author: Raymond Wagner
+# Purpose: Persistant file-backed cache built on an append-only record
+#          log, periodically folded into a snapshot, so that readers never
+#          need to take a lock.
+#-----------------------
+
+import contextlib
+import struct
+import mmap
+import zlib
+import time
+import os
+import io
+
+from .tmdb_exceptions import *
+from .cache_engine import CacheEngine
+from .cache_file import FileCacheObject, Flock, RangeLock, parse_filename, \
+                        _keyhash, _TagIndex
+from .cache_codec import Codec
+
+DEBUG = False
+
+####################
+# Snapshot Format
+#------------------
+# magic                 (4) 'TMDL'
+# version               (4) unsigned int
+# generation            (4) unsigned int
+# record 1
+# record 2                  records are held in order of creation, with
+#    ....                   only the newest for each key kept.
+# record N-1
+#
+# Log Format
+#------------------
+# record 1                  records appended since the snapshot of the
+# record 2                  same generation was written. the log is named
+#    ....                   after the snapshot, with the generation added.
+# record N-1
+#
+# Record Format
+#------------------
+# length                (4) unsigned int
+# checksum              (4) unsigned int, CRC32 of the payload
+# timestamp             (8) double
+# lifetime              (4) unsigned int
+# key hash              (4) unsigned int, CRC32 of the key
+# payload               (?) binary, encoded by the engine's codec
+#
+####################
+
+_header = struct.Struct('4sII')   # magic, version, and generation
+_record = struct.Struct('IIdII')  # length, checksum, timestamp, lifetime,
+                                  # and key hash
+
+_SNAPSHOT, _LOG = 0, 1
+
+
+class LogEngine(CacheEngine):
+    """
+    File-backed engine, holding records in a snapshot, followed by a log
+    of those added since it was written. Readers map the snapshot, and
+    follow the log from where they last read, without taking any lock.
+    Records in the log are checksummed, so that one still being appended
+    is left until it is complete.
+
+    Writers coordinate through a lock on a separate file, and append to
+    the log. Once it grows past `maxlog` bytes, it is folded into a new
+    snapshot, keeping only the newest record for each key, which replaces
+    the old one through an atomic rename. Readers move on to the new
+    snapshot, and its log, the next time they read.
+
+    As with the file engine, records are indexed by key hash, and only
+    those for keys the parent already holds are decoded as they are read.
+    Data is encoded with the `codec` serializer, and compressed with
+    `compression`, if given.
+
+    Snapshots are replaced while other processes may have them mapped,
+    which requires POSIX filesystem semantics.
+    """
+    name = 'log'
+    _magic = b'TMDL'
+    _version = 1
+
+    def __init__(self, parent):
+        super(LogEngine, self).__init__(parent)
+        self.configure(None)
+
+    def configure(self, filename, maxlog=4*1024*1024, codec='json',
+                  compression=None):
+        self.cachefile = filename
+        self.maxlog = maxlog
+        self.codec = Codec(codec, compression)
+        self.path = None
+        self.pid = None
+        self.generation = None
+        self.snapshot = None  # mapping of the current snapshot
+        self.stamp = None     # identity of the mapped snapshot
+        self.logfd = None
+        self.logpos = 0       # end of the last complete record in the log
+        self.writefd = None
+        self.lockfd = None
+        self.age = 0
+        self.records = {}     # creation time -> lifetime, source, position,
+                              # size, and key hash
+        self.hashes = {}      # key hash -> creation times, oldest first
+        self.tagindex = _TagIndex()  # keys and tags of records decoded
+
+    def _init_cache(self):
+        if self.pid == os.getpid():
+            return
+        # files inherited across a fork share their position and locks
+        # with the parent process, so each process opens its own
+        if self.cachefile is None:
+            raise TMDBCacheError("No cache filename given.")
+        self.path = parse_filename(self.cachefile)
+        if not os.path.isdir(os.path.dirname(self.path) or '.'):
+            raise TMDBCacheDirectoryError(self.path)
+        self.pid = os.getpid()
+        self.stamp = None
+        self.logfd = None
+        self.writefd = None
+        self.lockfd = None
+
+    def _logname(self, generation):
+        return '{0}.{1}.log'.format(self.path, generation)
+
+    def _wanted(self):
+        # hashes of the keys held by the parent, the only new records that
+        # need be decoded
+        parent = self.parent()
+        if parent is None:
+            return None
+        return set(map(_keyhash, parent._held()))
+
+    def _migrate(self, key):
+        parent = self.parent()
+        if (key is None) or (parent is None) or (parent.migrate is None):
+            return key
+        return parent.migrate(key)
+
+    def _object(self, creation):
+        lifetime, source, position, size, keyhash = self.records[creation]
+        obj = FileCacheObject.fromSlot(creation,
+                                       (lifetime, position, size, keyhash),
+                                       self.codec)
+        obj.load(self.snapshot if source == _SNAPSHOT else self.logfd)
+        self._note(obj)
+        return obj
+
+    def _note(self, obj):
+        # add a decoded record to the tag index, where tombstones, and
+        # records in an encoding no longer read, are held with no tags
+        if obj.key is None:
+            self.tagindex.add(obj.creation, None)
+        elif obj.deleted:
+            self.tagindex.add(obj.creation, self._migrate(obj.key))
+        else:
+            self.tagindex.add(obj.creation, self._migrate(obj.key), obj.tags)
+
+    def _index(self, creation, record):
+        # logs have only ever been written with keys in their current form,
+        # so records are indexed by the hash stored with them, without
+        # being decoded to migrate their keys
+        self.records[creation] = record
+        self.hashes.setdefault(record[4], []).append(creation)
+
+    def _scan(self, buff, source, pos=0, base=0, verify=False):
+        # index the complete records in the buffer from the given position,
+        # returning the creation times of those indexed, and where the last
+        # of them ends
+        new = []
+        while pos + _record.size <= len(buff):
+            length, checksum, creation, lifetime, keyhash = \
+                    _record.unpack_from(buff, pos)
+            start = pos + _record.size
+            if (start + length > len(buff)) or (verify and
+                    zlib.crc32(buff[start:start+length]) != checksum):
+                # still being written
+                break
+            self._index(creation, (lifetime, source, base + start, length,
+                                   keyhash))
+            new.append(creation)
+            pos = start + length
+        return new, pos
+
+    def _reload(self):
+        # map the snapshot, if it has been replaced since last mapped,
+        # returning whether it was
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            # nothing has been written yet
+            return False
+        if (st.st_ino, st.st_mtime_ns, st.st_size) == self.stamp:
+            return False
+        try:
+            with io.open(self.path, 'rb') as fd:
+                st = os.fstat(fd.fileno())
+                snapshot = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        except (IOError, ValueError):
+            raise TMDBCacheReadError(self.path)
+        try:
+            magic, version, generation = _header.unpack_from(snapshot)
+        except struct.error:
+            magic = version = generation = None
+        if (magic != self._magic) or (version != self._version):
+            snapshot.close()
+            raise TMDBCacheReadError(self.path)
+
+        # records read earlier hold their own copy of the data, so the
+        # old mapping can be released
+        if self.snapshot is not None:
+            self.snapshot.close()
+        self.snapshot = snapshot
+        self.stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+        self.generation = generation
+        self.records = {}
+        self.hashes = {}
+        self._scan(snapshot, _SNAPSHOT, _header.size)
+        self.tagindex.prune(self.records)
+        self.logfd = None
+        self.logpos = 0
+        return True
+
+    def _tail(self):
+        # index records appended to the log since it was last read
+        if self.generation is None:
+            return []
+        if self.logfd is None:
+            try:
+                # unbuffered, as the tail of the log may be rewritten
+                self.logfd = io.open(self._logname(self.generation), 'rb',
+                                     buffering=0)
+            except IOError:
+                # already folded into a newer snapshot
+                return []
+        self.logfd.seek(self.logpos)
+        new, end = self._scan(self.logfd.read(), _LOG, 0, self.logpos, True)
+        self.logpos += end
+        return new
+
+    def _read(self, date, wanted=None):
+        self._init_cache()
+        if self._reload():
+            new = sorted(self.records)
+        else:
+            new = []
+        new += self._tail()
+        if (self.logfd is None) and self._reload():
+            # the log went missing, as the snapshot was being replaced
+            new = sorted(self.records) + self._tail()
+
+        newobjs = []
+        cutoff = time.time() - self.parent().retain
+        for creation in new:
+            lifetime, source, position, size, keyhash = \
+                    self.records[creation]
+            self.age = max(self.age, creation)
+            if (creation <= date) or (creation + lifetime < cutoff):
+                continue
+            if (wanted is None) or (keyhash in wanted):
+                obj = self._object(creation)
+                if obj.key is not None:
+                    # not in an encoding that is no longer read
+                    newobjs.append(obj)
+        return newobjs
+
+    def _find(self, key):
+        # newest record for the key, from those sharing the hash of its key
+        for creation in reversed(self.hashes.get(_keyhash(key), ())):
+            obj = self._object(creation)
+            if self._migrate(obj.key) == key:
+                obj.key = key
+                return obj
+        return None
+
+    def get(self, date):
+        return self._read(date, self._wanted())
+
+    def lookup(self, key):
+        if _keyhash(key) not in self.hashes:
+            return None
+        obj = self._find(key)
+        if (obj is None) or (obj.overdue > self.parent().retain):
+            return None
+        return obj
+
+    def changed(self):
+        if self.stamp is None:
+            return True
+        try:
+            st = os.stat(self.path)
+            if (st.st_ino, st.st_mtime_ns, st.st_size) != self.stamp:
+                return True
+            return os.path.getsize(self._logname(self.generation)) != \
+                        self.logpos
+        except OSError:
+            return True
+
+    def stats(self):
+        stats = super(LogEngine, self).stats()
+        stats['bytes'] = (len(self.snapshot) if self.snapshot else 0) + \
+                         self.logpos
+        return stats
+
+    @contextlib.contextmanager
+    def _writing(self):
+        # writers hold an exclusive lock on a file of their own, leaving
+        # the snapshot and log free to be read
+        self._init_cache()
+        if self.writefd is None:
+            try:
+                self.writefd = io.open(self.path+'.writer', 'a+b')
+            except IOError:
+                raise TMDBCacheWriteError(self.path)
+        with self._waiting(Flock(self.writefd, Flock.LOCK_EX)):
+            if not os.path.exists(self.path):
+                self._snapshot([])
+            yield
+
+    def _append(self, objs):
+        frames = []
+        for obj in objs:
+            self._note(obj)
+            payload = obj.payload
+            frames.append(_record.pack(len(payload), zlib.crc32(payload),
+                                       obj.creation, obj.lifetime,
+                                       _keyhash(obj.key)) + payload)
+        data = b''.join(frames)
+        try:
+            fd = os.open(self._logname(self.generation),
+                         os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+        except OSError:
+            raise TMDBCacheWriteError(self.path)
+        try:
+            if os.fstat(fd).st_size != self.logpos:
+                # a record left incomplete by a writer that died would stop
+                # readers short of any appended after it
+                os.ftruncate(fd, self.logpos)
+            while data:
+                data = data[os.write(fd, data):]
+        finally:
+            os.close(fd)
+        self._tail()
+
+    def put(self, key, value, lifetime, meta=None):
+        obj = FileCacheObject(key, value, lifetime, meta=meta,
+                              codec=self.codec)
+        with self._writing():
+            newobjs = self._read(self.age, self._wanted())
+            self._append([obj])
+            self._stats.incr('puts')
+            newobjs.append(obj)
+            if self.logpos > self.maxlog:
+                self._compact()
+            return newobjs
+
+    def _compact(self):
+        # fold the log into a new snapshot, keeping only the newest record
+        # for each key, and dropping those no longer retained
+        retain = self.parent().retain
+        records = {}
+        expired = 0
+        for creation in sorted(self.records):
+            obj = self._object(creation)
+            if obj.overdue > retain:
+                expired += 1
+            elif obj.key is not None:
+                records[obj.key] = obj
+        self._stats.incr('expirations', expired)
+        self._snapshot(sorted(records.values(), key=lambda x: x.creation))
+        if DEBUG:
+            print("wrote snapshot {0} of {1} records to {2}"\
+                        .format(self.generation, len(records), self.path))
+
+    def _snapshot(self, objs):
+        generation = (self.generation or 0) + 1
+        tmpname = self.path + '.tmp'
+        try:
+            with io.open(tmpname, 'wb') as fd:
+                fd.write(_header.pack(self._magic, self._version, generation))
+                for obj in objs:
+                    payload = obj.payload
+                    fd.write(_record.pack(len(payload), zlib.crc32(payload),
+                                          obj.creation, obj.lifetime,
+                                          _keyhash(obj.key)))
+                    fd.write(payload)
+                fd.flush()
+                os.fsync(fd.fileno())
+            # the new log must exist before the snapshot naming it
+            io.open(self._logname(generation), 'wb').close()
+            os.replace(tmpname, self.path)
+        except (IOError, OSError):
+            raise TMDBCacheWriteError(self.path)
+        if self.generation is not None:
+            try:
+                os.remove(self._logname(self.generation))
+            except OSError:
+                pass
+        self._reload()
+        self._tail()
+
+    @contextlib.contextmanager
+    def lock(self, key):
+        """
+        Hold an exclusive lock for the given key, shared with all processes
+        using this cache. Keys are hashed onto 64K byte ranges of a
+        separate lock file, so unrelated keys rarely contend.
+        """
+        self._init_cache()
+        if self.lockfd is None:
+            try:
+                self.lockfd = io.open(self.path+'.lock', 'a+b')
+            except IOError:
+                # cannot share locks, fall back to process-local locking
+                self.lockfd = False
+        if not self.lockfd:
+            yield
+            return
+        with self._waiting(RangeLock(self.lockfd, _keyhash(key) & 0xFFFF)):
+            yield
+
+    def _remove(self, select):
+        # records cannot be removed from the log, so each selected key is
+        # given a tombstone, kept for as long as the record it replaces.
+        # `select` returns the keys, with the creation time of the newest
+        # record for each
+        with self._writing():
+            newobjs = self._read(self.age, self._wanted())
+            tombstones = []
+            stamp = self.age
+            for key, creation in select():
+                remaining = creation + self.records[creation][0] - time.time()
+                # each is created after any record in the log, and the one
+                # before it, as records are indexed by creation time
+                stamp = max(time.time(), stamp + 1e-6)
+                tombstones.append(FileCacheObject.tombstone(key,
+                                        int(max(remaining, 0))+1,
+                                        creation=stamp, codec=self.codec))
+            if tombstones:
+                self._append(tombstones)
+            return newobjs + tombstones
+
+    def _tagged(self, tag):
+        # tags are held only within records, so those not yet in the tag
+        # index are decoded, once. only the newest record for each key hash
+        # is current, where a rare collision costs a miss
+        selected = []
+        for creations in self.hashes.values():
+            if creations[-1] not in self.tagindex:
+                self._object(creations[-1])
+        for creation in self.tagindex.tagged(tag):
+            record = self.records.get(creation)
+            if (record is not None) and \
+                    (self.hashes[record[4]][-1] == creation):
+                selected.append((self.tagindex.key(creation), creation))
+        return selected
+
+    def expire(self, key):
+        def select():
+            found = self._find(key)
+            if (found is None) or found.deleted:
+                return []
+            return [(key, found.creation)]
+        return self._remove(select)
+
+    def invalidate(self, tag):
+        return self._remove(lambda: self._tagged(tag))
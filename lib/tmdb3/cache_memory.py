@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#-----------------------
+# Name: cache_memory.py
+# Python Library
+# Author: Raymond Wagner
+# Purpose: Bounded in-memory caching engine, discarding the least recently
+#          used records once it grows past a count or size limit
+#-----------------------
+
+from collections import OrderedDict
+from weakref import ref
+import threading
+import heapq
+import json
+import time
+
+from .cache_engine import CacheEngine, CacheObject
+
+DEBUG = False
+
+
+class MemoryCacheObject(CacheObject):
+    """
+    Cache object that reports reads of its data back to the engine, so
+    that records served by the cache count as recently used.
+    """
+    def __init__(self, engine, *args, **kwargs):
+        self._engine = ref(engine)
+        super(MemoryCacheObject, self).__init__(*args, **kwargs)
+        self.size = len(json.dumps(self._data))
+
+    @property
+    def data(self):
+        engine = self._engine()
+        if engine is not None:
+            engine.touch(self)
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+
+
+class MemoryEngine(CacheEngine):
+    """
+    Process local engine, holding records in memory. Records are kept in
+    order of use, and the least recently used are evicted once there are
+    more than `maxentries`, or their serialized size exceeds `maxbytes`.
+    Records past the retention of the parent cache are purged as others
+    are put. Evicted records are also dropped from the parent cache.
+    """
+    name = 'memory'
+
+    def __init__(self, parent):
+        super(MemoryEngine, self).__init__(parent)
+        self._lock = threading.RLock()
+        self.configure()
+
+    def configure(self, maxentries=1024, maxbytes=32*1024*1024):
+        with self._lock:
+            self.maxentries = maxentries
+            self.maxbytes = maxbytes
+            self._lru = OrderedDict()    # key -> object, by last use
+            self._added = OrderedDict()  # key -> object, by creation
+            self._tagged = {}            # tag -> keys of tagged objects
+            self._heap = []              # (expiry, id, object)
+            self.size = 0
+            self._stats.reset()
+            self._writes = 0
+            self._seen = -1
+
+    def stats(self):
+        """Return a snapshot of the engine counters."""
+        with self._lock:
+            stats = self._stats.snapshot()
+            stats['entries'] = len(self._lru)
+            stats['bytes'] = self.size
+        return stats
+
+    def touch(self, obj):
+        with self._lock:
+            if self._lru.get(obj.key) is obj:
+                self._lru.move_to_end(obj.key)
+
+    def _remove(self, key):
+        obj = self._lru.pop(key)
+        del self._added[key]
+        for tag in obj.tags:
+            keys = self._tagged[tag]
+            keys.discard(key)
+            if not keys:
+                del self._tagged[tag]
+        self.size -= obj.size
+        # drop the record from the parent, so its memory is released
+        parent = self.parent()
+        if parent is not None:
+            parent._discard(key, obj)
+        return obj
+
+    def _retain(self):
+        # retention of the parent cache, or none once it has been dropped
+        parent = self.parent()
+        if parent is None:
+            return 0
+        return parent.retain
+
+    def _purge(self):
+        # drop records past retention, skipping entries for records that
+        # have since been replaced or removed
+        limit = time.time() - self._retain()
+        while self._heap and (self._heap[0][0] < limit):
+            obj = heapq.heappop(self._heap)[2]
+            if self._lru.get(obj.key) is obj:
+                self._remove(obj.key)
+                self._stats.incr('expirations')
+        if len(self._heap) > 2*len(self._lru) + 64:
+            self._heap = [e for e in self._heap
+                            if self._lru.get(e[2].key) is e[2]]
+            heapq.heapify(self._heap)
+
+    def _evict(self):
+        retain = self._retain()
+        while len(self._lru) and ((len(self._lru) > self.maxentries) or
+                                  (self.size > self.maxbytes)):
+            key, obj = next(iter(self._lru.items()))
+            self._remove(key)
+            if obj.overdue > retain:
+                self._stats.incr('expirations')
+            else:
+                self._stats.incr('evictions')
+                if DEBUG:
+                    print("evicting {0} from memory cache".format(key))
+
+    def changed(self):
+        return self._writes != self._seen
+
+    def get(self, date):
+        with self._lock:
+            self._seen = self._writes
+            # walk back from the newest record until reaching those the
+            # parent has already seen
+            newobjs = []
+            for obj in reversed(self._added.values()):
+                if obj.creation <= date:
+                    break
+                newobjs.append(obj)
+            newobjs.reverse()
+            return newobjs
+
+    def lookup(self, key):
+        with self._lock:
+            obj = self._lru.get(key)
+            if obj is not None:
+                self._lru.move_to_end(key)
+            return obj
+
+    def put(self, key, value, lifetime, meta=None):
+        obj = MemoryCacheObject(self, key, value, lifetime, meta=meta)
+        with self._lock:
+            if key in self._lru:
+                self._remove(key)
+            if obj.size > self.maxbytes:
+                # would not fit even in an empty cache
+                self._stats.incr('evictions')
+                return []
+            self._stats.incr('puts')
+            self._lru[key] = obj
+            self._added[key] = obj
+            for tag in obj.tags:
+                self._tagged.setdefault(tag, set()).add(key)
+            # the record is handed straight to the parent, so it only
+            # needs to read the engine if it had fallen behind already
+            synced = self._seen == self._writes
+            self._writes += 1
+            if synced:
+                self._seen = self._writes
+            self.size += obj.size
+            heapq.heappush(self._heap,
+                           (obj.creation + obj.lifetime, id(obj), obj))
+            self._purge()
+            self._evict()
+            return [obj]
+
+    def expire(self, key):
+        with self._lock:
+            if key in self._lru:
+                self._remove(key)
+
+    def invalidate(self, tag):
+        with self._lock:
+            for key in list(self._tagged.get(tag, ())):
+                self._remove(key)
@@ -20,8 +20,12 @@ class NullEngine(CacheEngine):
     def get(self, date):
         return []
 
-    def put(self, key, value, lifetime):
+    def put(self, key, value, lifetime, meta=None):
+        self._stats.incr('puts')
         return []
 
     def expire(self, key):
         pass
+
+    def invalidate(self, tag):
+        pass
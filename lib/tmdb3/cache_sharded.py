@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#-----------------------
+# Name: cache_sharded.py
+# Python Library
+# Author: Raymond Wagner
+# Purpose: File-backed cache spread over several files by key hash, each
+#          with its own lock, to reduce contention between processes
+#-----------------------
+
+from .tmdb_exceptions import *
+from .cache_engine import CacheEngine
+from .cache_file import FileEngine, _Compactor, _keyhash
+
+
+class ShardedFileEngine(CacheEngine):
+    """
+    File-backed engine, spreading keys by hash over `shards` cache files,
+    each a file engine with its own lock and slot table. Writers to
+    different shards do not block each other, or readers of other shards,
+    and a full rewrite only touches the one shard that filled up.
+
+    Shard files are named after `filename`, with the shard number and
+    count appended, so that changing the count starts a new set of files
+    rather than finding keys in the wrong shard.
+
+    If `compactinterval` is given, a single background thread compacts
+    every shard in turn, every that many seconds.
+    """
+    name = 'sharded'
+
+    def __init__(self, parent):
+        super(ShardedFileEngine, self).__init__(parent)
+        self.configure(None)
+
+    def configure(self, filename, shards=8, compactinterval=None,
+                  **kwargs):
+        if shards < 1:
+            raise TMDBCacheError("Invalid cache shard count specified: " +
+                                 str(shards))
+        # a budget is shared evenly between the shards
+        for name in ('maxsize', 'maxcount'):
+            if kwargs.get(name) is not None:
+                kwargs[name] = max(kwargs[name]//shards, 1)
+        self.cachefile = filename
+        self.shards = []
+        for i in range(shards):
+            shard = FileEngine(self.parent())
+            if filename is not None:
+                shard.configure('{0}.{1}of{2}'.format(filename, i+1, shards),
+                                **kwargs)
+            self.shards.append(shard)
+        self._compactor = None
+        if compactinterval:
+            self._compactor = _Compactor(self, compactinterval)
+            self._compactor.start()
+
+    def _shard(self, key):
+        return self.shards[_keyhash(key) % len(self.shards)]
+
+    def stats(self):
+        """Return the totals of the statistics of every shard."""
+        stats = super(ShardedFileEngine, self).stats()
+        for shard in self.shards:
+            for name, value in shard.stats().items():
+                stats[name] = stats.get(name, 0) + value
+        stats['shards'] = len(self.shards)
+        return stats
+
+    def reset_stats(self):
+        super(ShardedFileEngine, self).reset_stats()
+        for shard in self.shards:
+            shard.reset_stats()
+
+    def changed(self):
+        return any(shard.changed() for shard in self.shards)
+
+    def get(self, date):
+        # each shard is read from where it was last read, as the newest
+        # record seen in one says nothing of what has been seen in another
+        objs = []
+        for shard in self.shards:
+            objs.extend(shard.get(shard.age if date else 0))
+        return objs
+
+    def lookup(self, key):
+        return self._shard(key).lookup(key)
+
+    def touch(self, obj):
+        self._shard(obj.key).touch(obj)
+
+    def put(self, key, value, lifetime, meta=None):
+        return self._shard(key).put(key, value, lifetime, meta)
+
+    def expire(self, key):
+        return self._shard(key).expire(key)
+
+    def compact(self, steps=None):
+        """
+        Compact each shard in turn, running at most `steps` steps on each,
+        as for the file engine. Returns the bytes reclaimed.
+        """
+        return sum(shard.compact(steps) for shard in self.shards)
+
+    def invalidate(self, tag):
+        objs = []
+        for shard in self.shards:
+            objs.extend(shard.invalidate(tag) or [])
+        return objs
+
+    def lock(self, key):
+        """
+        Hold an exclusive lock for the given key, through the lock file of
+        the shard holding it.
+        """
+        return self._shard(key).lock(key)
@@ -0,0 +1,329 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#-----------------------
+# Name: cache_sqlite.py
+# Python Library
+# Author: Raymond Wagner
+# Purpose: Persistant SQLite-backed cache, indexed by key and expiration,
+#          and using write-ahead logging to allow concurrent readers and
+#          writers across processes.
+#-----------------------
+
+import contextlib
+import threading
+import sqlite3
+import atexit
+import zlib
+import json
+import time
+import os
+import io
+
+from .tmdb_exceptions import *
+from .cache_engine import CacheEngine, CacheObject
+from .cache_file import RangeLock, parse_filename
+from .cache_codec import Codec, decode
+from weakref import ref
+
+DEBUG = False
+
+_schema = """
+CREATE TABLE IF NOT EXISTS cache (
+    version  INTEGER PRIMARY KEY AUTOINCREMENT,
+    key      TEXT NOT NULL UNIQUE,
+    data     BLOB NOT NULL,
+    meta     TEXT,
+    creation REAL NOT NULL,
+    lifetime REAL NOT NULL,
+    expires  REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires);
+CREATE TABLE IF NOT EXISTS tags (
+    tag      TEXT NOT NULL,
+    key      TEXT NOT NULL,
+    expires  REAL NOT NULL,
+    PRIMARY KEY (tag, key)
+);
+CREATE INDEX IF NOT EXISTS tags_key ON tags (key);
+CREATE INDEX IF NOT EXISTS tags_expires ON tags (expires);
+"""
+
+
+def _flush(engine):
+    # commit any writes still pending at exit
+    engine = engine()
+    if engine is not None:
+        engine.flush()
+
+
+class SqliteEngine(CacheEngine):
+    """
+    SQLite-backed engine. Records are indexed by key, by a version number
+    that is never reused, and grows with each write, so that only records
+    added since the last read are loaded, and by expiration time, so that
+    records no longer retained are removed with a single range delete.
+
+    Writes are batched, and committed once `batchsize` records are
+    pending, `batchtime` seconds after the first of them, or when the lock
+    on a key is released, so other processes see the result of a query
+    before they are allowed to repeat it.
+
+    Tags are indexed in a separate table. Removed records are replaced
+    by tombstones, so that other processes see the removal when next
+    reading new records.
+
+    Data is encoded with the `codec` serializer, and compressed with
+    `compression`, if given. Rows written as JSON text by earlier releases
+    are still read.
+    """
+    name = 'sqlite'
+
+    def __init__(self, parent):
+        super(SqliteEngine, self).__init__(parent)
+        self._lock = threading.RLock()
+        self.configure(None)
+        atexit.register(_flush, ref(self))
+
+    def configure(self, filename, batchsize=32, batchtime=1.0, timeout=30,
+                  codec='json', compression=None):
+        self.cachefile = filename
+        self.codec = Codec(codec, compression)
+        self.batchsize = batchsize
+        self.batchtime = batchtime
+        self.timeout = timeout
+        self.conn = None
+        self.lockfd = None
+        self.pid = None
+        self.version = 0
+        self.dataversion = None
+        self._pending = {}
+        self._pendingsince = None
+
+    def _connect(self):
+        # connections must not be shared across a fork
+        if (self.conn is not None) and (self.pid == os.getpid()):
+            return self.conn
+        if self.cachefile is None:
+            raise TMDBCacheError("No cache filename given.")
+        filename = parse_filename(self.cachefile)
+        if not os.path.isdir(os.path.dirname(filename) or '.'):
+            raise TMDBCacheDirectoryError(filename)
+        try:
+            conn = sqlite3.connect(filename, timeout=self.timeout,
+                                   isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.executescript(_schema)
+        except sqlite3.OperationalError:
+            if os.path.exists(filename) and \
+                    not os.access(filename, os.W_OK):
+                raise TMDBCacheWriteError(filename)
+            raise TMDBCacheReadError(filename)
+        self.conn = conn
+        self.pid = os.getpid()
+        self.lockfd = None
+        self._pending = {}
+        self._pendingsince = None
+        return conn
+
+    def _sequence(self, conn):
+        # last version number assigned, by any process
+        row = conn.execute("SELECT seq FROM sqlite_sequence " +
+                           "WHERE name = 'cache'").fetchone()
+        return row[0] if row else 0
+
+    def _dataversion(self):
+        # changes whenever another connection commits to the database
+        return self._connect().execute('PRAGMA data_version').fetchone()[0]
+
+    def stats(self):
+        stats = super(SqliteEngine, self).stats()
+        with self._lock:
+            try:
+                conn = self._connect()
+            except TMDBCacheError:
+                stats['bytes'] = 0
+            else:
+                stats['bytes'] = \
+                        conn.execute('PRAGMA page_count').fetchone()[0] * \
+                        conn.execute('PRAGMA page_size').fetchone()[0]
+        return stats
+
+    def changed(self):
+        with self._lock:
+            return (self.dataversion is None) or \
+                   (self._dataversion() != self.dataversion)
+
+    def _load(self, row):
+        key, data, meta, creation, lifetime = row
+        try:
+            data = decode(data)
+        except TMDBCacheError:
+            # in an encoding no longer read, so treated as missing
+            return None
+        return CacheObject(key, data, lifetime, creation,
+                           json.loads(meta or '{}'))
+
+    def _rows(self):
+        if self.dataversion is None:
+            # on a cold start, skip the records already stored, which are
+            # instead served on demand through lookup(), so that opening a
+            # large database does not decode every row in it
+            self.dataversion = self._dataversion()
+            self.version = max(self.version, self._sequence(self._connect()))
+            return []
+        self.dataversion = self._dataversion()
+        rows = self._connect().execute(
+                'SELECT key, data, meta, creation, lifetime, version ' +
+                'FROM cache WHERE version > ? ORDER BY version',
+                (self.version,))
+        objs = []
+        for key, data, meta, creation, lifetime, version in rows:
+            self.version = max(self.version, version)
+            if key in self._pending:
+                # superseded by a write not yet committed
+                continue
+            obj = self._load((key, data, meta, creation, lifetime))
+            if obj is not None:
+                objs.append(obj)
+        return objs
+
+    def get(self, date):
+        with self._lock:
+            return self._rows()
+
+    def lookup(self, key):
+        with self._lock:
+            if key in self._pending:
+                return self._pending[key]
+            row = self._connect().execute(
+                    'SELECT key, data, meta, creation, lifetime ' +
+                    'FROM cache WHERE key = ?', (key,)).fetchone()
+            return self._load(row) if row else None
+
+    def lookup_many(self, keys):
+        with self._lock:
+            objs = [self._pending[key] for key in keys
+                                       if key in self._pending]
+            keys = [key for key in keys if key not in self._pending]
+            conn = self._connect()
+            # stay within the limit on bound parameters per statement
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i+500]
+                objs.extend(map(self._load, conn.execute(
+                        'SELECT key, data, meta, creation, lifetime ' +
+                        'FROM cache WHERE key IN ({0})'.format(
+                                ', '.join('?'*len(chunk))), chunk)))
+            return [obj for obj in objs if obj is not None]
+
+    def put(self, key, value, lifetime, meta=None):
+        obj = CacheObject(key, value, lifetime, meta=meta)
+        with self._lock:
+            newobjs = self._rows()
+            self._pending[key] = obj
+            if self._pendingsince is None:
+                self._pendingsince = time.time()
+            if (len(self._pending) >= self.batchsize) or \
+                    (time.time() - self._pendingsince >= self.batchtime):
+                self.flush()
+            newobjs.append(obj)
+            return newobjs
+
+    def flush(self):
+        """Commit all pending writes, and purge records no longer retained."""
+        with self._lock:
+            if not self._pending or (self.pid != os.getpid()):
+                return
+            pending, self._pending = self._pending, {}
+            self._pendingsince = None
+            parent = self.parent()
+            conn = self._connect()
+            start = time.perf_counter()
+            conn.execute('BEGIN IMMEDIATE')
+            self._stats.incr('lockwait', time.perf_counter() - start)
+            expired = 0
+            try:
+                last = self._sequence(conn)
+                conn.executemany(
+                        'INSERT OR REPLACE INTO cache (key, data, meta, ' +
+                        'creation, lifetime, expires) VALUES (?, ?, ?, ?, ?, ?)',
+                        [(obj.key, self.codec.dumps(obj.data),
+                          json.dumps(obj.meta),
+                          obj.creation, obj.lifetime,
+                          obj.creation + obj.lifetime)
+                         for obj in pending.values()])
+                current = self._sequence(conn)
+                conn.executemany('DELETE FROM tags WHERE key = ?',
+                                 [(key,) for key in pending])
+                conn.executemany(
+                        'INSERT OR REPLACE INTO tags (tag, key, expires) ' +
+                        'VALUES (?, ?, ?)',
+                        [(tag, obj.key, obj.creation + obj.lifetime)
+                         for obj in pending.values() for tag in obj.tags])
+                if parent is not None:
+                    cutoff = time.time() - parent.retain
+                    expired = conn.execute(
+                            'DELETE FROM cache WHERE expires < ?',
+                            (cutoff,)).rowcount
+                    conn.execute('DELETE FROM tags WHERE expires < ?',
+                                 (cutoff,))
+            except:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+            self._stats.incr('puts', len(pending))
+            self._stats.incr('expirations', expired)
+            if last == self.version:
+                # no other process has written since the last read, so
+                # there is no need to read back what was just written
+                self.version = current
+            if DEBUG:
+                print("committed {0} records to {1}"\
+                            .format(len(pending), self.cachefile))
+
+    @contextlib.contextmanager
+    def lock(self, key):
+        """
+        Hold an exclusive lock for the given key, shared with all processes
+        using this database. Keys are hashed onto 64K byte ranges of a
+        separate lock file, so unrelated keys rarely contend.
+        """
+        with self._lock:
+            self._connect()
+            if self.lockfd is None:
+                try:
+                    self.lockfd = io.open(
+                            parse_filename(self.cachefile)+'.lock', 'a+b')
+                except IOError:
+                    # cannot share locks, fall back to process-local locking
+                    self.lockfd = False
+            lockfd = self.lockfd
+        if not lockfd:
+            yield
+            return
+        with self._waiting(RangeLock(lockfd,
+                                     zlib.crc32(key.encode('utf-8')) & 0xFFFF)):
+            try:
+                yield
+            finally:
+                if key in self._pending:
+                    self.flush()
+
+    def _remove(self, keys):
+        # replace records with tombstones, committed at once
+        with self._lock:
+            for key in keys:
+                self._pending[key] = CacheObject.tombstone(key)
+            self.flush()
+
+    def expire(self, key):
+        self._remove([key])
+
+    def invalidate(self, tag):
+        with self._lock:
+            keys = set(key for key, obj in self._pending.items()
+                           if tag in obj.tags)
+            keys.update(key for key, in self._connect().execute(
+                                'SELECT key FROM tags WHERE tag = ?', (tag,)))
+            self._remove(keys)
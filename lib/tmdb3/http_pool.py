@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#-----------------------
+# Name: http_pool.py
+# Python Library
+# Author: Raymond Wagner
+# Purpose: Thread-safe pool of persistent HTTP/1.1 connections, allowing
+#          sequential API calls to reuse a single TCP (and TLS) session
+#          rather than handshaking once per request.
+#-----------------------
+
+from io import BytesIO
+import http.client
+import threading
+import socket
+import time
+
+# errors raised when a pooled connection was silently dropped by the
+# server while sitting idle, rather than by a failure of the new request
+_stale_errors = (http.client.RemoteDisconnected,
+                 http.client.BadStatusLine,
+                 ConnectionResetError,
+                 ConnectionAbortedError,
+                 BrokenPipeError)
+
+# methods safe to send again, where the server may have acted on the first
+_idempotent = ('GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE', 'TRACE')
+
+
+class BufferedResponse(object):
+    """
+    Fully buffered response. The body is read off the socket before the
+    connection is returned to the pool, so the object can be consumed at
+    leisure without holding the connection hostage.
+    """
+    def __init__(self, url, status, reason, headers, body):
+        self.url = url
+        self.status = self.code = status
+        self.reason = self.msg = reason
+        self.headers = headers
+        self.fp = BytesIO(body)
+
+    def read(self, *args):
+        return self.fp.read(*args)
+
+    def info(self):
+        return self.headers
+
+    def geturl(self):
+        return self.url
+
+    def getcode(self):
+        return self.status
+
+    def close(self):
+        self.fp.close()
+
+
+class ConnectionPool(object):
+    """
+    Keeps a bounded stack of idle keep-alive connections for each
+    (scheme, host, port) target. Connections are handed out most recently
+    used first, so the warmest socket is always tried, and are dropped
+    once they have sat idle for longer than `idle_timeout` seconds.
+
+    When more than `maxsize` connections are in use at once, additional
+    connections are opened as needed, and closed rather than pooled when
+    released.
+    """
+    _classes = {'http': http.client.HTTPConnection,
+                'https': http.client.HTTPSConnection}
+
+    def __init__(self, maxsize=4, idle_timeout=30, timeout=None):
+        self._lock = threading.Lock()
+        self._idle = {}
+        self.configure(maxsize, idle_timeout, timeout)
+        self.reset_stats()
+
+    def configure(self, maxsize=4, idle_timeout=30, timeout=None):
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.clear()
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {'requests': 0,  # requests sent through the pool
+                           'created': 0,   # new connections opened
+                           'reused': 0,    # requests sent on an idle one
+                           'retried': 0,   # resent after a stale reuse
+                           'expired': 0,   # dropped for idle timeout
+                           'discarded': 0} # dropped for a full pool
+
+    def stats(self):
+        """Return a snapshot of the pool counters."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['idle'] = sum(len(v) for v in self._idle.values())
+        return stats
+
+    def clear(self):
+        """Close all idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for stamp, conn in conns:
+                conn.close()
+
+    def _acquire(self, target, timeout):
+        now = time.time()
+        with self._lock:
+            conns = self._idle.get(target, [])
+            while conns:
+                stamp, conn = conns.pop()
+                if now - stamp > self.idle_timeout:
+                    self._stats['expired'] += 1
+                    conn.close()
+                    continue
+                self._stats['reused'] += 1
+                conn.timeout = timeout
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                return conn, True
+            self._stats['created'] += 1
+
+        scheme, host, port = target
+        if timeout is None:
+            timeout = socket._GLOBAL_DEFAULT_TIMEOUT
+        return self._classes[scheme](host, port, timeout=timeout), False
+
+    def _release(self, target, conn):
+        with self._lock:
+            conns = self._idle.setdefault(target, [])
+            if len(conns) < self.maxsize:
+                conns.append((time.time(), conn))
+                return
+            self._stats['discarded'] += 1
+        conn.close()
+
+    def urlopen(self, method, url, body=None, headers=None, timeout=None):
+        """
+        Perform a request against the given URL, returning a fully read
+        BufferedResponse regardless of its HTTP status.
+        """
+        scheme, rest = url.split('://', 1)
+        netloc, _, selector = rest.partition('/')
+        host, _, port = netloc.partition(':')
+        port = int(port) if port else None
+        target = (scheme.lower(), host, port)
+        if timeout is None:
+            timeout = self.timeout
+        if headers is None:
+            headers = {}
+
+        with self._lock:
+            self._stats['requests'] += 1
+
+        while True:
+            conn, reused = self._acquire(target, timeout)
+            sent = False
+            try:
+                conn.request(method, '/'+selector, body, headers)
+                sent = True
+                resp = conn.getresponse()
+                data = resp.read()
+            except _stale_errors:
+                conn.close()
+                if not reused:
+                    raise
+                if sent and (method.upper() not in _idempotent):
+                    # the server may have received the request, and acted
+                    # on it before dropping the connection
+                    raise
+                # idle connection was closed on the far end, try again
+                # with the next pooled connection, or a fresh one
+                with self._lock:
+                    self._stats['retried'] += 1
+                continue
+            except:
+                conn.close()
+                raise
+            break
+
+        if resp.will_close:
+            conn.close()
+        else:
+            self._release(target, conn)
+        return BufferedResponse(url, resp.status, resp.reason, resp.msg, data)
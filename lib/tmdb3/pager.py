@@ -7,6 +7,7 @@
 #-----------------------
 
 from collections import Sequence, Iterator
+from .request import AsyncRequest
 
 
 class PagedIterator(Iterator):
@@ -69,7 +70,7 @@ class PagedList(Sequence):
             raise IndexError("list index outside range")
         if (index >= len(self._data)) \
                 or isinstance(self._data[index], UnpagedData):
-            self._populatepage(index/self._pagesize + 1)
+            self._populatepage(index//self._pagesize + 1)
         return self._data[index]
 
     def __setitem__(self, index, value):
@@ -82,13 +83,16 @@ class PagedList(Sequence):
         raise NotImplementedError
 
     def _populatepage(self, page):
+        self._fillpage(page, self._getpage(page))
+
+    def _fillpage(self, page, items):
         pagestart = (page-1) * self._pagesize
         if len(self._data) < pagestart:
             self._data.extend(UnpagedData()*(pagestart-len(self._data)))
         if len(self._data) == pagestart:
-            self._data.extend(self._getpage(page))
+            self._data.extend(items)
         else:
-            for data in self._getpage(page):
+            for data in items:
                 self._data[pagestart] = data
                 pagestart += 1
 
@@ -101,12 +105,37 @@ class PagedRequest(PagedList):
     """
     Derived PageList that provides a list-like object with automatic
     paging intended for use with search requests.
+
+    The first page is not requested until the list is first used, so that
+    it may instead be iterated asynchronously with `async for`, in which
+    case all pages are retrieved through AsyncRequest.
     """
     def __init__(self, request, handler=None):
         self._request = request
         if handler:
             self._handler = handler
-        super(PagedRequest, self).__init__(self._getpage(1), 20)
+        super(PagedRequest, self).__init__([], 20)
+
+    def __len__(self):
+        if not hasattr(self, '_len'):
+            self._populatepage(1)
+        return self._len
+
+    def __aiter__(self):
+        return self._aiterate()
+
+    async def _aiterate(self):
+        index = 0
+        while (not hasattr(self, '_len')) or (index < self._len):
+            if (index >= len(self._data)) \
+                    or isinstance(self._data[index], UnpagedData):
+                page = index//self._pagesize + 1
+                self._fillpage(page, await self._agetpage(page))
+                if index >= len(self._data):
+                    # results ran short of the advertised total
+                    break
+            yield self._data[index]
+            index += 1
 
     def _getpage(self, page):
         req = self._request.new(page=page)
@@ -117,3 +146,10 @@ class PagedRequest(PagedList):
                 yield None
             else:
                 yield self._handler(item)
+
+    async def _agetpage(self, page):
+        req = AsyncRequest.fromRequest(self._request.new(page=page))
+        res = await req.readJSON()
+        self._len = res['total_results']
+        return [None if item is None else self._handler(item)
+                for item in res['results']]
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#-----------------------
+# Name: ratelimit.py
+# Python Library
+# Author: Raymond Wagner
+# Purpose: Token bucket rate limiter for API calls, optionally shared
+#          between processes through a flock'd state file, and adjusted
+#          using the rate limit headers returned by TMDb.
+#-----------------------
+
+import threading
+import warnings
+import struct
+import time
+import os
+
+from .cache_file import Flock, parse_filename
+from .stats import Histogram
+
+DEBUG = False
+
+
+class TokenBucket(object):
+    """
+    Token bucket allowing bursts of up to `capacity` requests, refilled
+    at a rate of `capacity` tokens every `period` seconds.
+
+    Tokens are reserved rather than waited for, so the bucket may go
+    negative. A caller that takes a token from an empty bucket is told
+    how long to wait for it to refill, and later callers queue up behind
+    it accordingly.
+    """
+    def __init__(self, *args, **kwargs):
+        self._lock = threading.Lock()
+        self.configure(*args, **kwargs)
+        self.reset_stats()
+
+    def configure(self, capacity=30, period=10):
+        self.capacity = capacity
+        self.period = period
+        self._limit = None  # capacity reported by the server, if any
+        self._state = None
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {'requests': 0,  # tokens taken
+                           'waits': 0,     # requests made to wait
+                           'waited': 0.0,  # total seconds spent waiting
+                           'maxwait': 0.0, # longest single wait
+                           'throttled': 0} # 429 responses received
+            self._waits = Histogram()
+
+    def stats(self):
+        """Return a snapshot of the limiter counters."""
+        with self._lock:
+            stats = dict(self._stats)
+            stats['wait'] = self._waits.snapshot()
+            return stats
+
+    def _capacity(self):
+        # the limit reported by the server takes precedence over the one
+        # configured, which is never taken from the state of the bucket
+        if self._limit:
+            return self._limit
+        return self.capacity
+
+    def _load(self):
+        # returns tokens and timestamp
+        if self._state is None:
+            return (self._capacity(), time.time())
+        return self._state
+
+    def _store(self, state):
+        self._state = state
+
+    def _transact(self, func):
+        with self._lock:
+            state = func(*self._load())
+            self._store(state[:2])
+        return state[2:]
+
+    def reserve(self):
+        """
+        Take a token, returning the time in seconds the caller must wait
+        before making its request. Does not block.
+        """
+        def take(tokens, stamp):
+            now = time.time()
+            capacity = self._capacity()
+            rate = float(capacity)/self.period
+            tokens = min(capacity, tokens + (now-stamp)*rate) - 1
+            return tokens, now, max(-tokens/rate, 0)
+        delay, = self._transact(take)
+        return delay
+
+    def record(self, delay):
+        """Record a wait of `delay` seconds against the statistics."""
+        with self._lock:
+            self._stats['requests'] += 1
+            if delay > 0:
+                self._stats['waits'] += 1
+                self._stats['waited'] += delay
+                self._stats['maxwait'] = max(self._stats['maxwait'], delay)
+                self._waits.observe(delay)
+
+    def acquire(self):
+        """Take a token, blocking until it is available."""
+        delay = self.reserve()
+        if delay > 0:
+            if DEBUG:
+                print("rate limiting - waiting {0} seconds".format(delay))
+            time.sleep(delay)
+        self.record(delay)
+        return delay
+
+    def update(self, status, headers):
+        """
+        Adjust the bucket to rate limit information from a response.
+        X-RateLimit-Limit resizes the bucket in place of the capacity it
+        was configured with, X-RateLimit-Remaining caps the available
+        tokens, and X-RateLimit-Reset or Retry-After hold off further
+        requests once the server reports the budget spent.
+        """
+        def _header(name):
+            try:
+                return float(headers[name])
+            except (KeyError, TypeError, ValueError):
+                return None
+        limit = _header('X-RateLimit-Limit')
+        remaining = _header('X-RateLimit-Remaining')
+        reset = _header('X-RateLimit-Reset')
+        retry = _header('Retry-After')
+        if status == 429:
+            with self._lock:
+                self._stats['throttled'] += 1
+        if (limit, remaining, retry) == (None, None, None):
+            return
+
+        def adjust(tokens, stamp):
+            now = time.time()
+            if limit:
+                self._limit = limit
+            capacity = self._capacity()
+            rate = float(capacity)/self.period
+            tokens = min(capacity, tokens + (now-stamp)*rate)
+            if remaining is not None:
+                tokens = min(tokens, remaining)
+            hold = None
+            if (status == 429) and (retry is not None):
+                hold = retry
+            elif (remaining == 0) and (reset is not None):
+                hold = reset - now
+            if hold is not None:
+                tokens = min(tokens, -max(hold, 0)*rate)
+            return tokens, now
+        self._transact(adjust)
+
+
+class FileTokenBucket(TokenBucket):
+    """
+    Token bucket with its state stored in a file, allowing all processes
+    on a host to draw from the same request budget. The file is held
+    under an exclusive flock only for the duration of each update. Only
+    the tokens are shared, and each process refills them at the rate it
+    was configured with.
+    """
+    _struct = struct.Struct('dd')  # tokens, timestamp
+
+    def configure(self, capacity=30, period=10, filename='pytmdb3.ratelimit'):
+        super(FileTokenBucket, self).configure(capacity, period)
+        self.filename = parse_filename(filename)
+        self._fd = None
+        self._pid = None
+
+    def _open(self):
+        # flock is held per open file, so a descriptor inherited across
+        # a fork would be shared with the parent, rather than excluding it
+        if (self._fd is not None) and (self._pid == os.getpid()):
+            return True
+        try:
+            self._fd = os.fdopen(os.open(self.filename,
+                                         os.O_RDWR | os.O_CREAT, 0o666),
+                                 'r+b')
+            self._pid = os.getpid()
+            return True
+        except (IOError, OSError) as e:
+            warnings.warn(('Could not open rate limit file {0}: {1}. ' +
+                           'Falling back to per-process rate limiting.')
+                          .format(self.filename, e))
+            self.filename = None
+            return False
+
+    def _transact(self, func):
+        with self._lock:
+            if (self.filename is None) or not self._open():
+                state = func(*self._load())
+                self._store(state[:2])
+                return state[2:]
+            with Flock(self._fd, Flock.LOCK_EX):
+                self._fd.seek(0)
+                raw = self._fd.read(self._struct.size)
+                if len(raw) == self._struct.size:
+                    state = func(*self._struct.unpack(raw))
+                else:
+                    state = func(*self._load())
+                self._fd.seek(0)
+                self._fd.write(self._struct.pack(*state[:2]))
+                self._fd.flush()
+        return state[2:]
+
+
+def get_limiter(capacity=30, period=10, filename=None):
+    """
+    Return a rate limiter allowing `capacity` requests every `period`
+    seconds, shared with other processes through `filename` if given.
+    """
+    if filename is None:
+        return TokenBucket(capacity, period)
+    return FileTokenBucket(capacity, period, filename)
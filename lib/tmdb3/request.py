@@ -10,19 +10,154 @@
 
 from .tmdb_exceptions import *
 from .locales import get_locale
-from .cache import Cache
+from .cache import Cache, NOT_MODIFIED
+from .transport import Transports, shared_pool
+from .ratelimit import get_limiter
+from .retry import RetryPolicy, CircuitBreaker
 
-from urllib.parse import urlencode
+from urllib.parse import urlencode, urljoin, urlsplit, parse_qsl
 import urllib.request, urllib.error, urllib.parse
+import http.client
+import hashlib
+import asyncio
+import fnmatch
+import socket
 import json
+import math
+import time
+import re
 import os
 
 DEBUG = False
 cache = Cache(filename='pytmdb3.cache')
+pool = shared_pool
+transport = Transports['pooled']()
+limiter = get_limiter(filename='pytmdb3.ratelimit')
+retry = RetryPolicy()
+breaker = CircuitBreaker()
+
+# failures to reach the server at all, as opposed to error responses
+_network_errors = (OSError, http.client.HTTPException, asyncio.TimeoutError)
+
+# failures to connect, before any of the request was written
+_unsent_errors = (ConnectionRefusedError, socket.gaierror)
+
+# methods whose requests are retried whatever the failure, where others,
+# such as setting a rating, may have been acted on by the server, and are
+# only sent again after a 429, or a failure to connect
+_retried_methods = ('GET', 'HEAD', 'OPTIONS')
 
 #DEBUG = True
 #cache = Cache(engine='null')
 
+# cache keys are prefixed by a namespace and format version, and leave out
+# credentials, so stored data survives a change of API key, while data
+# specific to a user is still kept apart by a hash of their session
+KEY_NAMESPACE = 'tmdb3'
+KEY_VERSION = 1
+_key_dropped = ('api_key',)
+_key_hashed = ('session_id', 'guest_session_id', 'request_token')
+
+
+def cache_key(url, kwargs):
+    """
+    Return the canonical cache key for an API path and its (encoded)
+    arguments, independent of argument order and API key.
+    """
+    args = []
+    for k, v in sorted(kwargs.items()):
+        if k in _key_dropped:
+            continue
+        if k in _key_hashed:
+            if not isinstance(v, bytes):
+                v = str(v).encode('utf-8')
+            v = hashlib.sha1(v).hexdigest()
+        args.append((k, v))
+    key = '{0}:v{1}:{2}'.format(KEY_NAMESPACE, KEY_VERSION, url.strip('/'))
+    if args:
+        key += '?' + urlencode(args)
+    return key
+
+
+def migrate_key(key):
+    """
+    Translate a cache key stored by an earlier release, keyed by the full
+    request URL, into the canonical form. Other keys are left unchanged.
+    """
+    if not isinstance(key, str) or ('://' not in key):
+        return key
+    parts = urlsplit(key)
+    path = parts.path
+    base = urlsplit(Request._base_url).path
+    if path.startswith(base):
+        path = path[len(base):]
+    return cache_key(path, dict(parse_qsl(parts.query,
+                                          keep_blank_values=True)))
+
+cache.migrate = migrate_key
+
+
+# API paths naming an entity by id, as the type and the id, from which
+# cached data is tagged, e.g. 'movie/550/images' as 'movie:550'
+_tagged = ('movie', 'tv', 'person', 'collection', 'company', 'genre',
+           'account', 'list')
+
+
+def cache_tags(url):
+    """
+    Return the tags for data cached from an API path, naming the entity
+    it belongs to, so all data for that entity can be invalidated at once.
+    """
+    parts = url.strip('/').split('/')
+    if (len(parts) > 1) and (parts[0] in _tagged) and \
+            (parts[1].isdigit() or (parts[0] == 'list')):
+        return ['{0}:{1}'.format(parts[0], parts[1])]
+    return []
+
+
+# lifetimes in seconds of cached data by API path, the first match winning
+DEFAULT_TTLS = (
+    ('configuration',           7*24*60*60),
+    ('genre/list',              7*24*60*60),
+    ('account',                 5*60),
+    ('account/*',               5*60),
+    ('latest/*',                10*60),
+    ('search/*',                60*60),
+    ('movie/now-playing',       60*60),
+    ('movie/popular',           60*60),
+    ('movie/top_rated',         60*60),
+    ('movie/upcoming',          60*60),
+    ('movie/*',                 24*60*60),
+    ('tv/*',                    24*60*60),
+    ('person/*',                24*60*60),
+    ('collection/*',            24*60*60),
+    ('company/*',               24*60*60),
+)
+
+
+class TTLPolicy(object):
+    """
+    Table of lifetimes for cached requests. Rules are pairs of a shell
+    style pattern, matched against the whole API path, and a lifetime in
+    seconds, given as a sequence or an ordered dict. The first rule to
+    match is used, and paths matching none are given `default`.
+    """
+    def __init__(self, rules=(), default=3600):
+        if isinstance(rules, dict):
+            rules = rules.items()
+        self.rules = [(pattern, re.compile(fnmatch.translate(pattern)).match,
+                       lifetime) for pattern, lifetime in rules]
+        self.default = default
+
+    def lifetime(self, path):
+        path = path.strip('/')
+        for pattern, match, lifetime in self.rules:
+            if match(path):
+                return lifetime
+        return self.default
+
+ttls = TTLPolicy(DEFAULT_TTLS)
+
 
 def set_key(key):
     """
@@ -38,14 +173,192 @@ def set_key(key):
     Request._api_key = key
 
 
-def set_cache(engine=None, *args, **kwargs):
-    """Specify caching engine and properties."""
+def set_cache(engine=None, *args, ttls=None, **kwargs):
+    """
+    Specify caching engine and properties. If given, `ttls` is passed to
+    set_ttls(), and when it is the only argument, the engine is kept.
+    """
+    if ttls is not None:
+        set_ttls(ttls)
+        if (engine is None) and not args and not kwargs:
+            return
     cache.configure(engine, *args, **kwargs)
 
 
+def invalidate(*tags):
+    """
+    Remove all cached data carrying any of the given tags, such as
+    'movie:550', or 'account:<id>' for the lists of an account, from the
+    cache and from every process sharing it.
+    """
+    for tag in tags:
+        cache.invalidate(tag)
+
+
+def set_ttls(rules, default=3600):
+    """
+    Specify how long cached data is kept for, by API path.
+        rules   -- (pattern, seconds) pairs, as a sequence or dict, taking
+                   precedence over DEFAULT_TTLS. Patterns are shell style,
+                   matched against the whole path, e.g. 'movie/*/images',
+                   and the first match is used.
+        default -- seconds for paths matching no rule
+    The lifetime of a single request can still be set through its
+    `lifetime` attribute, with zero disabling caching. Either way, data is
+    kept no longer than the max-age the server gives for it, if any.
+    """
+    global ttls
+    if isinstance(rules, dict):
+        rules = rules.items()
+    ttls = TTLPolicy(list(rules) + list(DEFAULT_TTLS), default)
+
+
+def set_cache_l1(maxentries=1024, ttl=None):
+    """
+    Specify properties of the in-memory tier held in front of the cache
+    engine.
+        maxentries -- number of records held, dropping the least recently
+                      used, which remain available from the engine
+        ttl        -- seconds a record is held before being checked against
+                      the engine for changes by other processes, or None to
+                      use the engine's default, which for most is to check
+                      only once it has expired
+    """
+    cache.configure_l1(maxentries, ttl)
+
+
+def set_cache_grace(grace=0, maxage=None):
+    """
+    Specify how expired cache data may be served while it is refreshed.
+        grace  -- seconds after expiring that data is still returned at
+                  once, while a single background request replaces it
+        maxage -- seconds after creation that data is no longer served
+                  this way, regardless of grace, or None for no limit
+    """
+    cache.configure_grace(grace, maxage)
+
+
+def get_cache_stats():
+    """
+    Return counters for the cache, with the number of reads served from
+    memory as 'hits', read from the engine as 'promotions', finding no
+    current data as 'misses', and served expired data as 'stale', along
+    with the number of background 'refreshes' started, histograms of
+    'get' and 'put' latency, and the statistics of the 'engine'.
+    """
+    return cache.stats()
+
+
+def set_transport(name='pooled', *args, **kwargs):
+    """
+    Specify the transport used to perform requests, and its properties.
+        'urllib' -- a new connection for each request, through urllib
+        'pooled' -- persistent connections from the pool configured by
+                    set_pool(), the default
+        'replay' -- responses played back from a cassette file, and with
+                    record=True, captured to it from live requests
+    """
+    global transport
+    if name not in Transports:
+        raise TMDBTransportError("Invalid transport specified: "+name)
+    transport = Transports[name]()
+    transport.configure(*args, **kwargs)
+
+
+def set_pool(maxsize=4, idle_timeout=30, timeout=None):
+    """
+    Specify connection pool properties.
+        maxsize      -- number of idle connections kept open per host
+        idle_timeout -- seconds an idle connection is kept before it is
+                        assumed closed by the server and discarded
+        timeout      -- socket timeout for pooled connections
+    """
+    pool.configure(maxsize, idle_timeout, timeout)
+
+
+def get_pool_stats():
+    """
+    Return counters for the connection pool, with the number of
+    connections 'created' and 'reused', among others.
+    """
+    return pool.stats()
+
+
+def set_ratelimit(capacity=30, period=10, filename='pytmdb3.ratelimit'):
+    """
+    Specify rate limiting properties, allowing bursts of up to `capacity`
+    requests, and an average of `capacity` requests every `period`
+    seconds. The budget is shared between all processes using the same
+    `filename`, or kept per-process if `filename` is None.
+    """
+    global limiter
+    limiter = get_limiter(capacity, period, filename)
+
+
+def get_ratelimit_stats():
+    """
+    Return counters for the rate limiter, including the number of
+    requests made to 'waits', and the total seconds 'waited'.
+    """
+    return limiter.stats()
+
+
+def get_stats():
+    """
+    Return a snapshot of all statistics, for export to monitoring, with
+    those of the 'cache', connection 'pool', rate 'limiter', and circuit
+    'breaker'.
+    """
+    return {'cache': cache.stats(),
+            'pool': pool.stats(),
+            'limiter': limiter.stats(),
+            'breaker': breaker.stats()}
+
+
+def reset_stats():
+    """Reset the counters of the cache, connection pool, and rate limiter."""
+    cache.reset_stats()
+    pool.reset_stats()
+    limiter.reset_stats()
+
+
+def set_retry(retries=3, backoff=0.5, maxbackoff=30, timeout=30,
+              statuses=(429, 500, 502, 503, 504)):
+    """
+    Specify retry properties for failed requests.
+        retries    -- number of times a request is retried
+        backoff    -- base delay in seconds, doubled with each retry, and
+                      randomized to avoid clients retrying in lockstep
+        maxbackoff -- longest delay between retries, including any
+                      requested by a Retry-After header
+        timeout    -- default socket timeout for each attempt, which can
+                      be overridden with the `timeout` of a Request
+        statuses   -- HTTP statuses considered transient
+    Requests that may change data on the server, such as setting a
+    rating, are only retried after a 429, or a failure to connect, so
+    that none is acted on twice.
+    """
+    global retry
+    retry = RetryPolicy(retries, backoff, maxbackoff, statuses)
+    Request.timeout = timeout
+
+
+def set_circuit_breaker(threshold=5, reset=30):
+    """
+    Specify circuit breaker properties. After `threshold` consecutive
+    failed requests, further requests fail immediately with TMDBOffline
+    for `reset` seconds, and are served from expired cache data where
+    available.
+    """
+    global breaker
+    breaker = CircuitBreaker(threshold, reset)
+
+
 class Request(urllib.request.Request):
     _api_key = None
     _base_url = "http://api.themoviedb.org/3/"
+    _maxredirects = 5
+    timeout = 30
 
     @property
     def api_key(self):
@@ -71,9 +384,13 @@ class Request(urllib.request.Request):
         url = '{0}{1}?{2}'\
                 .format(self._base_url, self._url, urlencode(kwargs))
 
+        self._key = cache_key(self._url, kwargs)
+        self.tags = cache_tags(self._url)
+
         urllib.request.Request.__init__(self, url)
         self.add_header('Accept', 'application/json')
-        self.lifetime = 3600  # 1hr
+        self.lifetime = ttls.lifetime(self._url)
+        self.meta = {}
 
     def new(self, **kwargs):
         """
@@ -90,50 +407,275 @@ class Request(urllib.request.Request):
         obj.lifetime = self.lifetime
         return obj
 
+    def cachekey(self):
+        """Return the key data for this request is cached under."""
+        return self._key
+
     def add_data(self, data):
         """Provide data to be sent with POST."""
-        urllib.request.Request.add_data(self, urlencode(data))
+        self.data = urlencode(data).encode('utf-8')
+        self.add_header('Content-Type', 'application/x-www-form-urlencoded')
+
+    def revalidate(self, meta):
+        """
+        Make the request conditional on the validators returned with a
+        previous response, so the server may reply 304 Not Modified.
+        """
+        if meta.get('etag'):
+            self.add_header('If-None-Match', meta['etag'])
+        if meta.get('modified'):
+            self.add_header('If-Modified-Since', meta['modified'])
 
     def open(self):
         """Open a file object to the specified URL."""
-        try:
-            if DEBUG:
-                print('loading '+self.get_full_url())
-                if self.has_data():
-                    print('  '+self.get_data())
-            return urllib.request.urlopen(self)
-        except urllib.error.HTTPError as e:
-            raise TMDBHTTPError(e)
+        attempt = 0
+        while True:
+            self._allow()
+            try:
+                resp = self._send()
+            except _network_errors as e:
+                delay = self._retry(attempt, error=e)
+            except BaseException:
+                # no outcome for the breaker, so free any trial it allowed
+                breaker.release()
+                raise
+            else:
+                delay = self._retry(attempt, resp=resp)
+                if delay is None:
+                    return self._response(resp)
+            time.sleep(delay)
+            attempt += 1
+
+    def _send(self):
+        url = self.get_full_url()
+        method, data = self.get_method(), self.data
+        headers = dict(self.header_items())
+        for i in range(self._maxredirects+1):
+            self._debug(url, data)
+            limiter.acquire()
+            resp = transport.urlopen(method, url, data, headers,
+                                     self.timeout)
+            limiter.update(resp.status, resp.headers)
+            redirect = self._redirect(resp, method, data, headers)
+            if redirect is None:
+                return resp
+            url, method, data = redirect
+        raise self._too_many(resp)
+
+    def _allow(self):
+        if not breaker.allow():
+            raise TMDBOffline('TMDb is unavailable, not retrying for ' +
+                              '{0} seconds.'.format(
+                                    max(math.ceil(breaker.retryat -
+                                                  time.time()), 1)))
+
+    def _retry(self, attempt, resp=None, error=None):
+        # returns the time to wait before retrying a request, or None if
+        # the response is to be used as is. any response short of a server
+        # error, including a 429, shows the API to be up
+        if (error is None) and (resp.status < 500):
+            breaker.success()
+        else:
+            breaker.failure()
+        if (resp is not None) and not retry.retryable(resp.status):
+            return None
+        if (attempt >= retry.retries) or \
+                not self._resendable(resp, error):
+            if error is not None:
+                raise TMDBOffline('Could not reach TMDb: {0}'.format(error))
+            return None
+        if DEBUG:
+            print('retrying after {0}'.format(
+                        error if error is not None else resp.status))
+        if resp is not None:
+            return retry.delay(attempt, resp.headers.get('Retry-After'))
+        return retry.delay(attempt)
+
+    def _resendable(self, resp, error):
+        if self.get_method() in _retried_methods:
+            return True
+        if resp is not None:
+            return resp.status == 429
+        # urllib wraps the error from the socket
+        return isinstance(getattr(error, 'reason', error), _unsent_errors)
+
+    def _debug(self, url, data):
+        if DEBUG:
+            print('loading '+url)
+            if data is not None:
+                print('  '+data.decode('utf-8'))
+
+    def _redirect(self, resp, method, data, headers):
+        # follow redirects, such as a move to https, returning the url,
+        # method and body of the next request, or None if not redirected.
+        # as browsers do, a 303, or a 301 or 302 in answer to a POST, is
+        # followed with a GET, dropping the body
+        if (resp.status not in (301, 302, 303, 307, 308)) \
+                or ('Location' not in resp.headers):
+            return None
+        if (resp.status == 303) or \
+                ((resp.status in (301, 302)) and (method == 'POST')):
+            method, data = 'GET', None
+            for name in list(headers):
+                if name.lower() in ('content-type', 'content-length'):
+                    del headers[name]
+        return urljoin(resp.url, resp.headers['Location']), method, data
+
+    def _too_many(self, resp):
+        return TMDBHTTPError(urllib.error.HTTPError(
+                resp.url, resp.status,
+                'Redirected more than {0} times'.format(self._maxredirects),
+                resp.headers, resp.fp))
+
+    def _response(self, resp):
+        if resp.status >= 400:
+            raise TMDBHTTPError(urllib.error.HTTPError(
+                    resp.url, resp.status, resp.reason, resp.headers, resp.fp))
+        return resp
 
     def read(self):
         """Return result from specified URL as a string."""
         return self.open().read().decode('utf-8')
 
-    @cache.cached(urllib.request.Request.get_full_url)
+    @cache.cached(cachekey)
     def readJSON(self):
         """Parse result from specified URL as JSON data."""
-        url = self.get_full_url()
         try:
             # catch HTTP error from open()
-            data = json.loads(self.open().read().decode('utf-8'))
+            return self._decode(self.open())
         except TMDBHTTPError as e:
-            try:
-                # try to load whatever was returned
-                data = json.loads(e.response)
-            except:
-                # cannot parse json, just raise existing error
-                raise e
-            else:
-                # response parsed, try to raise error from TMDB
-                handle_status(data, url)
-            # no error from TMDB, just raise existing error
-            raise e
-        handle_status(data, url)
+            self._decode_error(e)
+
+    def _validators(self, resp):
+        # record the validators and freshness lifetime from the response
+        self.meta = {}
+        if resp.headers.get('ETag'):
+            self.meta['etag'] = resp.headers['ETag']
+        if resp.headers.get('Last-Modified'):
+            self.meta['modified'] = resp.headers['Last-Modified']
+        for directive in resp.headers.get('Cache-Control', '').split(','):
+            name, _, value = directive.strip().partition('=')
+            name = name.lower()
+            if name == 'max-age':
+                try:
+                    self.meta['maxage'] = int(value.strip('"'))
+                except ValueError:
+                    pass
+            elif name in ('no-store', 'private'):
+                # the cache may be shared between users, so private
+                # responses are not kept either
+                self.meta['nostore'] = True
+
+    def _decode(self, resp):
+        self._validators(resp)
+        if resp.status == 304:
+            return NOT_MODIFIED
+        data = json.loads(resp.read().decode('utf-8'))
+        handle_status(data, self.get_full_url())
         if DEBUG:
             import pprint
             pprint.PrettyPrinter().pprint(data)
         return data
 
+    def _decode_error(self, e):
+        try:
+            # try to load whatever was returned
+            data = json.loads(e.response)
+        except:
+            # cannot parse json, just raise existing error
+            raise e
+        else:
+            # response parsed, try to raise error from TMDB
+            handle_status(data, self.get_full_url())
+        # no error from TMDB, just raise existing error
+        raise e
+
+
+class AsyncRequest(Request):
+    """
+    Request variant whose open(), read() and readJSON() are coroutines,
+    performing the query over asyncio streams so as not to block a
+    running event loop. Results are stored in, and rate limited by, the
+    same cache as synchronous requests.
+    """
+    @classmethod
+    def fromRequest(cls, req):
+        """Create an asynchronous copy of an existing Request."""
+        obj = cls(req._url, **req._kwargs)
+        obj.lifetime = req.lifetime
+        if req.data is not None:
+            obj.data = req.data
+            obj.headers.update(req.headers)
+        return obj
+
+    async def open(self):
+        """Open a file object to the specified URL."""
+        attempt = 0
+        while True:
+            self._allow()
+            try:
+                resp = await self._send()
+            except _network_errors as e:
+                delay = self._retry(attempt, error=e)
+            except BaseException:
+                # including cancellation, see open() of Request
+                breaker.release()
+                raise
+            else:
+                delay = self._retry(attempt, resp=resp)
+                if delay is None:
+                    return self._response(resp)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def _send(self):
+        url = self.get_full_url()
+        method, data = self.get_method(), self.data
+        headers = dict(self.header_items())
+        for i in range(self._maxredirects+1):
+            self._debug(url, data)
+            # wait to ensure proper rate limiting, without blocking
+            delay = limiter.reserve()
+            await asyncio.sleep(delay)
+            limiter.record(delay)
+            resp = await transport.aurlopen(method, url, data, headers,
+                                            self.timeout)
+            limiter.update(resp.status, resp.headers)
+            redirect = self._redirect(resp, method, data, headers)
+            if redirect is None:
+                return resp
+            url, method, data = redirect
+        raise self._too_many(resp)
+
+    async def read(self):
+        """Return result from specified URL as a string."""
+        return (await self.open()).read().decode('utf-8')
+
+    async def readJSON(self):
+        """Parse result from specified URL as JSON data."""
+        if self.lifetime == 0:
+            # lifetime of zero means never cache
+            return await self._readJSON()
+        key = self.cachekey()
+
+        async def query():
+            return await cache.afetch(key, self._readJSON, self.lifetime, self)
+
+        data = cache.get(key, refresh=query)
+        if data is None:
+            try:
+                data = await query()
+            except (TMDBOffline, TMDBHTTPError) as e:
+                return cache.fallback(key, e)
+        return data
+
+    async def _readJSON(self):
+        try:
+            # catch HTTP error from open()
+            return self._decode(await self.open())
+        except TMDBHTTPError as e:
+            self._decode_error(e)
+
 status_handlers = {
     1: None,
     2: TMDBRequestInvalid('Invalid service - This service does not exist.'),
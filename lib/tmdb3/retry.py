@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#-----------------------
+# Name: retry.py
+# Python Library
+# Author: Raymond Wagner
+# Purpose: Retry policy with exponential backoff, and a circuit breaker to
+#          fail fast while the TMDb API is unavailable
+#-----------------------
+
+from email.utils import parsedate_to_datetime
+import threading
+import random
+import time
+
+
+class RetryPolicy(object):
+    """
+    Decides which failed requests are retried, and how long to wait
+    before each attempt. Delays grow exponentially from `backoff` seconds
+    up to `maxbackoff`, with full jitter so that many clients failing at
+    once do not retry in lockstep. A Retry-After header from the server
+    takes precedence when it asks for a longer wait.
+    """
+    def __init__(self, retries=3, backoff=0.5, maxbackoff=30,
+                       statuses=(429, 500, 502, 503, 504)):
+        self.retries = retries
+        self.backoff = backoff
+        self.maxbackoff = maxbackoff
+        self.statuses = statuses
+
+    def retryable(self, status):
+        return status in self.statuses
+
+    def delay(self, attempt, retryafter=None):
+        delay = random.uniform(0, min(self.maxbackoff,
+                                      self.backoff * 2**attempt))
+        if retryafter:
+            try:
+                wait = float(retryafter)
+            except ValueError:
+                try:
+                    wait = parsedate_to_datetime(retryafter).timestamp() \
+                                - time.time()
+                except (TypeError, ValueError):
+                    wait = 0
+            delay = max(delay, min(wait, self.maxbackoff))
+        return delay
+
+
+class CircuitBreaker(object):
+    """
+    Tracks the health of the API. After `threshold` consecutive failures
+    the circuit opens, and requests are refused outright for `reset`
+    seconds. The first request after that is let through as a trial,
+    closing the circuit again on success, or re-opening it on failure.
+    A trial ending without either, such as by being cancelled, is given
+    up with release(), and one left unresolved for `reset` seconds is
+    replaced by another.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALFOPEN = 'half-open'
+
+    def __init__(self, threshold=5, reset=30):
+        self._lock = threading.Lock()
+        self.threshold = threshold
+        self.reset = reset
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened = 0
+        self.trial = 0
+        self.trips = 0
+
+    def allow(self):
+        """Return whether a request may be attempted."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if time.time() >= self.retryat:
+                # allow this single request through as a trial
+                self.state = self.HALFOPEN
+                self.trial = time.time()
+                return True
+            return False
+
+    @property
+    def retryat(self):
+        # time after which the next trial request is allowed
+        if self.state == self.HALFOPEN:
+            return self.trial + self.reset
+        return self.opened + self.reset
+
+    def success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def release(self):
+        """Give up a trial without an outcome, letting the next request in."""
+        with self._lock:
+            if self.state == self.HALFOPEN:
+                self.state = self.OPEN
+                self.opened = time.time() - self.reset
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if (self.state == self.HALFOPEN) or \
+                    (self.failures >= self.threshold):
+                if self.state != self.OPEN:
+                    self.trips += 1
+                self.state = self.OPEN
+                self.opened = time.time()
+
+    def stats(self):
+        with self._lock:
+            return {'state': self.state,
+                    'failures': self.failures,
+                    'trips': self.trips}
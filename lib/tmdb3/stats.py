@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#-----------------------
+# Name: stats.py
+# Python Library
+# Author: Raymond Wagner
+# Purpose: Counters and latency histograms, read as snapshot dicts for
+#          export to monitoring
+#-----------------------
+
+from bisect import bisect_left
+import threading
+
+
+class Histogram(object):
+    """
+    Distribution of durations in seconds, counted into buckets with fixed
+    upper bounds, from 10 microseconds to 10 seconds.
+    """
+    bounds = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005,
+              0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+              0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.counts = [0]*(len(self.bounds)+1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q):
+        """Return the upper bound of the bucket holding the given quantile."""
+        if not self.count:
+            return 0.0
+        rank = q*self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self):
+        """
+        Return the distribution, with cumulative counts of values at or
+        below each bound, as used by Prometheus style monitoring.
+        """
+        buckets = []
+        seen = 0
+        for bound, count in zip(self.bounds + (float('inf'),), self.counts):
+            seen += count
+            buckets.append((bound, seen))
+        return {'count': self.count,
+                'sum': self.total,
+                'max': self.max,
+                'p50': self.quantile(0.5),
+                'p90': self.quantile(0.9),
+                'p99': self.quantile(0.99),
+                'buckets': buckets}
+
+
+class Stats(object):
+    """
+    Thread-safe set of named counters, which may be counts or totals of
+    seconds, and named histograms.
+    """
+    def __init__(self, counters=(), histograms=()):
+        self._lock = threading.Lock()
+        self._names = tuple(counters)
+        self._counters = {}
+        self._histograms = dict((name, Histogram()) for name in histograms)
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._counters = dict.fromkeys(self._names, 0)
+            for histogram in self._histograms.values():
+                histogram.reset()
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name, value):
+        with self._lock:
+            self._histograms[name].observe(value)
+
+    def __getitem__(self, name):
+        return self._counters[name]
+
+    def snapshot(self):
+        """Return the counters, and a snapshot of each histogram."""
+        with self._lock:
+            stats = dict(self._counters)
+            for name, histogram in self._histograms.items():
+                stats[name] = histogram.snapshot()
+        return stats
@@ -22,7 +22,7 @@ for search and retrieval of text metadata and image URLs from TMDB.
 Preliminary API specifications can be found at
 http://help.themoviedb.org/kb/api/about-3"""
 
-__version__ = "v0.7.2"
+__version__ = "v0.8.23"
 # 0.1.0  Initial development
 # 0.2.0  Add caching mechanism for API queries
 # 0.2.1  Temporary work around for broken search paging
@@ -66,8 +66,38 @@ __version__ = "v0.7.2"
 # 0.7.2  Add similar and keywords to TV Series
 #        Fix unicode issues with search result object names
 #        Temporary fix for youtube videos with malformed URLs
-
-from .request import set_key, Request
+# 0.7.3  Reuse persistent HTTP connections through a connection pool
+# 0.8.0  Add asyncio support, with AsyncRequest, Element.populate(), and
+#           asynchronous iteration of search results
+# 0.8.1  Merge Element sub-resource queries using append_to_response
+# 0.8.2  Move rate limiter out of cache engine, into a token bucket shared
+#           between processes and adjusted by TMDb rate limit headers
+# 0.8.3  Add request timeouts, retries with backoff, and a circuit breaker
+#           serving expired cache data while TMDb is unavailable
+# 0.8.4  Coalesce concurrent queries for the same uncached data
+#        Fix file cache records being read back with the wrong size
+# 0.8.5  Revalidate expired cache data with ETag and Last-Modified
+# 0.8.6  Cache under canonical keys, independent of API key and argument
+#           order, migrating entries stored under request URLs
+# 0.8.7  Add pluggable transports, with urllib, pooled, and record/replay
+# 0.8.8  Add bounded in-memory LRU cache engine
+# 0.8.9  Add SQLite cache engine
+# 0.8.10 Add per-key engine lookups, and Cache.prefetch() for batched reads
+# 0.8.11 Track cache expiry in a heap, rather than scanning every record
+# 0.8.12 Skip reading the cache engine on a miss when nothing has changed
+# 0.8.13 Hold a bounded in-memory tier in front of the cache engine
+# 0.8.14 Serve recently expired data while it is refreshed in the background
+# 0.8.15 Add serialization and compression codecs for file and SQLite caches
+# 0.8.16 Add cache and engine statistics, with latency histograms
+# 0.8.17 Set cache lifetimes from a table of API path patterns
+# 0.8.18 Tag cached data by entity, and add expire() and invalidate()
+# 0.8.19 Index file cache slots by key hash, to read records individually
+# 0.8.20 Add sharded file cache engine, spreading keys over several files
+# 0.8.21 Add log cache engine, with lock-free readers of snapshot and log
+# 0.8.22 Compact the file cache online, in bounded steps
+# 0.8.23 Hold the file cache to a disk budget, evicting by LRU or LFU
+
+from .request import set_key, invalidate, Request
 from .util import Datapoint, Datalist, Datadict, Element, NameRepr, SearchRepr
 from .pager import PagedRequest
 from .locales import get_locale, set_locale
@@ -503,7 +533,6 @@ class Movie(Element):
     @classmethod
     def latest(cls):
         req = Request('latest/movie')
-        req.lifetime = 600
         return cls(raw=req.readJSON())
 
     @classmethod
@@ -663,6 +692,10 @@ class Movie(Element):
     translations = Datalist('translations', handler=Translation,
                             poller=_populate_translations)
 
+    def _invalidate_account(self):
+        # drop cached lists of the account, which now include this change
+        invalidate('account:{0}'.format(Account(session=self._session).id))
+
     def setFavorite(self, value):
         req = Request('account/{0}/favorite'.format(
                         Account(session=self._session).id),
@@ -671,6 +704,7 @@ class Movie(Element):
                       'favorite': str(bool(value)).lower()})
         req.lifetime = 0
         req.readJSON()
+        self._invalidate_account()
 
     def setRating(self, value):
         if not (0 <= value <= 10):
@@ -680,6 +714,7 @@ class Movie(Element):
         req.lifetime = 0
         req.add_data({'value':value})
         req.readJSON()
+        self._invalidate_account()
 
     def setWatchlist(self, value):
         req = Request('account/{0}/movie_watchlist'.format(
@@ -689,6 +724,7 @@ class Movie(Element):
         req.add_data({'movie_id': self.id,
                       'movie_watchlist': str(bool(value)).lower()})
         req.readJSON()
+        self._invalidate_account()
 
     def getSimilar(self):
         return self.similar
@@ -24,6 +24,7 @@ class TMDBError(Exception):
     HTTPError = 90
     Offline = 100
     LocaleError = 110
+    TransportError = 120
 
     def __init__(self, msg=None, errno=0):
         self.errno = errno
@@ -105,3 +106,7 @@ class TMDBOffline(TMDBError):
 
 class TMDBLocaleError(TMDBError):
     pass
+
+
+class TMDBTransportError(TMDBRequestError):
+    pass
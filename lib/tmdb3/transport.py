@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+#-----------------------
+# Name: transport.py
+# Python Library
+# Author: Raymond Wagner
+# Purpose: Pluggable transports used by Request to perform HTTP exchanges,
+#          including a record/replay transport for running offline
+#-----------------------
+
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+import urllib.request, urllib.error
+import http.client
+import threading
+import asyncio
+import random
+import base64
+import json
+import time
+import os
+
+from .tmdb_exceptions import *
+from .http_pool import ConnectionPool, BufferedResponse
+from .cache_file import parse_filename
+from . import async_http
+
+DEBUG = False
+
+# connection pool used by the pooled transport unless given another
+shared_pool = ConnectionPool()
+
+# credentials kept out of cassettes, which are meant to be shared as test
+# fixtures. they are dropped from the requests matched on, and replaced in
+# recorded responses, such as that creating a session
+_scrubbed = ('api_key', 'session_id', 'guest_session_id', 'request_token',
+             'password', 'username')
+_placeholder = 'scrubbed'
+
+
+class Transports(object):
+    """
+    Static collector for transports to register against.
+    """
+    def __init__(self):
+        self._transports = {}
+
+    def register(self, transport):
+        self._transports[transport.__name__] = transport
+        self._transports[transport.name] = transport
+
+    def __getitem__(self, key):
+        return self._transports[key]
+
+    def __contains__(self, key):
+        return self._transports.__contains__(key)
+
+Transports = Transports()
+
+
+class TransportType(type):
+    """
+    Transport Metaclass that registers new transports for named selection
+    and use.
+    """
+    def __init__(cls, name, bases, attrs):
+        super(TransportType, cls).__init__(name, bases, attrs)
+        if name != 'Transport':
+            # skip base class
+            Transports.register(cls)
+
+
+class Transport(object, metaclass=TransportType):
+    """
+    Base transport class. A transport performs a single HTTP exchange,
+    returning a fully read BufferedResponse regardless of its status.
+    Redirects, retries and rate limiting are left to the Request.
+    """
+    name = 'unspecified'
+
+    def configure(self):
+        pass
+
+    def urlopen(self, method, url, body=None, headers=None, timeout=None):
+        raise RuntimeError
+
+    async def aurlopen(self, method, url, body=None, headers=None,
+                             timeout=None):
+        """
+        Awaitable counterpart to urlopen(). By default, the blocking
+        call is run in the event loop's executor.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None,
+                        lambda: self.urlopen(method, url, body,
+                                             headers, timeout))
+
+
+class UrllibTransport(Transport):
+    """Transport opening a new connection per request through urllib."""
+    name = 'urllib'
+
+    def urlopen(self, method, url, body=None, headers=None, timeout=None):
+        req = urllib.request.Request(url, body, dict(headers or {}),
+                                     method=method)
+        try:
+            if timeout is None:
+                resp = urllib.request.urlopen(req)
+            else:
+                resp = urllib.request.urlopen(req, timeout=timeout)
+        except urllib.error.HTTPError as e:
+            # error statuses are returned, to be handled by the Request
+            resp = e
+        try:
+            return BufferedResponse(resp.geturl(), resp.code, resp.reason,
+                                    resp.headers, resp.read())
+        finally:
+            resp.close()
+
+
+class PooledTransport(Transport):
+    """
+    Transport reusing persistent connections from a ConnectionPool, and
+    asyncio streams for asynchronous requests.
+    """
+    name = 'pooled'
+
+    def __init__(self):
+        self.configure()
+
+    def configure(self, pool=None):
+        self.pool = pool if pool is not None else shared_pool
+
+    def urlopen(self, method, url, body=None, headers=None, timeout=None):
+        return self.pool.urlopen(method, url, body, headers, timeout)
+
+    async def aurlopen(self, method, url, body=None, headers=None,
+                             timeout=None):
+        return await async_http.urlopen(method, url, body, headers, timeout)
+
+
+class ReplayTransport(Transport):
+    """
+    Transport playing back responses from a cassette file, without any
+    network access. In record mode, requests are passed through to another
+    transport, and their responses captured to the cassette.
+
+    Interactions are matched on method, URL, and request body, leaving
+    out the API key and other credentials, which are not recorded. Where one was recorded several times, the recordings
+    are played back in turn, repeating the last. Each response is delayed
+    by `latency` seconds, or by a random time within a (min, max) range,
+    to stand in for the round trip to the server.
+    """
+    name = 'replay'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.configure(None)
+
+    def configure(self, filename, record=False, latency=0, transport=None):
+        self.filename = parse_filename(filename) if filename else None
+        self.record = record
+        self.latency = latency
+        if record and (transport is None):
+            transport = PooledTransport()
+        self.transport = transport
+        self._tapes = {}
+        self._played = {}
+        if self.filename and os.path.exists(self.filename):
+            self.load()
+
+    @staticmethod
+    def _match(method, url, body):
+        # match independent of credentials, and of argument order
+        parts = urlsplit(url)
+        query = sorted((k, v) for k, v in parse_qsl(parts.query, True)
+                                  if k not in _scrubbed)
+        match = '{0} {1}'.format(method,
+                        urlunsplit(('', '', parts.path, urlencode(query), '')))
+        if body:
+            body = body.decode('utf-8')
+            form = parse_qsl(body, True)
+            if form and (urlencode(form) == body):
+                # a form, as sent by Request
+                body = urlencode([(k, v) for k, v in form
+                                         if k not in _scrubbed])
+            if body:
+                match += ' ' + body
+        return match
+
+    @classmethod
+    def _rematch(cls, match):
+        # match a request recorded by an earlier release, which may still
+        # hold credentials
+        method, _, rest = match.partition(' ')
+        url, _, body = rest.partition(' ')
+        return cls._match(method, url, body.encode('utf-8'))
+
+    @staticmethod
+    def _scrub(body):
+        # replace credentials in a JSON response
+        try:
+            data = json.loads(body)
+        except ValueError:
+            return body
+        if not isinstance(data, dict) or \
+                not any(k in data for k in _scrubbed):
+            return body
+        for k in _scrubbed:
+            if k in data:
+                data[k] = _placeholder
+        return json.dumps(data)
+
+    def load(self):
+        with open(self.filename) as fd:
+            interactions = json.load(fd)
+        with self._lock:
+            self._tapes = {}
+            self._played = {}
+            for item in interactions:
+                item['request'] = self._rematch(item['request'])
+                self._tapes.setdefault(item['request'], []).append(item)
+
+    def save(self):
+        with self._lock:
+            interactions = [item for key in sorted(self._tapes)
+                                 for item in self._tapes[key]]
+        tmpfile = self.filename+'.tmp'
+        with open(tmpfile, 'w') as fd:
+            json.dump(interactions, fd, indent=1, sort_keys=True)
+        os.replace(tmpfile, self.filename)
+
+    def _delay(self):
+        if isinstance(self.latency, (tuple, list)):
+            return random.uniform(*self.latency)
+        return self.latency
+
+    def _capture(self, match, resp):
+        body = resp.read()
+        item = {'request': match,
+                'status': resp.status,
+                'reason': resp.reason,
+                'headers': [[k, v] for k, v in resp.headers.items()]}
+        try:
+            item['body'] = self._scrub(body.decode('utf-8'))
+        except UnicodeDecodeError:
+            item['body'] = base64.b64encode(body).decode('ascii')
+            item['base64'] = True
+        with self._lock:
+            self._tapes.setdefault(match, []).append(item)
+        if self.filename:
+            self.save()
+        return BufferedResponse(resp.url, resp.status, resp.reason,
+                                resp.headers, body)
+
+    def _play(self, match, url):
+        with self._lock:
+            tape = self._tapes.get(match)
+            if not tape:
+                raise TMDBTransportError(
+                        'No recorded response for {0}'.format(match))
+            index = self._played.get(match, 0)
+            self._played[match] = index + 1
+            item = tape[min(index, len(tape)-1)]
+        if DEBUG:
+            print('replaying {0}'.format(match))
+        headers = http.client.HTTPMessage()
+        for k, v in item['headers']:
+            headers[k] = v
+        body = item['body']
+        if item.get('base64'):
+            body = base64.b64decode(body)
+        else:
+            body = body.encode('utf-8')
+        return BufferedResponse(url, item['status'], item['reason'],
+                                headers, body)
+
+    def urlopen(self, method, url, body=None, headers=None, timeout=None):
+        match = self._match(method, url, body)
+        if self.record:
+            return self._capture(match,
+                    self.transport.urlopen(method, url, body, headers, timeout))
+        time.sleep(self._delay())
+        return self._play(match, url)
+
+    async def aurlopen(self, method, url, body=None, headers=None,
+                             timeout=None):
+        match = self._match(method, url, body)
+        if self.record:
+            return self._capture(match,
+                    await self.transport.aurlopen(method, url, body,
+                                                  headers, timeout))
+        await asyncio.sleep(self._delay())
+        return self._play(match, url)
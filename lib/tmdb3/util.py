@@ -9,6 +9,9 @@
 from copy import copy
 from .locales import get_locale
 from .tmdb_auth import get_session
+from .request import AsyncRequest, cache
+
+import asyncio
 
 
 class NameRepr(object):
@@ -62,6 +65,11 @@ class Poller(object):
         # retrieve data from callable function, and apply
         if not callable(self.func):
             raise RuntimeError('Poller object called without a source function')
+        merged = self.coalesce()
+        if merged is not None:
+            req, group = merged
+            self.applygroup(req.readJSON(), group)
+            return
         req = self.func()
         if ('language' in req._kwargs) or ('country' in req._kwargs) \
                 and self.inst._locale.fallthrough:
@@ -79,6 +87,96 @@ class Poller(object):
             # take care of the duplicate query
         self.apply(req.readJSON())
 
+    async def poll(self):
+        """
+        Awaitable counterpart to calling the poller, retrieving data from
+        the callable function over an AsyncRequest.
+        """
+        if not callable(self.func):
+            raise RuntimeError('Poller object polled without a source function')
+        merged = self.coalesce()
+        if merged is not None:
+            req, group = merged
+            req = AsyncRequest.fromRequest(req)
+            self.applygroup(await req.readJSON(), group)
+            return
+        req = AsyncRequest.fromRequest(self.func())
+        if ('language' in req._kwargs) or ('country' in req._kwargs) \
+                and self.inst._locale.fallthrough:
+            # see __call__ for the handling of locale fall through
+            if not self.apply(await req.readJSON(), False):
+                return
+            self.apply(await req.new(language=None, country=None).readJSON())
+        self.apply(await req.readJSON())
+
+    def coalesce(self):
+        """
+        Merge this poller with every other unfilled poller of the Element
+        that requests a sub-resource of its primary `_populate` request,
+        such as 'movie/{id}/casts' of 'movie/{id}', into a single request
+        using the API's `append_to_response` argument.
+
+        Returns the merged request, along with a list of (sub-resource,
+        poller) pairs to split the response across, where a sub-resource
+        of None is the primary request itself. Returns None if merging is
+        disabled, or nothing is gained by it.
+
+        Sub-resources are only merged where all of their arguments are
+        shared by the primary request, and never when locale fall through
+        is enabled, as that requires multiple passes. Requests that can
+        already be answered from the cache are left out.
+        """
+        inst = self.inst
+        if (not inst._coalesce) or inst._locale.fallthrough \
+                or ('_populate' not in inst._Pollers):
+            return None
+        main = inst._populate
+        base = main.func()
+        prefix = base._url + '/'
+
+        group = []
+        reqs = {'_populate': base}
+        for name in inst._Pollers:
+            if name == '_populate':
+                continue
+            poller = getattr(inst, name)
+            if poller.filled and (name != self.__name__):
+                continue
+            req = poller.func()
+            sub = req._url[len(prefix):]
+            if (not req._url.startswith(prefix)) or ('/' in sub):
+                continue
+            if any([base._kwargs.get(k) != v for k, v in req._kwargs.items()]):
+                continue
+            group.append((sub, poller))
+            reqs[name] = req
+
+        if (self.__name__ == '_populate') or not main.filled:
+            group.insert(0, (None, main))
+        cached = cache.prefetch([reqs[p.__name__].cachekey()
+                                        for s, p in group])
+        group = [(s, p) for s, p in group
+                        if reqs[p.__name__].cachekey() not in cached]
+        if (len(group) < 2) or \
+                (self.__name__ not in [p.__name__ for s, p in group]):
+            return None
+        req = base.new(append_to_response=','.join(
+                            [s for s, p in group if s is not None]))
+        return req, group
+
+    def applygroup(self, data, group):
+        # split the response of a merged request across its pollers
+        for sub, poller in group:
+            if sub is None:
+                poller.apply(data)
+            else:
+                poller.apply(data.get(sub) or {})
+
+    @property
+    def filled(self):
+        # all data points populated by this poller have been set
+        return all(k in self.inst._data for k in self.lookup)
+
     def apply(self, data, set_nones=True):
         # apply data directly, bypassing callable function
         unfilled = False
@@ -362,6 +460,9 @@ class ElementType( type ):
         # build sorted list of arguments used for intialization
         attrs['_InitArgs'] = tuple(
                 [a.name for a in sorted(initargs, key=lambda x: x.initarg)])
+        # as well as list of pollers able to fetch data from the API
+        attrs['_Pollers'] = tuple(
+                [k for k, v in pollermap.items() if v and pollers[k]])
         return type.__new__(mcs, name, bases, attrs)
 
     def __call__(cls, *args, **kwargs):
@@ -399,3 +500,21 @@ class ElementType( type ):
 
 class Element( object, metaclass=ElementType ):
     _lang = 'en'
+    # merge sub-resource pollers into a single request where possible
+    _coalesce = True
+
+    async def populate(self, *pollers):
+        """
+        Awaitable population of Element data. Polls each named poller, or
+        if none are given, every poller with data not yet populated.
+        The first poll may be merged with others into a single request,
+        after which any pollers remaining unfilled are polled
+        concurrently.
+        """
+        if not pollers:
+            pollers = [k for k in self._Pollers if not getattr(self, k).filled]
+        pollers = [getattr(self, k) for k in pollers]
+        if pollers:
+            await pollers[0].poll()
+        await asyncio.gather(*[p.poll() for p in pollers[1:] if not p.filled])
+        return self